@@ -0,0 +1,1861 @@
+"""Бенчмарки подсистем бота на локальных заглушках, без выхода в интернет.
+
+Запуск: python benchmarks.py <имя> [параметры]
+        python benchmarks.py --list
+"""
+import argparse
+import asyncio
+import heapq
+import importlib
+import json
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import websockets
+
+# База и файлы бота - во временной папке, даже если в окружении заданы рабочие пути
+BENCH_DIR = tempfile.mkdtemp(prefix='cryptobot-bench-')
+os.environ['DB_PATH'] = os.path.join(BENCH_DIR, 'bench.db')
+os.environ['LINK_FILTER_PATH'] = os.path.join(BENCH_DIR, 'bench.db.links.npz')
+os.environ['MARKET_HISTORY_DIR'] = os.path.join(BENCH_DIR, 'market')
+os.environ['ARCHIVE_DIR'] = os.path.join(BENCH_DIR, 'archive')
+
+bot = importlib.import_module('deepseek_python_20251121_342097')
+
+BENCHMARKS = {}
+
+def benchmark(name):
+    """Регистрирует функцию бенчмарка под именем name"""
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+# ==================== STUB SERVERS ====================
+
+class StubServer:
+    """Локальный HTTP-сервер в фоновом потоке; handler(request) -> (status, headers, body)"""
+
+    def __init__(self, handler):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Заголовки и тело уходят разными write: без этого Nagle и delayed ACK дают +40 мс на ответ
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                status, headers, body = handler(self)
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                stub.requests += 1
+
+            do_POST = do_GET
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            # По умолчанию backlog 5: параллельные подключения ловят повтор SYN через секунду
+            request_queue_size = 128
+
+        self.requests = 0
+        self.httpd = Server(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.httpd.server_address[1]}'
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+# Словарь для синтетических заголовков: крипто-термины и нейтральные слова
+CRYPTO_WORDS = ('bitcoin', 'ethereum', 'defi', 'jasmy', 'nft', 'etf', 'staking', 'airdrop', 'solana',
+                'btc', 'eth', 'xrp', 'binance', 'coinbase', 'stablecoin', 'halving', 'whale', 'exchange')
+SYLLABLES = ('mar', 'pri', 'tra', 'inv', 'reg', 'fun', 'net', 'ban', 'dat', 'pol', 'ket', 'ces',
+             'der', 'est', 'ula', 'din', 'wor', 'kin', 'bas', 'icy')
+PLAIN_WORDS = tuple(a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES[:10])
+
+def story_text(seed, words=12):
+    """Детерминированный заголовок истории по её номеру"""
+    rng = random.Random(str(seed))
+    return ' '.join(rng.choice(CRYPTO_WORDS if rng.random() < 0.3 else PLAIN_WORDS) for _ in range(words))
+
+def make_rss(feed_id, items=20, summary_size=400, start=0, shared=0.0):
+    """Синтетическая RSS-лента в формате, похожем на cointelegraph.
+    
+    shared - доля записей, пересказывающих общую для всех лент историю (почти-дубликаты).
+    """
+    parts = [f'<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel>'
+             f'<title>Feed {feed_id}</title><link>http://feed/{feed_id}</link>']
+    now = int(time.time())
+    for i in range(start, start + items):
+        rng = random.Random(feed_id * 1_000_003 + i)
+        if rng.random() < shared:
+            title = story_text(i) + f' says {feed_id}'
+        else:
+            title = story_text((feed_id, i))
+        summary = '<p>' + ' '.join(story_text((feed_id, i, k), 10) for k in range(summary_size // 70)) + '.</p>'
+        published = time.strftime('%a, %d %b %Y %H:%M:%S +0000', time.gmtime(now - i * 600))
+        parts.append(f'<item><title>{title}</title>'
+                     f'<link>http://feed/{feed_id}/item/{i}</link>'
+                     f'<guid>http://feed/{feed_id}/item/{i}</guid>'
+                     f'<pubDate>{published}</pubDate>'
+                     f'<description><![CDATA[{summary}]]></description></item>')
+    parts.append('</channel></rss>')
+    return ''.join(parts).encode()
+
+def feed_server(feeds, items=20, latency=0.0, shared=0.0):
+    """Сервер с feeds лентами по адресам /feed/<n> и задержкой ответа latency"""
+    bodies = [make_rss(i, items, shared=shared) for i in range(feeds)]
+
+    def handler(request):
+        time.sleep(latency)
+        feed_id = int(request.path.rsplit('/', 1)[-1])
+        return 200, {'Content-Type': 'application/rss+xml'}, bodies[feed_id]
+
+    server = StubServer(handler)
+    urls = [f'{server.url}/feed/{i}' for i in range(feeds)]
+    return server, urls
+
+def report(title, rows):
+    """Печатает таблицу результатов"""
+    print(f"\n{title}")
+    width = max(len(name) for name, _ in rows)
+    for name, value in rows:
+        print(f"  {name:<{width}}  {value}")
+
+# ==================== BENCHMARKS ====================
+
+@benchmark('feeds')
+def bench_feeds(argv):
+    """Последовательный feedparser.parse(url) против параллельной загрузки fetch_feeds"""
+    parser = argparse.ArgumentParser(prog='feeds')
+    parser.add_argument('--feeds', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.3)
+    parser.add_argument('--items', type=int, default=30)
+    args = parser.parse_args(argv)
+
+    # Сравниваем именно загрузку, кэш лент отключаем
+    bot.FEED_CACHE_TTL = 0
+    server, urls = feed_server(args.feeds, args.items, args.latency)
+    try:
+        # Прогрев: импорт парсеров, создание SSL-контекста клиента
+        bot.feedparser.parse(urls[0])
+        asyncio.run(bot.fetch_feeds(urls[:1]))
+        bot.SOURCE_STATE.clear()
+
+        started = time.perf_counter()
+        serial = [bot.feedparser.parse(url) for url in urls]
+        serial_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        concurrent = asyncio.run(bot.fetch_feeds(urls))
+        concurrent_time = time.perf_counter() - started
+    finally:
+        server.close()
+
+    assert sum(len(f.entries) for f in serial) == sum(len(entries) for entries in concurrent.values() if entries)
+    report(f"{args.feeds} лент x {args.items} записей, задержка {args.latency}с", [
+        ('serial feedparser', f'{serial_time:.2f}s'),
+        ('fetch_feeds', f'{concurrent_time:.2f}s'),
+        ('speedup', f'{serial_time / concurrent_time:.1f}x'),
+    ])
+
+@benchmark('translate')
+def bench_translate(argv):
+    """Перевод по одному заголовку против пачек с кэшем (локальный фейковый бэкенд)"""
+    parser = argparse.ArgumentParser(prog='translate')
+    parser.add_argument('--titles', type=int, default=1000)
+    parser.add_argument('--unique', type=int, default=500)
+    parser.add_argument('--batch', type=int, default=20, help='заголовков за цикл ингестии')
+    parser.add_argument('--latency', type=float, default=0.02, help='задержка бэкенда на запрос')
+    args = parser.parse_args(argv)
+
+    # Заголовки повторяются как в жизни: одни и те же новости в разных лентах
+    rng = random.Random(1)
+    titles = [f"Bitcoin headline number {int(rng.paretovariate(1.2)) % args.unique}" for _ in range(args.titles)]
+    batches = [titles[i:i + args.batch] for i in range(0, len(titles), args.batch)]
+
+    async def serial():
+        backend = bot.FakeTranslateBackend(args.latency)
+        for title in titles:
+            await backend.translate_batch([title], 'ru')
+        return backend.requests
+
+    async def cached():
+        backend = bot.FakeTranslateBackend(args.latency)
+        translator = bot.Translator(backend)
+        for batch in batches:
+            await translator.translate_many(batch, 'ru')
+        return backend.requests, translator
+
+    started = time.perf_counter()
+    serial_requests = asyncio.run(serial())
+    serial_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    cached_requests, translator = asyncio.run(cached())
+    cached_time = time.perf_counter() - started
+
+    report(f"{args.titles} заголовков ({args.unique} уникальных), задержка бэкенда {args.latency}с", [
+        ('serial', f'{serial_time:.2f}s, {serial_requests} запросов, {args.titles / serial_time:.0f} заголовков/с'),
+        ('Translator', f'{cached_time:.2f}s, {cached_requests} запросов, {args.titles / cached_time:.0f} заголовков/с'),
+        ('cache hit rate', f'{translator.hit_rate():.1%}'),
+    ])
+
+@benchmark('db')
+def bench_db(argv):
+    """connect-per-call против Database (WAL, писатель + пул читателей) на смешанной нагрузке"""
+    parser = argparse.ArgumentParser(prog='db')
+    parser.add_argument('--ops', type=int, default=5000, help='операций на поток')
+    parser.add_argument('--threads', type=int, default=2, help='параллельных потоков (постер + бот команд)')
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    def workload(thread_id):
+        rng = random.Random(thread_id)
+        for i in range(args.ops):
+            link = f'http://bench/{thread_id}/{rng.randrange(args.ops)}'
+            yield rng.random() < args.write_ratio, link
+
+    def run(make_ops):
+        errors = []
+
+        def worker(thread_id):
+            read, write = make_ops()
+            for is_write, link in workload(thread_id):
+                try:
+                    if is_write:
+                        write(link)
+                    else:
+                        read(link)
+                except sqlite3.OperationalError as e:
+                    errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return args.ops * args.threads / (time.perf_counter() - started), len(errors)
+
+    insert = "INSERT OR IGNORE INTO news (title, link, summary, source) VALUES ('t', ?, 's', 'bench')"
+    select = "SELECT 1 FROM news WHERE link = ?"
+
+    # Старый способ: новое соединение на каждый вызов, журнал по умолчанию
+    legacy_path = os.path.join(BENCH_DIR, 'legacy.db')
+    conn = sqlite3.connect(legacy_path)
+    bot.migrate_initial_schema(conn)
+    conn.commit()
+    conn.close()
+
+    def legacy_ops():
+        def read(link):
+            conn = sqlite3.connect(legacy_path)
+            conn.execute(select, (link,)).fetchone()
+            conn.close()
+
+        def write(link):
+            conn = sqlite3.connect(legacy_path)
+            conn.execute(insert, (link,))
+            conn.commit()
+            conn.close()
+        return read, write
+
+    database = bot.Database(os.path.join(BENCH_DIR, 'layer.db'))
+    database.transaction(bot.apply_migrations)
+
+    def layer_ops():
+        return (lambda link: database.exists(select, (link,)),
+                lambda link: database.execute(insert, (link,)))
+
+    legacy_rate, legacy_errors = run(legacy_ops)
+    layer_rate, layer_errors = run(layer_ops)
+    database.close()
+
+    report(f"{args.threads} потока x {args.ops} операций, записей {args.write_ratio:.0%}", [
+        ('connect-per-call', f'{legacy_rate:,.0f} ops/s, ошибок блокировки: {legacy_errors}'),
+        ('Database', f'{layer_rate:,.0f} ops/s, ошибок блокировки: {layer_errors}'),
+        ('speedup', f'{layer_rate / legacy_rate:.1f}x'),
+    ])
+
+# Запросы до миграции 2 - для сравнения
+LEGACY_NEXT_NEWS = '''
+    SELECT * FROM news WHERE posted = FALSE
+    ORDER BY CASE content_type
+        WHEN 'breaking' THEN 1 WHEN 'warning' THEN 2 WHEN 'analysis' THEN 3 ELSE 4
+    END, added_date ASC
+    LIMIT 1
+'''
+LEGACY_DAILY_SUMMARY = [
+    "SELECT COUNT(*) FROM news WHERE date(added_date) = date('now') AND posted = TRUE",
+    "SELECT COUNT(*) FROM trend_data WHERE date(detected_date) = date('now')",
+]
+
+def seed_news(conn, rows, trends, unposted=0.01):
+    """Заполняет v1-схему: новости и тренды равномерно за последний год"""
+    rng = random.Random(5)
+    now = int(time.time())
+    types = ['regular'] * 7 + ['breaking', 'warning', 'analysis']
+    stamp = lambda ts: time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(ts))
+    conn.executemany(
+        "INSERT INTO news (title, link, summary, source, posted, added_date, content_type) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        ((f'title {i}', f'http://bench/{i}', 'summary', 'bench', int(rng.random() >= unposted),
+          stamp(now - rng.randrange(365 * 86400)), rng.choice(types)) for i in range(rows)))
+    conn.executemany(
+        "INSERT INTO trend_data (topic, score, detected_date) VALUES (?, ?, ?)",
+        ((rng.choice(['bitcoin', 'ethereum', 'defi', 'nft']), rng.randrange(3, 50),
+          stamp(now - rng.randrange(365 * 86400))) for _ in range(trends)))
+    conn.commit()
+
+def timed(func, repeat):
+    """Медиана времени вызова в миллисекундах"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return sorted(samples)[len(samples) // 2]
+
+@benchmark('schema')
+def bench_schema(argv):
+    """get_next_content() и generate_daily_summary() до и после миграции с индексами"""
+    parser = argparse.ArgumentParser(prog='schema')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--trends', type=int, default=200_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    path = os.path.join(BENCH_DIR, 'schema.db')
+    conn = sqlite3.connect(path)
+    bot.apply_migrations(conn, target=1)
+    started = time.perf_counter()
+    seed_news(conn, args.rows, args.trends)
+    seed_time = time.perf_counter() - started
+
+    def legacy_next():
+        with conn:
+            row = conn.execute(LEGACY_NEXT_NEWS).fetchone()
+            conn.execute("UPDATE news SET posted = TRUE WHERE id = ?", (row[0],))
+
+    def legacy_summary():
+        for sql in LEGACY_DAILY_SUMMARY:
+            conn.execute(sql).fetchone()
+
+    before = (timed(legacy_next, args.repeat), timed(legacy_summary, args.repeat))
+
+    started = time.perf_counter()
+    with conn:
+        bot.apply_migrations(conn)
+    migrate_time = time.perf_counter() - started
+    conn.close()
+
+    # Дальше - настоящие функции бота поверх мигрированной базы
+    bot.db = bot.Database(path)
+    bot.get_binance_data = lambda: []
+    after = (timed(bot.get_next_content, args.repeat), timed(bot.generate_daily_summary, args.repeat))
+    bot.db.close()
+
+    report(f"{args.rows:,} новостей, {args.trends:,} трендов (заполнение {seed_time:.1f}s, миграция {migrate_time:.1f}s)", [
+        ('get_next_content', f'{before[0]:.2f} ms -> {after[0]:.2f} ms'),
+        ('generate_daily_summary', f'{before[1]:.2f} ms -> {after[1]:.2f} ms'),
+    ])
+
+def naive_trend_metrics(mentions, now, engine):
+    """Те же метрики поштучными циклами Python по терминам - для сравнения"""
+    buckets = {}
+    head = now // engine.bucket_seconds
+    for term, ts in mentions:
+        age = head - ts // engine.bucket_seconds
+        if 0 <= age < engine.n_buckets:
+            buckets.setdefault(term, [0] * engine.n_buckets)[engine.n_buckets - 1 - age] += 1
+    result = {}
+    for term, counts in buckets.items():
+        windows = [sum(counts[i:i + engine.window_buckets]) / engine.velocity_hours
+                   for i in range(0, engine.n_buckets, engine.window_buckets)]
+        baseline = windows[:-1]
+        mean = sum(baseline) / len(baseline)
+        std = (sum((x - mean) ** 2 for x in baseline) / len(baseline)) ** 0.5
+        result[term] = (windows[-1], windows[-1] - windows[-2], (windows[-1] - mean) / max(std, 1.0))
+    return result
+
+@benchmark('trends')
+def bench_trends(argv):
+    """TrendEngine (NumPy) против поштучного подсчёта по терминам на синтетическом потоке"""
+    parser = argparse.ArgumentParser(prog='trends')
+    parser.add_argument('--terms', type=int, default=5000)
+    parser.add_argument('--mentions', type=int, default=1_000_000)
+    args = parser.parse_args(argv)
+
+    import numpy as np
+    rng = np.random.default_rng(7)
+    now = int(time.time())
+    # Zipf-подобная популярность терминов, время равномерно за сутки
+    term_ids = np.minimum(rng.zipf(1.3, args.mentions) - 1, args.terms - 1)
+    timestamps = now - rng.integers(0, 86400, args.mentions)
+    names = [f'term{i}' for i in range(args.terms)]
+
+    engine = bot.TrendEngine()
+    started = time.perf_counter()
+    engine.record(engine.term_ids(names)[term_ids], timestamps, now)
+    record_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    metrics = engine.metrics(now)
+    metrics_time = time.perf_counter() - started
+
+    mentions = list(zip((names[i] for i in term_ids), timestamps.tolist()))
+    started = time.perf_counter()
+    naive = naive_trend_metrics(mentions, now, engine)
+    naive_time = time.perf_counter() - started
+
+    row = engine.terms['term0']
+    assert abs(naive['term0'][2] - metrics['zscore'][row]) < 1e-3
+
+    report(f"{args.terms:,} терминов, {args.mentions:,} упоминаний за сутки", [
+        ('record', f'{record_time * 1000:.0f} ms ({args.mentions / record_time:,.0f} упоминаний/с)'),
+        ('metrics (все термины)', f'{metrics_time * 1000:.1f} ms'),
+        ('поштучный Python', f'{naive_time * 1000:.0f} ms'),
+    ])
+
+@benchmark('terms')
+def bench_terms(argv):
+    """TermMatcher против регэкспа из 5k терминов + проверок `in` (как до словаря)"""
+    parser = argparse.ArgumentParser(prog='terms')
+    parser.add_argument('--entries', type=int, default=100_000)
+    parser.add_argument('--terms', type=int, default=5000)
+    parser.add_argument('--legacy-sample', type=int, default=5000, help='регэксп медленный - меряем на выборке')
+    args = parser.parse_args(argv)
+
+    import json
+    import re
+    with open(bot.TERMS_PATH, encoding='utf-8') as f:
+        dictionary = json.load(f)
+    # Добиваем словарь синтетическими тикерами и названиями проектов
+    rng = random.Random(3)
+    syllables = ['ba', 'ko', 'zi', 'ne', 'ru', 'ta', 'mo', 'xi', 'lu', 'fe', 'qa', 'do']
+    while len(dictionary['topics']) < args.terms:
+        name = ''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4)))
+        dictionary['topics'].setdefault(f'{name} protocol', [f'{name} protocol', name + 'x'])
+    matcher = bot.TermMatcher(dictionary)
+
+    aliases = [alias.rstrip('*') for names in dictionary['topics'].values() for alias in names]
+    filler = ('the', 'market', 'price', 'rally', 'after', 'report', 'traders', 'said', 'network', 'on', 'new', 'record')
+    documents = []
+    for _ in range(args.entries):
+        words = [rng.choice(aliases) if rng.random() < 0.1 else rng.choice(filler) for _ in range(40)]
+        documents.append(' '.join(words))
+
+    # Старый подход: регэксп-альтернатива по всем терминам плюс отдельные проверки `in`
+    topic_regex = re.compile(r'\b(' + '|'.join(sorted(map(re.escape, aliases), key=len, reverse=True)) + r')\b')
+    keywords = [word.rstrip('*') for words in dictionary['content_types'].values() for word in words]
+
+    def legacy(text):
+        lower = text.lower()
+        topics = topic_regex.findall(lower)
+        content_type = any(word in lower for word in keywords)
+        tags = [tag for tag in dictionary['hashtags'] if tag in lower]
+        return topics, content_type, tags
+
+    sample = documents[:args.legacy_sample]
+    started = time.perf_counter()
+    legacy_found = sum(len(legacy(doc)[0]) for doc in sample)
+    legacy_time = (time.perf_counter() - started) * len(documents) / len(sample)
+    legacy_found = legacy_found * len(documents) // len(sample)
+
+    started = time.perf_counter()
+    found = 0
+    for doc in documents:
+        analysis = matcher.analyze(doc)
+        matcher.content_type(analysis)
+        matcher.tags(analysis)
+        found += len(analysis['topic'])
+    matcher_time = time.perf_counter() - started
+
+    report(f"{args.entries:,} документов, словарь {matcher.size:,} шаблонов", [
+        ('регэксп + in', f'~{legacy_time:.2f}s ({args.entries / legacy_time:,.0f} док/с), совпадений ~{legacy_found:,}'),
+        ('TermMatcher', f'{matcher_time:.2f}s ({args.entries / matcher_time:,.0f} док/с), совпадений {found:,}'),
+        ('speedup', f'{legacy_time / matcher_time:.1f}x'),
+    ])
+
+def percentile(samples, q):
+    """Перцентиль q (0..100) из списка значений"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+@benchmark('dedup')
+def bench_dedup(argv):
+    """StoryIndex: вставка и поиск почти-дубликатов при 100k историй в индексе"""
+    parser = argparse.ArgumentParser(prog='dedup')
+    parser.add_argument('--stories', type=int, default=100_000)
+    parser.add_argument('--queries', type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    index = bot.StoryIndex()
+    insert_ms = []
+    for i in range(args.stories):
+        text = story_text(i, 20)
+        started = time.perf_counter()
+        signature = index.signature(text)
+        if index.find(signature) is None:
+            index.add(i, signature)
+        insert_ms.append((time.perf_counter() - started) * 1000)
+
+    # Пересказ: та же история с парой заменённых и добавленных слов
+    rng = random.Random(9)
+    hits, query_ms = 0, []
+    for _ in range(args.queries):
+        story = rng.randrange(args.stories)
+        words = story_text(story, 20).split()
+        words[rng.randrange(len(words))] = rng.choice(PLAIN_WORDS)
+        text = ' '.join(words) + ' reports source'
+        started = time.perf_counter()
+        found = index.find(index.signature(text))
+        query_ms.append((time.perf_counter() - started) * 1000)
+        hits += found is not None
+
+    false_positives = sum(index.find(index.signature(story_text(('fresh', i), 20))) is not None
+                          for i in range(args.queries))
+
+    report(f"{args.stories:,} историй, {len(index.signatures):,} кластеров", [
+        ('вставка p50 / p99', f'{percentile(insert_ms, 50):.3f} / {percentile(insert_ms, 99):.3f} ms'),
+        ('поиск p50 / p99', f'{percentile(query_ms, 50):.3f} / {percentile(query_ms, 99):.3f} ms'),
+        ('найдено пересказов', f'{hits / args.queries:.1%}'),
+        ('ложных срабатываний', f'{false_positives / args.queries:.2%}'),
+    ])
+
+async def legacy_parse_news(urls):
+    """Прежний parse_news: загрузка и разбор всех лент целиком ради одной новой записи"""
+    bot.SOURCE_STATE.clear()
+    feeds = await bot.fetch_feeds(urls)
+    for url in urls:
+        for entry in (feeds.get(url) or [])[:bot.NEWS_ENTRIES_PER_SOURCE]:
+            if bot.db.exists("SELECT 1 FROM news WHERE link = ?", (entry['link'],)):
+                continue
+            title = await bot.translate_text(entry['title'])
+            bot.db.execute("INSERT INTO news (title, link, summary, source, added_ts) VALUES (?, ?, ?, ?, ?)",
+                           (title, entry['link'], bot.extract_clean_summary(entry['summary']), url, int(time.time())))
+            return True
+    return False
+
+def reset_ingest(latency):
+    """Пустая таблица новостей, индекс историй и холодный переводчик"""
+    bot.db.execute("DELETE FROM story_signatures")
+    bot.db.execute("DELETE FROM news")
+    bot.db.execute("DELETE FROM translations")
+    bot.story_index = bot.StoryIndex()
+    bot.SOURCE_STATE.clear()
+    bot.translator = bot.Translator(bot.FakeTranslateBackend(latency))
+
+@benchmark('ingest')
+def bench_ingest(argv):
+    """parse_news по одной записи за вызов против пакетной ингестии за цикл"""
+    parser = argparse.ArgumentParser(prog='ingest')
+    parser.add_argument('--feeds', type=int, default=10)
+    parser.add_argument('--items', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.05, help='задержка запроса к переводчику')
+    args = parser.parse_args(argv)
+
+    bot.FEED_CACHE_TTL = 0
+    server, urls = feed_server(args.feeds, args.items)
+    bot.NEWS_SOURCES = {f's{i}': url for i, url in enumerate(urls)}
+    try:
+        reset_ingest(args.latency)
+        calls = 1
+        started = time.perf_counter()
+        while asyncio.run(legacy_parse_news(urls)):
+            calls += 1
+        legacy_time = time.perf_counter() - started
+        legacy_rows = bot.db.count("SELECT COUNT(*) FROM news")
+
+        reset_ingest(args.latency)
+        started = time.perf_counter()
+        ingested = asyncio.run(bot.parse_news())
+        batch_time = time.perf_counter() - started
+        batch_rows = bot.db.count("SELECT COUNT(*) FROM news")
+    finally:
+        server.close()
+
+    assert legacy_rows == batch_rows, (legacy_rows, batch_rows)
+    report(f"{args.feeds} лент x {args.items} записей, перевод {args.latency}с", [
+        ('по одной: вызовов', f'{calls} ({legacy_rows} записей, {legacy_time:.2f}s)'),
+        ('пакетом: вызовов', f'1 ({ingested} историй, {batch_rows} записей, {batch_time:.2f}s)'),
+        ('по одной', f'{legacy_rows / legacy_time:,.0f} записей/с'),
+        ('пакетом', f'{batch_rows / batch_time:,.0f} записей/с'),
+        ('speedup', f'{legacy_time / batch_time:.1f}x'),
+    ])
+
+def binance_server(latency=0.0):
+    """Мок /api/v3/ticker/24hr: параметр symbol или symbols=[...] как у Binance"""
+    def ticker(symbol):
+        rng = random.Random(symbol)
+        return {'symbol': symbol, 'lastPrice': f'{rng.uniform(0.01, 60000):.4f}',
+                'priceChangePercent': f'{rng.uniform(-9, 9):.2f}'}
+
+    def handler(request):
+        time.sleep(latency)
+        query = parse_qs(urlsplit(request.path).query)
+        if 'symbols' in query:
+            body = [ticker(symbol) for symbol in json.loads(query['symbols'][0])]
+        else:
+            body = ticker(query['symbol'][0])
+        return 200, {'Content-Type': 'application/json'}, json.dumps(body).encode()
+
+    return StubServer(handler)
+
+def legacy_binance_data(base_url, symbols):
+    """Прежний get_binance_data: отдельный requests.get на каждую пару"""
+    data = []
+    for symbol in symbols:
+        ticker = bot.requests.get(f"{base_url}/api/v3/ticker/24hr?symbol={symbol}", timeout=5).json()
+        data.append({'symbol': symbol, 'change': float(ticker['priceChangePercent'])})
+    return sorted(data, key=lambda x: abs(x['change']), reverse=True)
+
+@benchmark('market')
+def bench_market(argv):
+    """Binance: запрос на каждую пару в каждой рубрике против общего пакетного кэша"""
+    parser = argparse.ArgumentParser(prog='market')
+    parser.add_argument('--symbols', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--rounds', type=int, default=3, help='генераций трёх рубрик')
+    args = parser.parse_args(argv)
+
+    symbols = ['BTCUSDT', 'ETHUSDT', 'ADAUSDT', 'JASMYUSDT', 'SOLUSDT']
+    symbols += [f'C{i}USDT' for i in range(args.symbols - len(symbols))]
+    server = binance_server(args.latency)
+    rubrics = (bot.generate_morning_briefing, bot.generate_market_stats, bot.generate_daily_summary)
+    try:
+        legacy_ms = []
+        for _ in range(args.rounds):
+            for _ in rubrics:
+                started = time.perf_counter()
+                legacy_binance_data(server.url, symbols)
+                legacy_ms.append((time.perf_counter() - started) * 1000)
+        legacy_requests = server.requests
+
+        server.requests = 0
+        bot.market_data = bot.MarketData(server.url, symbols, ttl=300)
+        shared_ms = []
+        for _ in range(args.rounds):
+            for rubric in rubrics:
+                started = time.perf_counter()
+                rubric()
+                shared_ms.append((time.perf_counter() - started) * 1000)
+        shared_requests = server.requests
+    finally:
+        server.close()
+
+    generations = args.rounds * len(rubrics)
+    report(f"{args.symbols} пар, {generations} генераций рубрик, задержка {args.latency}с", [
+        ('по паре: запросов', f'{legacy_requests} ({legacy_requests / generations:.1f} на рубрику)'),
+        ('пакетом: запросов', f'{shared_requests} ({shared_requests / generations:.2f} на рубрику)'),
+        ('по паре p50 / max', f'{percentile(legacy_ms, 50):.1f} / {max(legacy_ms):.1f} ms'),
+        ('пакетом p50 / max', f'{percentile(shared_ms, 50):.1f} / {max(shared_ms):.1f} ms'),
+    ])
+
+def ticker_frames(symbols, count, seed=5):
+    """Кадры комбинированного потока miniTicker: случайное блуждание цен, тик раз в 100 мс"""
+    rng = random.Random(seed)
+    prices = {symbol: rng.uniform(0.1, 50000) for symbol in symbols}
+    start = int(time.time() * 1000) - count * 100
+    frames = []
+    for i in range(count):
+        symbol = symbols[i % len(symbols)]
+        prices[symbol] *= 1 + rng.gauss(0, 0.002)
+        frames.append(json.dumps({'stream': f'{symbol.lower()}@miniTicker', 'data': {
+            'e': '24hrMiniTicker', 'E': start + i * 100, 's': symbol, 'c': f'{prices[symbol]:.8f}'}}))
+    return frames
+
+class ReplayServer:
+    """Локальный WebSocket: проигрывает кадры, обрывая соединение каждые drop кадров"""
+
+    def __init__(self, frames, drop=0):
+        self.frames = frames
+        self.drop = drop
+        self.sent = 0
+        self.connections = 0
+        loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        async def replay(ws):
+            self.connections += 1
+            while self.sent < len(self.frames):
+                await ws.send(self.frames[self.sent])
+                self.sent += 1
+                if self.drop and self.sent % self.drop == 0:
+                    return
+
+        async def start():
+            self.server = await websockets.serve(replay, '127.0.0.1', 0)
+            self.url = f"ws://127.0.0.1:{self.server.sockets[0].getsockname()[1]}"
+            ready.set()
+
+        self.loop = loop
+        threading.Thread(target=lambda: (loop.run_until_complete(start()), loop.run_forever()), daemon=True).start()
+        ready.wait()
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.server.close)
+
+@benchmark('prices')
+def bench_prices(argv):
+    """Поток цен: разбор кадров и OHLC-буферы, через локальный WebSocket с обрывами"""
+    parser = argparse.ArgumentParser(prog='prices')
+    parser.add_argument('--symbols', type=int, default=200)
+    parser.add_argument('--frames', type=int, default=200_000)
+    parser.add_argument('--drop', type=int, default=50_000, help='обрыв соединения каждые N кадров')
+    parser.add_argument('--record', help='JSONL с записанными кадрами вместо синтетики')
+    args = parser.parse_args(argv)
+
+    if args.record:
+        with open(args.record, encoding='utf-8') as f:
+            frames = [line.strip() for line in f if line.strip()]
+        symbols = sorted({json.loads(frame).get('data', {}).get('s') for frame in frames} - {None})
+    else:
+        symbols = [f'C{i}USDT' for i in range(args.symbols)]
+        frames = ticker_frames(symbols, args.frames)
+
+    alerts = []
+    stream = bot.PriceStream('ws://unused', symbols, bot.PriceBook(symbols),
+                             lambda *alert: alerts.append(alert), threshold=1.0, window=5)
+    started = time.perf_counter()
+    for frame in frames:
+        stream.handle(frame)
+    handle_time = time.perf_counter() - started
+
+    server = ReplayServer(frames, args.drop)
+    stream = bot.PriceStream(server.url, symbols, bot.PriceBook(symbols),
+                             lambda *alert: alerts.append(alert), threshold=1.0, window=5)
+
+    async def consume():
+        task = asyncio.create_task(stream.run(min_backoff=0.01))
+        while stream.stats['messages'] < len(frames):
+            await asyncio.sleep(0.01)
+        task.cancel()
+
+    started = time.perf_counter()
+    asyncio.run(consume())
+    stream_time = time.perf_counter() - started
+    server.close()
+
+    report(f"{len(symbols)} пар, {len(frames):,} кадров", [
+        ('handle()', f'{len(frames) / handle_time:,.0f} msg/s'),
+        ('через WebSocket', f'{len(frames) / stream_time:,.0f} msg/s'),
+        ('подключений', f"{stream.stats['connects']} (обрывов сервера: {server.connections - 1})"),
+        ('алертов (>1% за 5 мин)', f"{stream.stats['alerts']}"),
+    ])
+
+class FakeMessage:
+    """Сообщение команды: reply_text только запоминает ответ"""
+
+    def __init__(self):
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+class FakeUpdate:
+    def __init__(self):
+        self.message = FakeMessage()
+
+async def legacy_analyze_trends():
+    """Прежний скан: разбор и запись в базу прямо в event loop"""
+    now = int(time.time())
+    source_urls = [(group, url) for group, urls in bot.TREND_SOURCES.items() for url in urls]
+    feeds = await bot.fetch_feeds([url for _, url in source_urls])
+    trends = bot.scan_trend_entries(source_urls, feeds, now)
+    bot.db.executemany("INSERT INTO trend_data (topic, score, detected_ts) VALUES (?, ?, ?)",
+                       [(topic, metrics['score'], now) for topic, metrics in trends.items()])
+    return trends
+
+@benchmark('commands')
+def bench_commands(argv):
+    """Задержка ответа /stats во время скана трендов: скан в event loop против пула"""
+    parser = argparse.ArgumentParser(prog='commands')
+    parser.add_argument('--feeds', type=int, default=1000)
+    parser.add_argument('--items', type=int, default=20)
+    parser.add_argument('--interval', type=float, default=0.01, help='пауза между командами')
+    args = parser.parse_args(argv)
+
+    server, urls = feed_server(args.feeds, args.items)
+    bot.TREND_SOURCES = {'bench': urls}
+
+    async def measure(scan):
+        bot.trend_engine = bot.TrendEngine()
+        task = asyncio.create_task(scan())
+        # Команды приходят по расписанию; задержка считается от момента прихода,
+        # поэтому заблокированный event loop виден целиком
+        started = time.perf_counter()
+        latencies = []
+        while not task.done() or not latencies:
+            arrival = started + len(latencies) * args.interval
+            await asyncio.sleep(max(0, arrival - time.perf_counter()))
+            await bot.stats_command(FakeUpdate(), None)
+            latencies.append((time.perf_counter() - arrival) * 1000)
+        await task
+        return latencies, time.perf_counter() - started
+
+    try:
+        # Ленты уже в кэше: меряем именно разбор и запись, а не сеть
+        bot.FEED_CACHE_TTL = 3600
+        asyncio.run(bot.fetch_feeds(urls))
+        legacy = asyncio.run(measure(legacy_analyze_trends))
+        shared = asyncio.run(measure(bot.analyze_trends))
+    finally:
+        server.close()
+
+    rows = []
+    for name, (samples, duration) in (('скан в event loop', legacy), ('скан в пуле', shared)):
+        rows.append((name, f'p50 {percentile(samples, 50):.1f} / p99 {percentile(samples, 99):.1f} / '
+                           f'max {max(samples):.1f} ms ({len(samples)} команд за {duration:.2f}s)'))
+    report(f"/stats во время скана {args.feeds} лент x {args.items} записей", rows)
+
+class FakeBotAPI:
+    """Мок Bot API: sendMessage с лимитом limit сообщений в секунду на чат и случайными 429"""
+
+    def __init__(self, limit=5, error_rate=0.05, retry_after=1, seed=3):
+        self.limit = limit
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.recent = {}
+        self.delivered = []
+        self.rejected = 0
+        self.server = StubServer(self.handle)
+        self.url = self.server.url
+
+    def reply(self, status, payload):
+        return status, {'Content-Type': 'application/json'}, json.dumps(payload).encode()
+
+    def handle(self, request):
+        length = int(request.headers.get('Content-Length') or 0)
+        body = request.rfile.read(length).decode()
+        params = json.loads(body) if body.startswith('{') else {k: v[0] for k, v in parse_qs(body).items()}
+        method = request.path.rsplit('/', 1)[-1]
+        if method == 'getMe':
+            return self.reply(200, {'ok': True, 'result': {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}})
+
+        chat_id = str(params.get('chat_id'))
+        now = time.monotonic()
+        with self.lock:
+            window = [t for t in self.recent.get(chat_id, []) if now - t < 1]
+            flood = len(window) >= self.limit or self.rng.random() < self.error_rate
+            if flood:
+                self.rejected += 1
+            else:
+                window.append(now)
+                self.delivered.append((chat_id, params.get('text')))
+            self.recent[chat_id] = window
+            message_id = len(self.delivered)
+        if flood:
+            return self.reply(429, {'ok': False, 'error_code': 429, 'description': f'Too Many Requests: retry after {self.retry_after}',
+                                    'parameters': {'retry_after': self.retry_after}})
+        return self.reply(200, {'ok': True, 'result': {'message_id': message_id, 'date': int(time.time()),
+                                                        'chat': {'id': int(chat_id), 'type': 'channel'}, 'text': params.get('text')}})
+
+    def close(self):
+        self.server.close()
+
+@benchmark('delivery')
+def bench_delivery(argv):
+    """Доставка в Telegram: отправка без повторов против outbox с ведром токенов (мок Bot API с 429)"""
+    parser = argparse.ArgumentParser(prog='delivery')
+    parser.add_argument('--messages', type=int, default=100, help='сообщений на канал')
+    parser.add_argument('--channels', type=int, default=3)
+    parser.add_argument('--limit', type=int, default=5, help='лимит мока, сообщений в секунду на чат')
+    parser.add_argument('--error-rate', type=float, default=0.05, help='доля случайных 429')
+    args = parser.parse_args(argv)
+
+    chats = [str(-1001000000000 - i) for i in range(args.channels)]
+    texts = [f'Сообщение {i}' for i in range(args.messages)]
+
+    def make_bot(api):
+        return bot.Bot(token='123:bench', base_url=f'{api.url}/bot', request=bot.HTTPXRequest(connection_pool_size=8))
+
+    # Прежнее поведение: отправили один раз, при ошибке сообщение потеряно
+    api = FakeBotAPI(args.limit, args.error_rate)
+    async def naive():
+        sender = make_bot(api)
+        async def channel(chat_id):
+            for text in texts:
+                try:
+                    await sender.send_message(chat_id=chat_id, text=text)
+                except bot.TelegramError:
+                    pass
+        await asyncio.gather(*(channel(chat_id) for chat_id in chats))
+    started = time.perf_counter()
+    asyncio.run(naive())
+    naive_time = time.perf_counter() - started
+    naive_delivered, naive_rejected = len(api.delivered), api.rejected
+    api.close()
+
+    api = FakeBotAPI(args.limit, args.error_rate)
+    bot.telegram_bot = make_bot(api)
+    bot.db.execute("DELETE FROM outbox")
+    now = int(time.time())
+    bot.db.executemany("INSERT INTO outbox (chat_id, content_type, text, next_attempt_ts, created_ts) VALUES (?, 'news', ?, ?, ?)",
+                       [(chat_id, text, now, now) for text in texts for chat_id in chats])
+    total = len(texts) * len(chats)
+    outbox = bot.Outbox(chat_rate=args.limit, chat_burst=1)
+
+    async def drain():
+        task = asyncio.create_task(outbox.run(idle=0.1))
+        while outbox.stats['sent'] < total:
+            await asyncio.sleep(0.05)
+        task.cancel()
+    started = time.perf_counter()
+    asyncio.run(drain())
+    outbox_time = time.perf_counter() - started
+    api.close()
+
+    # Порядок внутри канала сохраняется
+    in_order = all([text for chat, text in api.delivered if chat == chat_id] == texts for chat_id in chats)
+    report(f"{args.channels} канала x {args.messages} сообщений, лимит {args.limit}/с на чат, {args.error_rate:.0%} случайных 429", [
+        ('без повторов', f'доставлено {naive_delivered}/{total}, 429: {naive_rejected}, {naive_delivered / naive_time * 60:,.0f} msg/min'),
+        ('outbox', f"доставлено {len(api.delivered)}/{total}, 429: {api.rejected}, {len(api.delivered) / outbox_time * 60:,.0f} msg/min"),
+        ('порядок в канале', 'сохранён' if in_order else 'нарушен'),
+    ])
+
+@benchmark('channels')
+def bench_channels(argv):
+    """Стоимость новости на канал: отдельный перевод и рендер на каждый канал против реестра каналов"""
+    parser = argparse.ArgumentParser(prog='channels')
+    parser.add_argument('--items', type=int, default=50)
+    parser.add_argument('--channels', default='1,5,10,25,50')
+    parser.add_argument('--latency', type=float, default=0.005, help='задержка бэкенда перевода')
+    args = parser.parse_args(argv)
+
+    langs = ['ru', 'en', 'es', 'de', 'uk']
+    bot.db.execute("DELETE FROM news")
+    now = int(time.time())
+    bot.db.executemany('''
+        INSERT INTO news (title, title_original, link, summary, source, content_type, priority, added_ts, tags)
+        VALUES (?, ?, ?, ?, 'bench', 'regular', 4, ?, '')
+    ''', [(f'[ru] {story_text(i)}', story_text(i), f'http://bench/{i}', story_text((i, 's'), 30), now + i)
+          for i in range(args.items)])
+    rows = bot.db.fetchall("SELECT * FROM news ORDER BY id")
+
+    rows_out = []
+    for count in map(int, args.channels.split(',')):
+        channels = [bot.Channel(str(-1000 - i), langs[i % len(langs)], style='compact' if i % 10 == 9 else 'full')
+                    for i in range(count)]
+
+        # Отдельный процесс на канал: каждый сам переводит и рендерит каждую новость
+        async def per_channel():
+            backend = bot.FakeTranslateBackend(args.latency)
+            for row in rows:
+                for channel in channels:
+                    title = (await backend.translate_batch([row['title_original']], channel.lang))[0]
+                    bot.format_news_post(row, title, compact=channel.style == 'compact')
+            return backend.requests
+        started = time.perf_counter()
+        naive_requests = asyncio.run(per_channel())
+        naive_ms = (time.perf_counter() - started) * 1000 / len(rows)
+
+        # Реестр: перевод пачкой на язык при ингестии, рендер один раз на вариант
+        bot.db.execute("UPDATE news SET posted = 0")
+        # Прямая запись в базу мимо бота - очередь публикации собирается заново
+        bot.db.transaction(bot.publish_queue.load)
+        bot.db.execute("DELETE FROM outbox")
+        bot.db.execute("DELETE FROM translations")
+        bot.RENDER_CACHE.clear()
+        bot.translator = bot.Translator(bot.FakeTranslateBackend(args.latency))
+        titles = [row['title_original'] for row in rows]
+
+        async def registry():
+            for lang in {channel.lang for channel in channels}:
+                await bot.translator.translate_many(titles, lang)
+        started = time.perf_counter()
+        asyncio.run(registry())
+        for _ in rows:
+            bot.enqueue_next_content(channels)
+        shared_ms = (time.perf_counter() - started) * 1000 / len(rows)
+        assert bot.db.count("SELECT COUNT(*) FROM outbox") == len(rows) * count
+
+        rows_out.append((f'{count} каналов', f'{naive_ms:7.2f} ms/новость ({naive_requests} переводов) -> '
+                                             f'{shared_ms:5.2f} ms/новость ({bot.translator.backend.requests} переводов)'))
+
+    # Канал с cadence: новости, пришедшие раньше интервала, ждут в очереди, а не теряются
+    bot.db.execute("UPDATE news SET posted = 1")
+    bot.db.execute("UPDATE news SET posted = 0 WHERE id IN (SELECT id FROM news ORDER BY id LIMIT 3)")
+    bot.db.transaction(bot.publish_queue.load)
+    bot.db.execute("DELETE FROM outbox")
+    slow = bot.Channel('-2000', 'ru', cadence_minutes=30)
+    for _ in range(3):
+        bot.enqueue_next_content([slow])
+    assert bot.db.count("SELECT COUNT(*) FROM outbox") == 1
+    assert bot.db.count("SELECT COUNT(*) FROM news WHERE posted = 0") == 2
+    slow.last_news_ts -= slow.cadence
+    bot.enqueue_next_content([slow])
+    assert bot.db.count("SELECT COUNT(*) FROM outbox") == 2
+    assert bot.db.count("SELECT COUNT(*) FROM news WHERE posted = 0") == 1
+
+    # Готов только канал с фильтром, а его тем в очереди нет: перебор ограничен
+    # QUEUE_MAX_DEFERRED, новости ждут канал с cadence
+    bot.db.execute("UPDATE news SET posted = 0")
+    bot.db.transaction(bot.publish_queue.load)
+    bot.db.execute("DELETE FROM outbox")
+    filtered = bot.Channel('-2001', 'ru', keywords=['cardano'])
+    limit, bot.QUEUE_MAX_DEFERRED = bot.QUEUE_MAX_DEFERRED, 10
+    try:
+        assert bot.enqueue_next_content([slow, filtered]) is None
+    finally:
+        bot.QUEUE_MAX_DEFERRED = limit
+    assert bot.publish_queue.stats['deferral_limit'] == 1
+    assert bot.db.count("SELECT COUNT(*) FROM news WHERE posted = 0") == args.items
+
+    report(f"{args.items} новостей, языки {', '.join(langs)}, перевод {args.latency}с", rows_out)
+
+def legacy_clean_text(text):
+    """clean_text до пакетного санитайзера"""
+    if not text:
+        return ""
+    clean = re.sub(r'<[^>]+>', '', text)
+    clean = re.sub(r'\s+', ' ', clean)
+    clean = re.sub(r'[^\w\s\.\,\!\?\-\:\;\(\)]', '', clean)
+    return clean.strip()
+
+def legacy_extract_clean_summary(text, max_length=120):
+    """extract_clean_summary до пакетного санитайзера"""
+    if not text:
+        return ""
+    clean = legacy_clean_text(text)
+    sentence_match = re.match(r'^[^\.!?]*[\.!?]', clean)
+    first_sentence = sentence_match.group(0) if sentence_match else clean[:max_length]
+    if len(first_sentence) > max_length:
+        first_sentence = first_sentence[:max_length].rsplit(' ', 1)[0] + '...'
+    return first_sentence
+
+def html_summary(seed, size):
+    """HTML-тело записи RSS размером около size: абзацы, ссылки, картинки, сущности, скрипты"""
+    rng = random.Random(str(seed))
+    parts = [f'<div class="post"><img src="https://cdn.example.com/{seed}.jpg" alt="cover" />']
+    while sum(map(len, parts)) < size:
+        words = [rng.choice(PLAIN_WORDS + CRYPTO_WORDS) for _ in range(rng.randint(8, 25))]
+        words[rng.randrange(len(words))] = f'<a href="https://example.com/{rng.random()}">{words[0]}</a>'
+        if rng.random() < 0.3:
+            words.insert(rng.randrange(len(words)), rng.choice(['&amp;', '&quot;ETF&quot;', '&#8212;', '&nbsp;', '$3.5&nbsp;bn']))
+        parts.append(f'<p>{" ".join(words).capitalize()}. {rng.choice(PLAIN_WORDS)} {rng.choice(CRYPTO_WORDS)}!</p>')
+        if rng.random() < 0.05:
+            parts.append('<script type="text/javascript">window.dataLayer = window.dataLayer || []; push({a: 1.5});</script>')
+    parts.append('</div>')
+    return ''.join(parts)
+
+@benchmark('sanitize')
+def bench_sanitize(argv):
+    """clean_text / extract_clean_summary: прежние re.sub против однопроходного санитайзера, MB/s"""
+    parser = argparse.ArgumentParser(prog='sanitize')
+    parser.add_argument('--entries', type=int, default=2000)
+    parser.add_argument('--corpus', help='папка с реальными HTML-телами записей, по файлу на запись')
+    args = parser.parse_args(argv)
+
+    if args.corpus:
+        corpus = []
+        for name in sorted(os.listdir(args.corpus)):
+            with open(os.path.join(args.corpus, name), encoding='utf-8', errors='replace') as f:
+                corpus.append(f.read())
+    else:
+        # Размеры как у живых лент: от анонса в пару абзацев до полной статьи
+        rng = random.Random(4)
+        corpus = [html_summary(i, int(min(60_000, rng.lognormvariate(7.5, 1.0)))) for i in range(args.entries)]
+    megabytes = sum(len(text.encode()) for text in corpus) / 1e6
+
+    def throughput(func):
+        started = time.perf_counter()
+        func(corpus)
+        return megabytes / (time.perf_counter() - started)
+
+    rows = [
+        ('clean_text', f"{throughput(lambda c: [legacy_clean_text(t) for t in c]):7.1f} -> "
+                       f"{throughput(lambda c: [bot.clean_text(t) for t in c]):7.1f} MB/s"),
+        ('extract_clean_summary', f"{throughput(lambda c: [legacy_extract_clean_summary(t) for t in c]):7.1f} -> "
+                                  f"{throughput(bot.extract_clean_summaries):7.1f} MB/s"),
+    ]
+    sample = corpus[0]
+    rows.append(('пример (было)', legacy_extract_clean_summary(sample)))
+    rows.append(('пример (стало)', bot.extract_clean_summary(sample)))
+    report(f"{len(corpus)} записей, {megabytes:.1f} MB HTML", rows)
+
+def peak_memory(func):
+    """Пик выделенной Python-памяти за вызов func, МБ"""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+
+@benchmark('parse')
+def bench_parse(argv):
+    """Разбор большой ленты: feedparser целиком против потокового разбора с отсечкой"""
+    parser = argparse.ArgumentParser(prog='parse')
+    parser.add_argument('--items', type=int, default=500)
+    parser.add_argument('--summary', type=int, default=4000, help='размер описания записи, байт')
+    parser.add_argument('--take', type=int, default=20, help='сколько записей нужно боту')
+    parser.add_argument('--new', type=int, default=5, help='записей новее high-water mark')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    content = make_rss(0, args.items, args.summary)
+    # Записи идут с шагом 10 минут: high-water mark на (new+1)-й записи
+    since = int(time.time()) - args.new * 600
+
+    variants = [
+        (f'feedparser[:{args.take}]', lambda: bot.feedparser.parse(content).entries[:args.take]),
+        ('поток, все записи', lambda: bot.parse_feed_entries(content, limit=args.items)),
+        (f'поток, limit={args.take}', lambda: bot.parse_feed_entries(content, limit=args.take)),
+        ('поток, high-water mark', lambda: bot.parse_feed_entries(content, since=since, limit=args.take)),
+    ]
+    rows = []
+    for name, func in variants:
+        count = len(func())
+        rows.append((name, f'{timed(func, args.repeat):8.1f} ms, пик {peak_memory(func):6.1f} MB, записей {count}'))
+    report(f"лента {len(content) / 1e6:.1f} MB, {args.items} записей", rows)
+
+def simulate_polling(posts, interval_for, horizon, check):
+    """Опрос лент в виртуальном времени: (обращений к лентам, задержки появления записей, с).
+    
+    interval_for(interval, new_items, empty_polls) - следующий интервал источника после опроса.
+    """
+    fetches = 0
+    lags = []
+    for times in posts:
+        interval = bot.NEWS_INTERVAL_SECONDS
+        # Первый опрос - в случайный момент первого интервала, дальше по интервалу
+        now = random.Random(len(times)).uniform(0, interval)
+        seen = empty = 0
+        while now < horizon:
+            fetches += 1
+            new = 0
+            while seen < len(times) and times[seen] <= now:
+                lags.append(now - times[seen])
+                seen += 1
+                new += 1
+            empty = 0 if new else empty + 1
+            interval = interval_for(interval, new, empty)
+            # Планировщик проверяет due-источники раз в check секунд
+            now = (now + interval + check - 1) // check * check
+    return fetches, lags
+
+@benchmark('polling')
+def bench_polling(argv):
+    """Опрос всех лент с фиксированным интервалом против адаптивного по темпу источника"""
+    parser = argparse.ArgumentParser(prog='polling')
+    parser.add_argument('--sources', type=int, default=40)
+    parser.add_argument('--hours', type=int, default=24)
+    parser.add_argument('--active', type=float, default=0.25, help='доля активных лент')
+    args = parser.parse_args(argv)
+
+    # Активные ленты - 4-12 записей в час, остальные - 0-6 в сутки
+    rng = random.Random(11)
+    horizon = args.hours * 3600
+    posts = []
+    for i in range(args.sources):
+        rate = rng.uniform(4, 12) if i < args.sources * args.active else rng.uniform(0, 6) / 24
+        times, t = [], rng.expovariate(rate / 3600) if rate else horizon
+        while t < horizon:
+            times.append(t)
+            t += rng.expovariate(rate / 3600)
+        posts.append(times)
+    items = sum(len(times) for times in posts)
+
+    rows = []
+    for name, interval_for in (
+        (f'фиксированный {bot.NEWS_INTERVAL_SECONDS // 60} мин', lambda interval, new, empty: interval),
+        ('адаптивный', lambda interval, new, empty: bot.next_poll_interval(interval, new, empty_polls=empty)),
+    ):
+        fetches, lags = simulate_polling(posts, interval_for, horizon, bot.SOURCE_CHECK_SECONDS)
+        rows.append((name, f'{fetches / args.hours:6.0f} загрузок/ч, задержка p50 {percentile(lags, 50) / 60:4.1f} мин, '
+                           f'среднее {sum(lags) / len(lags) / 60:4.1f} мин, p99 {percentile(lags, 99) / 60:4.1f} мин'))
+    report(f"{args.sources} лент ({args.active:.0%} активных), {items} записей за {args.hours} ч", rows)
+
+@benchmark('links')
+def bench_links(argv):
+    """Проверка ссылок по одной в SQLite против Bloom-фильтра перед пакетным запросом"""
+    parser = argparse.ArgumentParser(prog='links')
+    parser.add_argument('--links', type=int, default=10_000_000)
+    parser.add_argument('--candidates', type=int, default=2000, help='ссылок за цикл ингестии')
+    parser.add_argument('--new', type=float, default=0.9, help='доля новых среди них')
+    parser.add_argument('--fp-rate', type=float, default=0.01)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(7)
+    stored = rng.integers(-2**63, 2**63 - 1, args.links, dtype=np.int64)
+
+    # Отдельная база: news с link_hash, как после миграции 10
+    conn = sqlite3.connect(os.path.join(BENCH_DIR, 'links.db'))
+    conn.execute("CREATE TABLE news (id INTEGER PRIMARY KEY, link_hash INTEGER)")
+    started = time.perf_counter()
+    with conn:
+        conn.executemany("INSERT INTO news (link_hash) VALUES (?)", ((int(h),) for h in stored))
+        conn.execute("CREATE INDEX idx_news_link_hash ON news(link_hash)")
+    fill_time = time.perf_counter() - started
+
+    link_filter = bot.LinkFilter(os.path.join(BENCH_DIR, 'links.npz'), args.links, args.fp_rate, max_mb=1024)
+    started = time.perf_counter()
+    link_filter.add(stored)
+    build_time = time.perf_counter() - started
+
+    absent = rng.integers(-2**63, 2**63 - 1, 1_000_000, dtype=np.int64)
+    started = time.perf_counter()
+    false_positives = int(link_filter.contains(absent).sum())
+    lookup_time = time.perf_counter() - started
+
+    # Цикл ингестии: доля new ссылок новые, остальные уже в базе
+    known = int(args.candidates * (1 - args.new))
+    cycle = np.concatenate([rng.choice(stored, known), absent[:args.candidates - known]]).tolist()
+
+    def per_link():
+        return sum(conn.execute("SELECT 1 FROM news WHERE link_hash = ?", (h,)).fetchone() is not None for h in cycle)
+
+    def filtered():
+        maybe = [h for h, seen in zip(cycle, link_filter.contains(cycle)) if seen]
+        found = 0
+        for i in range(0, len(maybe), 500):
+            chunk = maybe[i:i + 500]
+            found += len(conn.execute(f"SELECT link_hash FROM news WHERE link_hash IN ({','.join('?' * len(chunk))})",
+                                      chunk).fetchall())
+        return found, len(maybe)
+
+    assert per_link() == filtered()[0]
+    queried = filtered()[1]
+    per_link_ms, filtered_ms = timed(per_link, 3), timed(filtered, 3)
+    conn.close()
+
+    report(f"{args.links:,} ссылок в базе, цикл {args.candidates} ссылок ({args.new:.0%} новых)", [
+        ('заполнение SQLite', f'{fill_time:.1f}s'),
+        ('фильтр: память', f'{link_filter.bits.nbytes / 2**20:.1f} MB ({link_filter.size / args.links:.1f} бит/ссылку, k={link_filter.hashes})'),
+        ('фильтр: сборка', f'{build_time:.2f}s ({args.links / build_time / 1e6:.1f} M/s)'),
+        ('фильтр: проверка', f'{len(absent) / lookup_time / 1e6:.1f} M ссылок/с'),
+        ('ложные срабатывания', f'{false_positives / len(absent):.2%} (цель {args.fp_rate:.2%})'),
+        ('по одной: запросов', f'{len(cycle)}, {per_link_ms:.1f} ms'),
+        ('с фильтром: ссылок в базу', f'{queried} ({-(-queried // 500)} запросов), {filtered_ms:.1f} ms'),
+        ('запросов в базу избежали', f'{1 - queried / len(cycle):.1%} ссылок'),
+    ])
+
+def seed_retention(rows, trends):
+    """Пустые news/trend_data и год истории в текущей схеме (через db бота - с триггерами счётчиков)"""
+    for table in ('story_signatures', 'news', 'trend_data', 'trend_daily'):
+        bot.db.execute(f"DELETE FROM {table}")
+    rng = random.Random(5)
+    now = int(time.time())
+    bot.db.executemany(
+        "INSERT INTO news (title, link, summary, source, posted, added_ts) VALUES (?, ?, ?, 'bench', ?, ?)",
+        [(story_text(i), f'http://bench/{i}/{now}', story_text((i, 's'), 40), int(rng.random() < 0.9),
+          now - rng.randrange(365 * 86400)) for i in range(rows)])
+    bot.db.executemany(
+        "INSERT INTO trend_data (topic, score, velocity, zscore, detected_ts) VALUES (?, ?, 1, 2, ?)",
+        [(rng.choice(['bitcoin', 'ethereum', 'defi', 'nft']), rng.randrange(3, 50), now - rng.randrange(365 * 86400))
+         for _ in range(trends)])
+
+def writer_latency(func):
+    """Выполняет func и параллельно мерит задержку коротких записей бота, мс"""
+    samples = []
+    done = threading.Event()
+
+    def probe():
+        while not done.is_set():
+            started = time.perf_counter()
+            bot.db.execute("INSERT OR REPLACE INTO scheduler_jobs (name, last_run_ts) VALUES ('bench', ?)", (int(time.time()),))
+            samples.append((time.perf_counter() - started) * 1000)
+            time.sleep(0.005)
+
+    thread = threading.Thread(target=probe)
+    thread.start()
+    started = time.perf_counter()
+    try:
+        func()
+    finally:
+        done.set()
+        thread.join()
+    return time.perf_counter() - started, samples
+
+@benchmark('retention')
+def bench_retention(argv):
+    """Удаление старых строк одним DELETE против пачек с архивом; счётчики /stats против COUNT(*)"""
+    parser = argparse.ArgumentParser(prog='retention')
+    parser.add_argument('--rows', type=int, default=300_000)
+    parser.add_argument('--trends', type=int, default=50_000)
+    args = parser.parse_args(argv)
+
+    seed_retention(args.rows, args.trends)
+    full_scan = timed(lambda: (bot.db.count("SELECT COUNT(*) FROM news"),
+                               bot.db.count("SELECT COUNT(*) FROM news WHERE posted = 1")), 5)
+    counters = timed(lambda: bot.db.fetchall("SELECT name, value FROM counters"), 5)
+    size_before = bot.db.scalar("PRAGMA page_count") * bot.db.scalar("PRAGMA page_size")
+
+    cutoff = int(time.time()) - bot.NEWS_RETENTION_DAYS * 86400
+    single_time, single = writer_latency(lambda: bot.db.transaction(lambda conn: (
+        conn.execute("DELETE FROM news WHERE added_ts < ?", (cutoff,)),
+        conn.execute("DELETE FROM trend_data WHERE detected_ts < ?", (cutoff,)))))
+
+    seed_retention(args.rows, args.trends)
+    batched_time, batched = writer_latency(lambda: asyncio.run(bot.run_retention()))
+    size_after = bot.db.scalar("PRAGMA page_count") * bot.db.scalar("PRAGMA page_size")
+    archive = sum(os.path.getsize(os.path.join(bot.ARCHIVE_DIR, name)) for name in os.listdir(bot.ARCHIVE_DIR))
+
+    report(f"{args.rows:,} новостей и {args.trends:,} трендов за год, хранение {bot.NEWS_RETENTION_DAYS} дней", [
+        ('/stats: COUNT(*) x2', f'{full_scan:.1f} ms'),
+        ('/stats: counters', f'{counters:.2f} ms'),
+        ('один DELETE', f'{single_time:.2f}s, запись бота p99 {percentile(single, 99):.0f} / max {max(single):.0f} ms'),
+        ('пачками с архивом', f'{batched_time:.2f}s, запись бота p99 {percentile(batched, 99):.0f} / max {max(batched):.0f} ms'),
+        ('архив', f'{bot.RETENTION_STATS["archived"]:,} новостей, {archive / 2**20:.1f} MB gzip'),
+        ('тренды', f'{bot.RETENTION_STATS["rolled_up"]:,} строк -> {bot.db.count("SELECT COUNT(*) FROM trend_daily"):,} дневных'),
+        ('база', f'{size_before / 2**20:.1f} -> {size_after / 2**20:.1f} MB '
+                 f'(incremental_vacuum {bot.RETENTION_VACUUM_PAGES} стр. за проход)'),
+    ])
+
+@benchmark('history')
+def bench_history(argv):
+    """История тикеров: запись минутных снимков и векторные агрегаты по всем парам"""
+    parser = argparse.ArgumentParser(prog='history')
+    parser.add_argument('--symbols', type=int, default=500)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--sqlite-days', type=int, default=7, help='те же данные в SQLite (строка на тик) для сравнения')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    symbols = [f'S{i:03d}USDT' for i in range(args.symbols - 1)] + ['BTCUSDT']
+    history = bot.MarketHistory(tempfile.mkdtemp(dir=BENCH_DIR, prefix='market-'), symbols)
+    rng = np.random.default_rng(3)
+    minutes = args.days * 1440
+    end = int(time.time()) // 60 * 60
+    start = end - (minutes - 1) * 60
+    # Геометрическое блуждание: шаги сразу на сутки вперёд, чтобы генерация не мерилась как запись
+    base = rng.uniform(0.01, 50_000, args.symbols)
+    volumes = (rng.pareto(1.2, args.symbols) * 1e7).astype(np.float32)
+
+    started = time.perf_counter()
+    sql_rows = []
+    for day in range(args.days):
+        walk = base[:, None] * np.exp(np.cumsum(rng.normal(0, 0.001, (args.symbols, 1440)), axis=1))
+        base = walk[:, -1]
+        walk = walk.astype(np.float32)
+        for minute in range(1440):
+            history.append(start + (day * 1440 + minute) * 60, walk[:, minute], volumes)
+        if day >= args.days - args.sqlite_days:
+            sql_rows.append(walk)
+    ingest_time = time.perf_counter() - started
+    size = sum(os.path.getsize(os.path.join(history.path, name)) for name in os.listdir(history.path))
+
+    # SQLite: строка на тик, ключ (пара, время) - для последних sqlite_days дней
+    conn = sqlite3.connect(os.path.join(BENCH_DIR, 'ticks.db'))
+    conn.execute("CREATE TABLE ticks (symbol INTEGER, ts INTEGER, price REAL, PRIMARY KEY (symbol, ts)) WITHOUT ROWID")
+    sql_start = end - (args.sqlite_days * 1440 - 1) * 60
+    walk = np.concatenate(sql_rows, axis=1)
+    started = time.perf_counter()
+    with conn:
+        conn.executemany("INSERT INTO ticks VALUES (?, ?, ?)",
+                         ((s, sql_start + m * 60, float(walk[s, m])) for m in range(walk.shape[1]) for s in range(args.symbols)))
+    sql_ingest = walk.size / (time.perf_counter() - started)
+
+    def sql_change(hours):
+        # Две точечные выборки по первичному ключу на пару
+        lookup = "SELECT price FROM ticks WHERE symbol = ? AND ts <= ? ORDER BY ts DESC LIMIT 1"
+        changes = []
+        for symbol in range(args.symbols):
+            now = conn.execute(lookup, (symbol, end)).fetchone()
+            then = conn.execute(lookup, (symbol, end - hours * 3600)).fetchone()
+            changes.append((now[0] / then[0] - 1) * 100 if now and then else float('nan'))
+        return changes
+
+    def sql_volatility(hours):
+        prices = np.array(conn.execute("SELECT price FROM ticks WHERE ts > ? ORDER BY symbol, ts",
+                                       (end - hours * 3600,)).fetchall(), dtype=np.float64)
+        return np.log(prices.reshape(args.symbols, -1)).std(axis=1)
+
+    queries = [
+        ('change 1h', 1, history.change, sql_change),
+        ('change 24h', 24, history.change, sql_change),
+        ('change 7d', 24 * 7, history.change, sql_change),
+        ('change 365d', 24 * 364, history.change, sql_change),
+        ('volatility 24h', 24, history.volatility, sql_volatility),
+        ('volatility 7d', 24 * 7, history.volatility, sql_volatility),
+        ('volatility 30d', 24 * 30, history.volatility, sql_volatility),
+        ('dominance', 0, lambda hours, end: history.dominance(end), None),
+        ('top movers 24h', 24, lambda hours, end: history.top_movers(hours, 3, end), None),
+    ]
+    rows = [
+        ('запись', f'{minutes / ingest_time:,.0f} снимков/с ({minutes * args.symbols / ingest_time / 1e6:.1f} M цен/с), '
+                   f'{size / 2**30:.2f} GB на диске'),
+        ('SQLite запись', f'{sql_ingest / 1e6:.2f} M цен/с'),
+    ]
+    for name, hours, columnar, sql in queries:
+        if hours > args.days * 24:
+            continue
+        value = f'{timed(lambda: columnar(hours, end), args.repeat):8.1f} ms'
+        # SQLite держит только последние sqlite_days дней
+        if sql and hours <= args.sqlite_days * 24:
+            value += f'   SQLite {timed(lambda: sql(hours), args.repeat):8.1f} ms'
+        rows.append((name, value))
+    conn.close()
+    report(f"{args.symbols} пар x {args.days} дней минутных снимков ({minutes:,} минут)", rows)
+
+# Прежний выбор из очереди: две выборки с сортировкой в SQL на каждый пост
+def legacy_pick(conn):
+    row = conn.execute("SELECT * FROM content_queue WHERE posted = 0 AND scheduled_ts <= ? ORDER BY scheduled_ts LIMIT 1",
+                       (int(time.time()),)).fetchone()
+    if row:
+        conn.execute("UPDATE content_queue SET posted = 1 WHERE id = ?", (row[0],))
+        return row
+    row = conn.execute("SELECT * FROM news WHERE posted = 0 AND duplicate_of IS NULL ORDER BY priority, added_ts LIMIT 1").fetchone()
+    if row:
+        conn.execute("UPDATE news SET posted = 1 WHERE id = ? OR duplicate_of = ?", (row[0], row[0]))
+    return row
+
+def seed_queue(items, scheduled):
+    """Пустая очередь и items непубликованных новостей за неделю плюс scheduled рубрик"""
+    for table in ('story_signatures', 'news', 'content_queue'):
+        bot.db.execute(f"DELETE FROM {table}")
+    rng = random.Random(7)
+    now = int(time.time())
+    types = ['regular'] * 7 + ['breaking', 'warning', 'analysis']
+    rows = []
+    for i in range(items):
+        content_type = rng.choice(types)
+        tags = rng.choice(['bitcoin', 'ethereum defi', 'nft', None])
+        rows.append((story_text(i), f'http://bench/{i}/{now}', 'summary', content_type,
+                     bot.CONTENT_PRIORITY.get(content_type, bot.DEFAULT_PRIORITY), now - rng.randrange(7 * 86400),
+                     tags, (tags or '').replace(' ', ',')))
+    bot.db.executemany("INSERT INTO news (title, link, summary, source, content_type, priority, added_ts, tags, topics) "
+                       "VALUES (?, ?, ?, 'bench', ?, ?, ?, ?, ?)", rows)
+    bot.db.transaction(lambda conn: [bot.queue_content(conn, 'hot_topic', f'rubric {i}', now - rng.randrange(3600))
+                                     for i in range(scheduled)])
+
+@benchmark('queue')
+def bench_queue(argv):
+    """Выбор следующего поста: ORDER BY ... LIMIT 1 в SQLite против кучи publish_queue"""
+    parser = argparse.ArgumentParser(prog='queue')
+    parser.add_argument('--items', type=int, default=100_000)
+    parser.add_argument('--scheduled', type=int, default=100)
+    parser.add_argument('--pops', type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    def latencies(pick, pops=args.pops):
+        # Время выбора внутри транзакции писателя, без коммита и передачи в поток
+        samples = []
+
+        def timed_pick(conn):
+            started = time.perf_counter()
+            pick(conn)
+            samples.append((time.perf_counter() - started) * 1000)
+
+        for _ in range(pops):
+            bot.db.transaction(timed_pick)
+        return samples
+
+    seed_queue(args.items, args.scheduled)
+    bot.db.execute("DROP INDEX idx_news_duplicate_of")
+    unindexed = latencies(legacy_pick, min(args.pops, 200))
+    bot.db.execute("CREATE INDEX idx_news_duplicate_of ON news(duplicate_of) WHERE duplicate_of IS NOT NULL")
+    sql = latencies(legacy_pick)
+
+    seed_queue(args.items, args.scheduled)
+    bot.db.transaction(bot.publish_queue.load)
+    rebuild = bot.publish_queue.stats['rebuild_ms']
+    # Память куч - повторной сборкой под tracemalloc (он сам замедляет сборку)
+    tracemalloc.start()
+    bot.db.transaction(bot.publish_queue.load)
+    heap_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    heap = latencies(bot.pick_next_content)
+
+    # Сама куча без базы: heappop из копии
+    news = list(bot.publish_queue._news)
+    started = time.perf_counter()
+    for _ in range(min(args.pops, len(news))):
+        heapq.heappop(news)
+    heap_only = (time.perf_counter() - started) * 1e6 / min(args.pops, len(news))
+
+    report(f"{args.items:,} новостей и {args.scheduled} рубрик в очереди, {args.pops} выборов", [
+        ('SQL без idx_news_duplicate_of', f'p50 {percentile(unindexed, 50):.3f} / p99 {percentile(unindexed, 99):.3f} ms'),
+        ('SQL', f'p50 {percentile(sql, 50):.3f} / p99 {percentile(sql, 99):.3f} ms'),
+        ('куча', f'p50 {percentile(heap, 50):.3f} / p99 {percentile(heap, 99):.3f} ms'),
+        ('heappop без базы', f'{heap_only:.2f} us'),
+        ('сборка из базы', f'{rebuild:.0f} ms, {heap_memory / 2**20:.1f} MB'),
+        ('пропущено устаревших', bot.publish_queue.stats['stale']),
+    ])
+
+# Дневные итоги до инкрементальных агрегатов: запросы на каждый вызов рубрики
+LEGACY_DAILY_QUERIES = [
+    "SELECT COUNT(*) FROM news WHERE added_ts >= ? AND added_ts < ? AND posted = 1",
+    "SELECT COUNT(*) FROM trend_data WHERE detected_ts >= ? AND detected_ts < ?",
+    "SELECT topic, score FROM trend_data WHERE detected_ts >= ? AND detected_ts < ? ORDER BY score DESC LIMIT 1",
+]
+
+@benchmark('rubrics')
+def bench_rubrics(argv):
+    """Рубрики в слот: генерация на месте против текста, подготовленного заранее"""
+    parser = argparse.ArgumentParser(prog='rubrics')
+    parser.add_argument('--news', type=int, default=50_000, help='новостей за сегодня')
+    parser.add_argument('--trends', type=int, default=20_000, help='срабатываний радара за сегодня')
+    parser.add_argument('--latency', type=float, default=0.3, help='задержка ответа Binance, с')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    start, end = bot.today_range()
+    now = min(int(time.time()), end - 1)
+    rng = random.Random(11)
+    for table in ('story_signatures', 'news', 'trend_data', 'content_queue'):
+        bot.db.execute(f"DELETE FROM {table}")
+    bot.db.executemany("INSERT INTO news (title, link, summary, source, posted, added_ts) VALUES (?, ?, '', 'bench', ?, ?)",
+                       [(story_text(i), f'http://bench/{i}/{now}', int(rng.random() < 0.5), rng.randrange(start, now + 1))
+                        for i in range(args.news)])
+    bot.db.executemany("INSERT INTO trend_data (topic, score, velocity, zscore, detected_ts) VALUES (?, ?, 1, 2, ?)",
+                       [(rng.choice(['bitcoin', 'ethereum', 'defi', 'nft']), rng.randrange(3, 50), rng.randrange(start, now + 1))
+                        for _ in range(args.trends)])
+    bot.daily_aggregates.day = None
+
+    tickers = [{'symbol': s, 'price': 1.0, 'change': rng.uniform(-8, 8), 'emoji': '📈'} for s in ('BTC', 'ETH', 'SOL')]
+    bot.get_binance_data = lambda: (time.sleep(args.latency), [dict(t) for t in tickers])[1]
+    bot.record_market_snapshot = lambda: None
+
+    day = bot.today_range()
+    sql = timed(lambda: [bot.db.fetchone(query, day) for query in LEGACY_DAILY_QUERIES], args.repeat)
+    aggregates = timed(bot.daily_aggregates.snapshot, args.repeat)
+
+    rows = [('дневные итоги', f'запросы {sql:.2f} ms -> агрегаты {aggregates:.3f} ms')]
+    for slot, schedule in bot.DAILY_SCHEDULE.items():
+        inline = timed(lambda: bot.generate_daily_content(slot), args.repeat)
+
+        def prerendered():
+            bot.render_rubric(slot)
+            started = time.perf_counter()
+            bot.generate_daily_content(slot)
+            return (time.perf_counter() - started) * 1000
+        cached = sorted(prerendered() for _ in range(args.repeat))[args.repeat // 2]
+        rows.append((f"{slot} {schedule['type']}", f'на месте {inline:7.1f} ms -> из кэша {cached:5.2f} ms '
+                                                   f'(подготовка {bot.RUBRIC_STATS[slot]["render_ms"]} ms заранее)'))
+    report(f"{args.news:,} новостей и {args.trends:,} трендов за сегодня, Binance {args.latency}с", rows)
+
+@benchmark('metrics')
+def bench_metrics(argv):
+    """Накладные расходы metrics.timed: без метрик, с выключенным и включённым реестром"""
+    parser = argparse.ArgumentParser(prog='metrics')
+    parser.add_argument('--calls', type=int, default=1_000_000)
+    args = parser.parse_args(argv)
+
+    def work(x):
+        return x + 1
+
+    async def async_work(x):
+        return x + 1
+
+    def per_call(func):
+        started = time.perf_counter()
+        for i in range(args.calls):
+            func(i)
+        return (time.perf_counter() - started) * 1e9 / args.calls
+
+    def per_call_async(func):
+        async def loop():
+            started = time.perf_counter()
+            for i in range(args.calls // 10):
+                await func(i)
+            return (time.perf_counter() - started) * 1e9 / (args.calls // 10)
+        return asyncio.run(loop())
+
+    enabled, disabled = bot.MetricsRegistry(True), bot.MetricsRegistry(False)
+    rows = []
+    for name, measure, func in (('sync', per_call, work), ('async', per_call_async, async_work)):
+        bare = measure(func)
+        off = measure(disabled.timed('bench_seconds', '')(func))
+        on = measure(enabled.timed(f'bench_{name}_seconds', '')(func))
+        rows.append((name, f'без метрик {bare:5.0f} ns, выключены {off:5.0f} ns, включены {on:5.0f} ns (+{on - bare:.0f} ns)'))
+
+    query = lambda: bot.db.fetchone("SELECT 1")
+    rows.append(('db.fetchone', f'{timed(query, 2000) * 1000:.1f} us с метриками'))
+    for i in range(10_000):
+        bot.SCHEDULER_JOB_SECONDS.labels(f'job{i % 20}').observe(i / 1000)
+    rows.append(('/metrics', f'{timed(bot.metrics_registry.render, 20):.2f} ms, {len(bot.metrics_registry.render()) // 1024} КБ, '
+                             f'{len(bot.metrics_registry.metrics)} метрик'))
+    report(f"{args.calls:,} вызовов", rows)
+
+# ==================== REPLAY ====================
+
+class VirtualClock:
+    """Подмена модуля time в боте: внутри шага время идёт как обычно, advance() сдвигает его скачком.
+    
+    Длительности (perf_counter, разности monotonic) остаются настоящими, а time()/monotonic()
+    видят ускоренные сутки - интервалы опроса, TTL кэшей и слоты рубрик срабатывают как в жизни.
+    """
+
+    def __init__(self, start):
+        self.offset = start - time.time()
+        self.monotonic_offset = 0.0
+
+    def time(self):
+        return time.time() + self.offset
+
+    def monotonic(self):
+        return time.monotonic() + self.monotonic_offset
+
+    def advance(self, seconds):
+        self.offset += seconds
+        self.monotonic_offset += seconds
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+def synthetic_day(feeds, items, shared, start, seed=7):
+    """Записанный день лент: [(published, title, link, summary)] на ленту, по возрастанию времени.
+    
+    Активность лент разная (от тихих до новостных лент с десятками записей в час);
+    доля shared пересказывает общие истории и проверяет кластеризацию дубликатов.
+    """
+    rng = random.Random(seed)
+    weights = [rng.paretovariate(1.5) for _ in range(feeds)]
+    counts = [max(1, round(items * w / sum(weights))) for w in weights]
+    day = []
+    for feed_id, count in enumerate(counts):
+        entries = []
+        for i in range(count):
+            item_rng = random.Random(f'{seed}/{feed_id}/{i}')
+            published = start + int(item_rng.random() * 86400)
+            if item_rng.random() < shared:
+                story = published // 1800
+                title = story_text(('shared', story)) + f' says {feed_id}'
+            else:
+                title = story_text((feed_id, i))
+            summary = '<p>' + ' '.join(story_text((feed_id, i, k), 10) for k in range(4)) + '.</p>'
+            entries.append((published, title, f'http://replay/{feed_id}/item/{i}', summary))
+        day.append(sorted(entries))
+    return day
+
+def recorded_day(directory, start):
+    """Записанные RSS-файлы из папки: файл - лента, время записей растягивается на сутки replay"""
+    day = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(('.xml', '.rss')):
+            continue
+        with open(os.path.join(directory, name), 'rb') as f:
+            entries = bot.parse_feed_entries(f.read(), limit=10 ** 6)
+        stamps = [entry['published'] for entry in entries if entry['published']]
+        if not stamps:
+            continue
+        low, span = min(stamps), max(max(stamps) - min(stamps), 1)
+        day.append(sorted((start + int((entry['published'] - low) / span * 86399), entry['title'], entry['link'],
+                           entry['summary']) for entry in entries if entry['published']))
+    return day
+
+def replay_feed_server(day, clock, window=20):
+    """Лента /feed/<n> на момент clock.time(): последние window записей, ETag и 304 как у настоящих лент"""
+    def handler(request):
+        feed_id = int(urlsplit(request.path).path.rsplit('/', 1)[-1])
+        now = clock.time()
+        entries = day[feed_id]
+        visible = sum(1 for entry in entries if entry[0] <= now)
+        etag = f'"{feed_id}-{visible}"'
+        if request.headers.get('If-None-Match') == etag:
+            return 304, {'ETag': etag}, b''
+        parts = [f'<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel><title>Replay {feed_id}</title>']
+        for published, title, link, summary in reversed(entries[max(0, visible - window):visible]):
+            stamp = time.strftime('%a, %d %b %Y %H:%M:%S +0000', time.gmtime(published))
+            parts.append(f'<item><title>{title}</title><link>{link}</link><guid>{link}</guid>'
+                         f'<pubDate>{stamp}</pubDate><description><![CDATA[{summary}]]></description></item>')
+        parts.append('</channel></rss>')
+        return 200, {'Content-Type': 'application/rss+xml', 'ETag': etag}, ''.join(parts).encode()
+
+    server = StubServer(handler)
+    return server, [f'{server.url}/feed/{i}' for i in range(len(day))]
+
+def translate_server(latency=0.0):
+    """Мок translate_a/single: ответ в формате Google, перевод - префикс языка у каждой строки"""
+    def handler(request):
+        time.sleep(latency)
+        query = parse_qs(urlsplit(request.path).query)
+        lang = query['tl'][0]
+        segments = [[f'[{lang}] {line}\n', line] for line in query['q'][0].split('\n')]
+        segments[-1][0] = segments[-1][0].rstrip('\n')
+        return 200, {'Content-Type': 'application/json'}, json.dumps([segments]).encode()
+
+    return StubServer(handler)
+
+def git_revision():
+    """Короткий хеш коммита - чтобы результаты разных версий можно было сопоставить"""
+    try:
+        import subprocess
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+@benchmark('replay')
+def bench_replay(argv):
+    """Сутки трафика через весь конвейер на локальных моках с ускоренным временем, итог в JSON"""
+    parser = argparse.ArgumentParser(prog='replay')
+    parser.add_argument('--feeds', type=int, default=12)
+    parser.add_argument('--items', type=int, default=2000, help='записей во всех лентах за сутки')
+    parser.add_argument('--shared', type=float, default=0.15, help='доля пересказов общих историй')
+    parser.add_argument('--recorded', help='папка с записанными RSS (*.xml) вместо синтетических лент')
+    parser.add_argument('--channels', default='ru,en', help='языки каналов через запятую')
+    parser.add_argument('--hours', type=float, default=24)
+    parser.add_argument('--step', type=int, default=60, help='шаг виртуального времени, секунд')
+    parser.add_argument('--latency', type=float, default=0.005, help='задержка моков лент, перевода и Binance')
+    parser.add_argument('--output', default=os.path.join(BENCH_DIR, 'replay.json'), help='JSON с итогом (по умолчанию во временной папке)')
+    parser.add_argument('--compare', help='прошлый JSON для сравнения')
+    parser.add_argument('--log-level', default='WARNING', help='уровень логов бота на время прогона')
+    args = parser.parse_args(argv)
+
+    start = (int(time.time()) // 86400 - 1) * 86400
+    clock = VirtualClock(start)
+    day = recorded_day(args.recorded, start) if args.recorded else synthetic_day(args.feeds, args.items, args.shared, start)
+
+    feeds, urls = replay_feed_server(day, clock)
+    translate = translate_server(args.latency)
+    binance = binance_server(args.latency)
+    api = FakeBotAPI(limit=1000, error_rate=0)
+
+    real_time = bot.time
+    bot.time = clock
+    bot.logger.setLevel(args.log_level.upper())
+    bot.NEWS_SOURCES = {f'replay{i}': url for i, url in enumerate(urls)}
+    bot.TREND_SOURCES = {'social': urls[:3]}
+    bot.SOURCE_STATE.clear()
+    backend = bot.GoogleTranslateBackend()
+    backend.url = f'{translate.url}/translate_a/single'
+    bot.translator = bot.Translator(backend)
+    bot.market_data = bot.MarketData(binance.url, bot.BINANCE_SYMBOLS, bot.BINANCE_CACHE_TTL)
+    bot.telegram_bot = bot.Bot(token='123:replay', base_url=f'{api.url}/bot', request=bot.HTTPXRequest(connection_pool_size=8))
+    bot.CHANNELS = [bot.Channel(str(-1002000000000 - i), lang) for i, lang in enumerate(args.channels.split(','))]
+
+    outbox = None
+    stages = {}
+    counts = {'ingested': 0, 'rubrics': 0, 'enqueued': 0, 'sent': 0}
+
+    async def stage(name, func, *func_args):
+        started = time.perf_counter()
+        try:
+            result = func(*func_args)
+            if asyncio.iscoroutine(result):
+                result = await result
+        finally:
+            stages.setdefault(name, []).append((time.perf_counter() - started) * 1000)
+        return result
+
+    async def deliver():
+        rows = await bot.run_blocking(bot.db.transaction, lambda conn: outbox.claim(conn, int(clock.time()), bot.DELIVERY_BATCH))
+        for row in rows:
+            if await stage('deliver', outbox.deliver, row) == 'sent':
+                counts['sent'] += 1
+
+    slots = {}
+    for slot in bot.DAILY_SCHEDULE:
+        hour, minute = map(int, slot.split(':'))
+        slots[(hour * 60 + minute) * 60] = ('generate_daily_content', slot)
+        hour, minute = map(int, bot.prerender_slot(slot).split(':'))
+        slots[(hour * 60 + minute) * 60] = ('render_rubric', slot)
+
+    async def replay():
+        nonlocal outbox
+        outbox = bot.Outbox()
+        await bot.run_blocking(bot.db.transaction, bot.publish_queue.load)
+        for offset in range(0, int(args.hours * 3600), args.step):
+            if offset:
+                clock.advance(args.step)
+            if offset % bot.SOURCE_CHECK_SECONDS < args.step:
+                counts['ingested'] += await stage('parse_news', bot.parse_news)
+            if offset % bot.TREND_INTERVAL_SECONDS < args.step:
+                await stage('analyze_trends', bot.analyze_trends)
+            if offset % bot.MARKET_SNAPSHOT_SECONDS < args.step:
+                await stage('record_market_snapshot', bot.run_blocking, bot.record_market_snapshot)
+            for due in range(offset, offset + args.step, 60):
+                if due in slots:
+                    name, slot = slots[due]
+                    await stage(name, bot.run_blocking, getattr(bot, name), slot)
+                    counts['rubrics'] += name == 'generate_daily_content'
+            if offset % bot.PUBLISH_INTERVAL_SECONDS < args.step:
+                if await stage('enqueue_next_content', bot.run_blocking, bot.enqueue_next_content):
+                    counts['enqueued'] += 1
+            await deliver()
+            if offset % bot.RETENTION_INTERVAL_SECONDS < args.step and offset:
+                await stage('run_retention', bot.run_retention)
+
+    started = time.perf_counter()
+    try:
+        asyncio.run(replay())
+    finally:
+        bot.time = real_time
+        for server in (feeds, translate, binance, api):
+            server.close()
+    wall = time.perf_counter() - started
+
+    db_size = bot.db.scalar("PRAGMA page_count") * bot.db.scalar("PRAGMA page_size")
+    wal = bot.DB_PATH + '-wal'
+    result = {
+        'revision': git_revision(),
+        'params': {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'log_level')},
+        'virtual_seconds': int(args.hours * 3600),
+        'wall_seconds': round(wall, 2),
+        # Записи, опубликованные в пределах прогона: при --hours меньше суток остальные лента не покажет
+        'counts': {**counts, 'feed_items': sum(entry[0] < start + args.hours * 3600 for entries in day for entry in entries),
+                   'duplicates': bot.INGEST_STATS['total_duplicates'], 'trends': bot.daily_aggregates.trends},
+        'throughput': {'items_per_sec': round(counts['ingested'] / wall, 2),
+                       'messages_per_sec': round(counts['sent'] / wall, 2),
+                       'speedup': round(args.hours * 3600 / wall, 1)},
+        'stages': {name: {'calls': len(samples), 'p50_ms': round(percentile(samples, 50), 3),
+                          'p99_ms': round(percentile(samples, 99), 3), 'total_ms': round(sum(samples), 1)}
+                   for name, samples in stages.items()},
+        'metrics': {name: {'count': metric.count, 'p50_ms': round(metric.quantile(0.5) * 1000, 3),
+                           'p99_ms': round(metric.quantile(0.99) * 1000, 3)}
+                    for name, metric in bot.metrics_registry.metrics.items()
+                    if metric.kind == 'histogram' and not metric.labelnames and metric.count},
+        'db': {'size_bytes': db_size, 'wal_bytes': os.path.getsize(wal) if os.path.exists(wal) else 0,
+               'news': bot.db.count("SELECT COUNT(*) FROM news")},
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)
+
+    def versus(name, key):
+        old = (previous or {}).get('stages', {}).get(name, {}).get(key)
+        return f' (было {old})' if old is not None else ''
+
+    rows = [
+        ('прогон', f"{wall:.1f}s (x{result['throughput']['speedup']})"),
+        ('ленты', f"{result['counts']['feed_items']} записей -> {counts['ingested']} историй, "
+                  f"{result['counts']['duplicates']} дубликатов, {result['throughput']['items_per_sec']} историй/с"),
+        ('публикация', f"{counts['enqueued']} постов, {counts['rubrics']} рубрик, {counts['sent']} сообщений"),
+    ]
+    for name, summary in result['stages'].items():
+        rows.append((name, f"{summary['calls']:5} вызовов, p50 {summary['p50_ms']:8.2f}{versus(name, 'p50_ms')} / "
+                           f"p99 {summary['p99_ms']:8.2f}{versus(name, 'p99_ms')} ms"))
+    rows.append(('база', f"{db_size / 2**20:.1f} MB, WAL {result['db']['wal_bytes'] / 2**20:.1f} MB"))
+    rows.append(('результат', os.path.abspath(args.output)))
+    report(f"Replay {args.hours:g} ч: {len(day)} лент, каналы {args.channels}, ревизия {result['revision']}", rows)
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] in ('-h', '--help', '--list'):
+        print(__doc__)
+        for name, func in BENCHMARKS.items():
+            print(f"  {name:<12} {func.__doc__}")
+        return
+
+    name = sys.argv[1]
+    if name not in BENCHMARKS:
+        sys.exit(f"Неизвестный бенчмарк: {name}")
+    BENCHMARKS[name](sys.argv[2:])
+
+if __name__ == '__main__':
+    main()
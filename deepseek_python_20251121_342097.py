@@ -1,36 +1,556 @@
+import abc
 import os
 import requests
 import feedparser
+import httpx
 import sqlite3
 import time
+import math
+import calendar
+import bisect
+import hashlib
+import json
+import gzip
+import zlib
 import asyncio
 import threading
+import queue
+import heapq
+import itertools
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial, wraps
 from datetime import datetime, timedelta
 from telegram import Bot, Update, Poll, PollOption
 from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+from telegram.request import HTTPXRequest
 import logging
 import random
 import re
+from html import unescape
+from email.utils import parsedate_tz, mktime_tz
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import xml.etree.ElementTree as ET
+import numpy as np
+import websockets
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
+# Настройка логирования: LOG_FORMAT=json - по строке JSON на запись, с полями из extra
+class JsonFormatter(logging.Formatter):
+    """Запись лога одной строкой JSON: время, уровень, сообщение и поля extra (event, секунды, счётчики)"""
+    RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+    
+    def format(self, record):
+        entry = {'ts': round(record.created, 3), 'level': record.levelname.lower(), 'logger': record.name,
+                 'msg': record.getMessage()}
+        entry.update((key, value) for key, value in vars(record).items() if key not in self.RESERVED)
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+log_handler = logging.StreamHandler()
+log_handler.setFormatter(JsonFormatter() if os.environ.get('LOG_FORMAT') == 'json'
+                         else logging.Formatter('%(asctime)s %(levelname)s %(message)s', '%H:%M:%S'))
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper(), handlers=[log_handler])
 logger = logging.getLogger(__name__)
+# httpx пишет в INFO каждый запрос к лентам, websockets - каждое подключение
+logging.getLogger('httpx').setLevel(logging.WARNING)
+logging.getLogger('websockets').setLevel(logging.WARNING)
 
-print("🚀 Запускаем PREMIUM Crypto News Bot в облаке...")
+logger.info("🚀 Запускаем PREMIUM Crypto News Bot в облаке...")
 
 # НАСТРОЙКИ ИЗ ПЕРЕМЕННЫХ СРЕДЫ
 BOT_TOKEN = os.environ.get('BOT_TOKEN', "8599887340:AAFD4PiLa8QDl5yPlazqWWNcgkTEef9DH8w")
 CHANNEL_ID = os.environ.get('CHANNEL_ID', "-1003231543135")
+# Рассылка из одной очереди в несколько каналов: CHANNEL_IDS=-100111,-100222
+CHANNEL_IDS = [c.strip() for c in os.environ.get('CHANNEL_IDS', CHANNEL_ID).split(',') if c.strip()]
+# Реестр каналов с языком, фильтрами и темпом (JSON); без файла - CHANNEL_IDS на русском
+CHANNELS_PATH = os.environ.get('CHANNELS_PATH')
+DEFAULT_LANGUAGE = 'ru'
+RENDER_CACHE_SIZE = 1000
+# Адрес Bot API (локальный сервер или мок для тестов)
+TELEGRAM_BASE_URL = os.environ.get('TELEGRAM_BASE_URL', 'https://api.telegram.org/bot')
 
 # Для Railway - используем их файловую систему
-DB_PATH = '/data/crypto_premium.db' if 'RAILWAY_VOLUME_MOUNT_PATH' in os.environ else 'crypto_premium.db'
+DB_PATH = os.environ.get('DB_PATH') or ('/data/crypto_premium.db' if 'RAILWAY_VOLUME_MOUNT_PATH' in os.environ else 'crypto_premium.db')
 
-def init_db():
-    # Создаем папку для данных если нужно
-    if '/data' in DB_PATH:
-        os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+# Загрузка RSS: таймаут на источник и общий лимит одновременных запросов
+FEED_FETCH_TIMEOUT = float(os.environ.get('FEED_FETCH_TIMEOUT', 15))
+FEED_FETCH_CONCURRENCY = int(os.environ.get('FEED_FETCH_CONCURRENCY', 8))
+FEED_USER_AGENT = 'Mozilla/5.0 (compatible; CryptoNewsBot/1.0)'
+
+# Кэш лент: в пределах TTL повторно не скачиваем (общий для новостей и трендов)
+FEED_CACHE_TTL = int(os.environ.get('FEED_CACHE_TTL', 300))
+FEED_CACHE_MAX_ENTRIES = 50
+
+# Перевод: бэкенд (google/fake), размер LRU и срок жизни переводов в базе
+TRANSLATE_BACKEND = os.environ.get('TRANSLATE_BACKEND', 'google')
+TRANSLATE_TIMEOUT = float(os.environ.get('TRANSLATE_TIMEOUT', 10))
+TRANSLATION_CACHE_SIZE = int(os.environ.get('TRANSLATION_CACHE_SIZE', 5000))
+TRANSLATION_TTL_DAYS = int(os.environ.get('TRANSLATION_TTL_DAYS', 30))
+
+# Trend Radar: корзины по 5 минут за сутки, скорость считаем за окно в 2 часа
+TREND_BUCKET_SECONDS = 300
+TREND_WINDOW_HOURS = 24
+TREND_VELOCITY_HOURS = 2
+TREND_MIN_VELOCITY = float(os.environ.get('TREND_MIN_VELOCITY', 1.5))
+TREND_MIN_ZSCORE = float(os.environ.get('TREND_MIN_ZSCORE', 2.0))
+
+# Binance: адрес API (можно подменить локальным моком), список пар и TTL общего кэша
+BINANCE_API_URL = os.environ.get('BINANCE_API_URL', 'https://api.binance.com')
+BINANCE_SYMBOLS = [s.strip().upper() for s in os.environ.get(
+    'BINANCE_SYMBOLS', 'BTCUSDT,ETHUSDT,ADAUSDT,JASMYUSDT,SOLUSDT').split(',') if s.strip()]
+BINANCE_CACHE_TTL = int(os.environ.get('BINANCE_CACHE_TTL', 60))
+
+# История тикеров: минутные снимки в дневных memmap-сегментах, хранится MARKET_HISTORY_DAYS дней
+MARKET_HISTORY_DIR = os.environ.get('MARKET_HISTORY_DIR') or os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), 'market')
+MARKET_SNAPSHOT_SECONDS = 60
+MARKET_HISTORY_DAYS = int(os.environ.get('MARKET_HISTORY_DAYS', 365))
+
+# Поток цен Binance WebSocket: алерт при движении на PRICE_ALERT_PERCENT за окно
+BINANCE_WS_URL = os.environ.get('BINANCE_WS_URL', 'wss://stream.binance.com:9443')
+PRICE_STREAM_ENABLED = os.environ.get('PRICE_STREAM_ENABLED', '1') == '1'
+PRICE_HISTORY_MINUTES = 24 * 60
+PRICE_ALERT_PERCENT = float(os.environ.get('PRICE_ALERT_PERCENT', 5))
+PRICE_ALERT_WINDOW_MINUTES = int(os.environ.get('PRICE_ALERT_WINDOW_MINUTES', 60))
+PRICE_ALERT_COOLDOWN_MINUTES = int(os.environ.get('PRICE_ALERT_COOLDOWN_MINUTES', 120))
+PRICE_NIGHT_MINUTES = 8 * 60
+
+# Планировщик: интервалы ингестии, трендов и публикации; опоздавшую рубрику
+# догоняем, если с её времени прошло не больше SCHEDULE_MISFIRE_GRACE секунд
+NEWS_INTERVAL_SECONDS = int(os.environ.get('NEWS_INTERVAL_SECONDS', 600))
+TREND_INTERVAL_SECONDS = int(os.environ.get('TREND_INTERVAL_SECONDS', 7200))
+PUBLISH_INTERVAL_SECONDS = int(os.environ.get('PUBLISH_INTERVAL_SECONDS', 60))
+SCHEDULE_MISFIRE_GRACE = int(os.environ.get('SCHEDULE_MISFIRE_GRACE', 3 * 3600))
+# Рубрики готовятся за RUBRIC_PRERENDER_SECONDS до слота; в слот публикуется готовый текст,
+# если он не старше RUBRIC_MAX_AGE_SECONDS, иначе рубрика генерируется на месте
+RUBRIC_PRERENDER_SECONDS = int(os.environ.get('RUBRIC_PRERENDER_SECONDS', 300))
+RUBRIC_MAX_AGE_SECONDS = 2 * RUBRIC_PRERENDER_SECONDS
+
+# Адаптивный опрос источников: NEWS_INTERVAL_SECONDS - стартовый интервал ленты;
+# активные ленты опрашиваем чаще (до SOURCE_MIN_POLL_SECONDS), молчащие и сбоящие -
+# реже (до SOURCE_MAX_POLL_SECONDS). Ингестия проверяет, кому пора, раз в SOURCE_CHECK_SECONDS
+SOURCE_MIN_POLL_SECONDS = int(os.environ.get('SOURCE_MIN_POLL_SECONDS', FEED_CACHE_TTL))
+SOURCE_MAX_POLL_SECONDS = int(os.environ.get('SOURCE_MAX_POLL_SECONDS', 1800))
+SOURCE_POLL_BACKOFF = 1.25
+# Пока пустых опросов подряд меньше SOURCE_IDLE_POLLS, интервал не растёт выше SOURCE_BUSY_MAX_POLL_SECONDS:
+# одна-две пустые проверки у активной ленты - не повод опрашивать её раз в полчаса
+SOURCE_IDLE_POLLS = 12
+SOURCE_BUSY_MAX_POLL_SECONDS = NEWS_INTERVAL_SECONDS * 3 // 2
+SOURCE_CHECK_SECONDS = 60
+
+# Сколько свежих записей каждой ленты рассматривать за цикл ингестии
+NEWS_ENTRIES_PER_SOURCE = int(os.environ.get('NEWS_ENTRIES_PER_SOURCE', 20))
+
+# Bloom-фильтр ссылок перед запросом в базу: ёмкость, доля ложных срабатываний и потолок памяти
+LINK_FILTER_PATH = os.environ.get('LINK_FILTER_PATH') or DB_PATH + '.links.npz'
+LINK_FILTER_CAPACITY = int(os.environ.get('LINK_FILTER_CAPACITY', 1_000_000))
+LINK_FILTER_FP_RATE = float(os.environ.get('LINK_FILTER_FP_RATE', 0.01))
+LINK_FILTER_MAX_MB = float(os.environ.get('LINK_FILTER_MAX_MB', 64))
+
+# Кластеризация одинаковых историй из разных источников (MinHash + LSH)
+STORY_MINHASH_BANDS = 12
+STORY_MINHASH_ROWS = 3
+STORY_SIMILARITY = float(os.environ.get('STORY_SIMILARITY', 0.5))
+
+# Словарь тикеров, проектов и синонимов для трендов, типов контента и хештегов
+TERMS_PATH = os.environ.get('TERMS_PATH') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'crypto_terms.json')
+
+# Доставка в Telegram: ~20 сообщений в минуту на канал и 30 в секунду на бота,
+# повторы с экспоненциальной паузой до DELIVERY_MAX_ATTEMPTS попыток
+DELIVERY_CHAT_RATE = float(os.environ.get('DELIVERY_CHAT_RATE', 20 / 60))
+DELIVERY_CHAT_BURST = int(os.environ.get('DELIVERY_CHAT_BURST', 3))
+DELIVERY_GLOBAL_RATE = float(os.environ.get('DELIVERY_GLOBAL_RATE', 30))
+DELIVERY_MAX_ATTEMPTS = int(os.environ.get('DELIVERY_MAX_ATTEMPTS', 8))
+DELIVERY_BACKOFF_SECONDS = 5
+DELIVERY_MAX_BACKOFF_SECONDS = 3600
+DELIVERY_BATCH = 50
+
+# Хранение: сроки жизни строк (дни), размер пачки удаления и папка архива новостей.
+# Старые новости уходят в news-ГГГГ-ММ.jsonl.gz, старые тренды - в дневные агрегаты
+NEWS_RETENTION_DAYS = int(os.environ.get('NEWS_RETENTION_DAYS', 90))
+TREND_RETENTION_DAYS = int(os.environ.get('TREND_RETENTION_DAYS', 14))
+QUEUE_RETENTION_DAYS = int(os.environ.get('QUEUE_RETENTION_DAYS', 7))
+OUTBOX_RETENTION_DAYS = int(os.environ.get('OUTBOX_RETENTION_DAYS', 7))
+RETENTION_INTERVAL_SECONDS = int(os.environ.get('RETENTION_INTERVAL_SECONDS', 3600))
+RETENTION_BATCH = 1000
+# Страниц, возвращаемых ОС за один проход incremental_vacuum (по 4 КБ)
+RETENTION_VACUUM_PAGES = 2000
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR') or os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), 'archive')
+
+# Метрики: счётчики и гистограммы задержек; METRICS_PORT > 0 включает локальный HTTP /metrics
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+METRICS_HOST = os.environ.get('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 0))
+
+# Пул для блокирующих вызовов (SQLite, requests) из event loop бота
+BLOCKING_WORKERS = int(os.environ.get('BLOCKING_WORKERS', 8))
+
+# Приоритет публикации по типу контента (меньше - раньше)
+CONTENT_PRIORITY = {
+    'breaking': 1,
+    'warning': 2,
+    'analysis': 3,
+}
+DEFAULT_PRIORITY = 4
+
+# Очередь публикации в памяти: вес новости по типу, бонус за текущий тренд
+# (QUEUE_TREND_WEIGHT * ln(1 + z-score)) и свежесть - вдвое за QUEUE_FRESHNESS_HALFLIFE секунд
+QUEUE_FRESHNESS_HALFLIFE = int(os.environ.get('QUEUE_FRESHNESS_HALFLIFE', 7200))
+QUEUE_TREND_WEIGHT = float(os.environ.get('QUEUE_TREND_WEIGHT', 0.5))
+# Сколько новостей за один выбор можно отложить до cadence каналов, прежде чем сдаться
+QUEUE_MAX_DEFERRED = int(os.environ.get('QUEUE_MAX_DEFERRED', 256))
+# Рубрики, дошедшие до срока: сначала алерты, остальные - по времени
+SCHEDULED_PRIORITY = {
+    'price_alert': 0,
+    'trend_alert': 1,
+}
+DEFAULT_SCHEDULED_PRIORITY = 2
+
+# ==================== BLOCKING I/O ====================
+
+# Бот, планировщик и поток цен живут в одном event loop; всё блокирующее - сюда
+BLOCKING_POOL = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix='blocking')
+
+async def run_blocking(func, *args):
+    """Выполняет блокирующую функцию в ограниченном пуле, не останавливая event loop"""
+    return await asyncio.get_running_loop().run_in_executor(BLOCKING_POOL, partial(func, *args))
+
+# ==================== METRICS ====================
+
+# Границы корзин гистограмм задержек, секунды: от 0.5 мс до 1 минуты
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+class Counter:
+    """Счётчик в формате Prometheus; labels(...) - дочерний счётчик с метками"""
+    kind = 'counter'
+    
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        self._lock = threading.Lock()
+        self.value = 0.0
+    
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            with self._lock:
+                child = self.children.setdefault(values, self._child())
+        return child
+    
+    def _child(self):
+        return Counter(self.name, self.documentation)
+    
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+    
+    def _series(self):
+        """(метки, метрика) - сама метрика или все дочерние"""
+        if not self.labelnames:
+            return [('', self)]
+        return [(','.join(f'{name}="{value}"' for name, value in zip(self.labelnames, values)), child)
+                for values, child in sorted(self.children.items())]
+    
+    def samples(self):
+        """Строки экспозиции Prometheus: (имя с метками, значение)"""
+        for labels, metric in self._series():
+            yield f'{self.name}{{{labels}}}' if labels else self.name, metric.value
+
+class Histogram(Counter):
+    """Гистограмма с фиксированными корзинами; quantile() - оценка по корзинам для /stats"""
+    kind = 'histogram'
+    
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+    
+    def _child(self):
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+    
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+    
+    def quantile(self, q):
+        """Квантиль q (0..1): линейно внутри корзины, последняя корзина - её нижняя граница"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+    
+    def samples(self):
+        for labels, metric in self._series():
+            prefix = f'{labels},' if labels else ''
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), metric.counts):
+                cumulative += count
+                yield f'{self.name}_bucket{{{prefix}le="{bound}"}}', cumulative
+            suffix = f'{{{labels}}}' if labels else ''
+            yield f'{self.name}_sum{suffix}', metric.sum
+            yield f'{self.name}_count{suffix}', metric.count
+
+class NullMetric:
+    """Заглушка выключенных метрик: те же методы, ничего не делают"""
+    count = 0
+    
+    def labels(self, *values):
+        return self
+    
+    def inc(self, amount=1):
+        pass
+    
+    def observe(self, value):
+        pass
+    
+    def quantile(self, q):
+        return None
+
+NULL_METRIC = NullMetric()
+
+class MetricsRegistry:
+    """Реестр счётчиков и гистограмм: экспозиция /metrics и сводка задержек для /stats.
+    
+    Выключенный реестр (METRICS_ENABLED=0) отдаёт NullMetric, а timed() возвращает
+    функцию как есть - на горячем пути не остаётся даже обёртки.
+    """
+    
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.metrics = {}
+    
+    def _get(self, cls, name, documentation, labelnames=(), **kwargs):
+        if not self.enabled:
+            return NULL_METRIC
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, documentation, labelnames, **kwargs)
+        return metric
+    
+    def counter(self, name, documentation, labelnames=()):
+        return self._get(Counter, name, documentation, labelnames)
+    
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, documentation, labelnames, buckets=buckets)
+    
+    def timed(self, name, documentation):
+        """Декоратор: длительность вызова в гистограмму name (секунды), для обычных и async-функций"""
+        def decorate(func):
+            if not self.enabled:
+                return func
+            histogram = self.histogram(name, documentation)
+            if asyncio.iscoroutinefunction(func):
+                @wraps(func)
+                async def wrapper(*args, **kwargs):
+                    started = time.perf_counter()
+                    try:
+                        return await func(*args, **kwargs)
+                    finally:
+                        histogram.observe(time.perf_counter() - started)
+            else:
+                @wraps(func)
+                def wrapper(*args, **kwargs):
+                    started = time.perf_counter()
+                    try:
+                        return func(*args, **kwargs)
+                    finally:
+                        histogram.observe(time.perf_counter() - started)
+            return wrapper
+        return decorate
+    
+    def render(self):
+        """Текстовый формат экспозиции Prometheus 0.0.4"""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(f'{name} {value:g}' for name, value in metric.samples())
+        return '\n'.join(lines) + '\n'
+    
+    def latency_summary(self):
+        """Строки для /stats: p50/p99 и число вызовов по гистограммам без меток"""
+        lines = []
+        for metric in self.metrics.values():
+            if metric.kind == 'histogram' and not metric.labelnames and metric.count:
+                lines.append(f"• {metric.name.removesuffix('_seconds')}: p50 {metric.quantile(0.5) * 1000:.1f} мс, "
+                             f"p99 {metric.quantile(0.99) * 1000:.1f} мс, вызовов {metric.count}")
+        return lines
+
+metrics_registry = MetricsRegistry(METRICS_ENABLED)
+
+async def serve_metrics(host=METRICS_HOST, port=METRICS_PORT):
+    """Локальный HTTP /metrics для Prometheus в event loop бота - без зависимостей"""
+    async def handle(reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), 5)
+            path = request.split(b' ', 2)[1] if request.count(b' ') >= 2 else b''
+            if path.split(b'?')[0] == b'/metrics':
+                status, body = '200 OK', metrics_registry.render().encode()
+            else:
+                status, body = '404 Not Found', b'not found\n'
+            writer.write(f'HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                         f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+    
+    server = await asyncio.start_server(handle, host, port)
+    logger.info(f"📈 Метрики: http://{host}:{port}/metrics", extra={'event': 'metrics_server', 'port': port})
+    async with server:
+        await server.serve_forever()
+
+# ==================== LINKS ====================
+
+# Параметры отслеживания: на саму статью не влияют, но делают ссылки разными
+TRACKING_PARAMS = {'fbclid', 'gclid', 'yclid', 'mc_cid', 'mc_eid', 'ref', 'ref_src', 'cmpid', 'guccounter'}
+
+def canonical_url(link):
+    """Ссылка без трекинговых параметров, фрагмента, www и завершающего слэша"""
+    parts = urlsplit(link.strip())
+    host = (parts.hostname or '').removeprefix('www.')
+    if parts.port and parts.port not in (80, 443):
+        host += f':{parts.port}'
+    query = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if not key.lower().startswith('utm_') and key.lower() not in TRACKING_PARAMS)
+    # http и https - одна и та же статья
+    scheme = 'https' if parts.scheme in ('http', 'https') else parts.scheme
+    return urlunsplit((scheme, host, parts.path.rstrip('/') or '/', urlencode(query), ''))
+
+def link_hash(link):
+    """64-битный хэш канонической ссылки (со знаком - помещается в INTEGER SQLite)"""
+    digest = hashlib.blake2b(canonical_url(link).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+# ==================== DATABASE ====================
+
+class Database:
+    """Долгоживущие соединения SQLite: один писатель в своём потоке и пул читателей.
+    
+    Все записи идут через очередь писателя, поэтому поток постера и бот команд
+    никогда не пишут одновременно и не ловят 'database is locked'.
+    """
     
-    conn = sqlite3.connect(DB_PATH)
+    def __init__(self, path, readers=4):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        
+        self._writes = queue.Queue()
+        self._readers = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name='db-writer', daemon=True)
+        
+        # Писатель первым включает WAL, читатели подключаются уже к нему
+        ready = Future()
+        self._writes.put((lambda conn: None, ready))
+        self._writer.start()
+        ready.result()
+        for _ in range(readers):
+            self._readers.put(self._connect())
+    
+    def _connect(self):
+        # cached_statements: повторные запросы не компилируются заново
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        # До WAL: на новой базе вступает в силу сразу, старую переводит разовый VACUUM (см. vacuum_step)
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=30000')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA cache_size=-16000')
+        return conn
+    
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            func, future = self._writes.get()
+            if func is None:
+                break
+            try:
+                with conn:
+                    result = func(conn)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+        conn.close()
+        future.set_result(None)
+    
+    @metrics_registry.timed('db_transaction_seconds', 'Транзакция писателя: ожидание очереди и выполнение')
+    def transaction(self, func):
+        """Выполняем func(conn) в транзакции писателя и ждём результат"""
+        if threading.current_thread() is self._writer:
+            raise RuntimeError("Вложенная транзакция из потока писателя")
+        future = Future()
+        self._writes.put((func, future))
+        return future.result()
+    
+    def execute(self, sql, params=()) -> int:
+        """Запись одним запросом, возвращает lastrowid"""
+        return self.transaction(lambda conn: conn.execute(sql, params).lastrowid)
+    
+    def executemany(self, sql, rows) -> int:
+        """Пакетная запись, возвращает число затронутых строк"""
+        return self.transaction(lambda conn: conn.executemany(sql, rows).rowcount)
+    
+    @metrics_registry.timed('db_query_seconds', 'Чтение через соединение-читатель')
+    def fetchall(self, sql, params=()) -> list:
+        conn = self._readers.get()
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            self._readers.put(conn)
+    
+    @metrics_registry.timed('db_query_seconds', 'Чтение через соединение-читатель')
+    def fetchone(self, sql, params=()):
+        conn = self._readers.get()
+        try:
+            return conn.execute(sql, params).fetchone()
+        finally:
+            self._readers.put(conn)
+    
+    def scalar(self, sql, params=(), default=None):
+        """Первое поле первой строки"""
+        row = self.fetchone(sql, params)
+        return row[0] if row is not None else default
+    
+    def count(self, sql, params=()) -> int:
+        return int(self.scalar(sql, params, 0) or 0)
+    
+    def exists(self, sql, params=()) -> bool:
+        return self.fetchone(sql, params) is not None
+    
+    def close(self):
+        future = Future()
+        self._writes.put((None, future))
+        future.result()
+        while not self._readers.empty():
+            self._readers.get().close()
+
+db = Database(DB_PATH)
+
+# ==================== MIGRATIONS ====================
+
+def migrate_initial_schema(conn):
+    """Исходные таблицы (IF NOT EXISTS - базы до миграций уже их содержат)"""
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -67,6 +587,26 @@ def init_db():
         )
     ''')
     
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS feed_cache (
+            url TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            entries TEXT NOT NULL,
+            size INTEGER DEFAULT 0,
+            fetched_at REAL NOT NULL
+        )
+    ''')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS translations (
+            hash TEXT PRIMARY KEY,
+            lang TEXT NOT NULL,
+            translated TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+    ''')
+    
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS stats (
             date TEXT PRIMARY KEY,
@@ -74,75 +614,742 @@ def init_db():
             trends_detected INTEGER DEFAULT 0
         )
     ''')
+
+def migrate_priority_and_indexes(conn):
+    """Числовой приоритет, целочисленные UTC-метки времени и частичные индексы"""
+    conn.execute("ALTER TABLE news ADD COLUMN priority INTEGER NOT NULL DEFAULT 4")
+    conn.execute(f'''
+        UPDATE news SET priority = CASE content_type
+            {' '.join(f"WHEN '{t}' THEN {p}" for t, p in CONTENT_PRIORITY.items())}
+            ELSE {DEFAULT_PRIORITY}
+        END
+    ''')
     
-    conn.commit()
-    conn.close()
+    # Старые TIMESTAMP-колонки остаются, запросы переходят на *_ts
+    conn.execute("ALTER TABLE news ADD COLUMN added_ts INTEGER")
+    conn.execute("UPDATE news SET added_ts = CAST(strftime('%s', added_date) AS INTEGER)")
+    conn.execute("ALTER TABLE trend_data ADD COLUMN detected_ts INTEGER")
+    conn.execute("UPDATE trend_data SET detected_ts = CAST(strftime('%s', detected_date) AS INTEGER)")
+    # scheduled_time писался как локальное datetime.now()
+    conn.execute("ALTER TABLE content_queue ADD COLUMN scheduled_ts INTEGER")
+    conn.execute("UPDATE content_queue SET scheduled_ts = CAST(strftime('%s', scheduled_time, 'utc') AS INTEGER)")
+    
+    conn.execute("UPDATE news SET posted = 0 WHERE posted IS NULL")
+    conn.execute("UPDATE content_queue SET posted = 0 WHERE posted IS NULL")
+    
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_news_unposted ON news(priority, added_ts) WHERE posted = 0")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_news_added_ts ON news(added_ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_queue_due ON content_queue(scheduled_ts) WHERE posted = 0")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_trend_detected_ts ON trend_data(detected_ts)")
+
+def migrate_trend_metrics(conn):
+    """Ускорение и z-score тренда рядом со скоростью"""
+    conn.execute("ALTER TABLE trend_data ADD COLUMN acceleration REAL DEFAULT 0")
+    conn.execute("ALTER TABLE trend_data ADD COLUMN zscore REAL DEFAULT 0")
+
+def migrate_news_tags(conn):
+    """Темы новости, найденные при ингестии, - для хештегов без повторного поиска"""
+    conn.execute("ALTER TABLE news ADD COLUMN tags TEXT")
+
+def migrate_story_clusters(conn):
+    """Подписи историй для LSH-индекса; дубликаты ссылаются на представителя кластера"""
+    conn.execute("ALTER TABLE news ADD COLUMN duplicate_of INTEGER")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS story_signatures (
+            cluster_id INTEGER PRIMARY KEY,
+            signature BLOB NOT NULL
+        )
+    ''')
+    # Дубликаты в очередь публикации не попадают
+    conn.execute("DROP INDEX IF EXISTS idx_news_unposted")
+    conn.execute("CREATE INDEX idx_news_unposted ON news(priority, added_ts) WHERE posted = 0 AND duplicate_of IS NULL")
+
+def migrate_scheduler_jobs(conn):
+    """Время последнего запуска задач планировщика - для догона после рестарта"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS scheduler_jobs (
+            name TEXT PRIMARY KEY,
+            last_run_ts INTEGER NOT NULL
+        )
+    ''')
+
+def migrate_outbox(conn):
+    """Очередь доставки: одна строка на сообщение в канал, статусы pending -> sending -> sent/failed"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id TEXT NOT NULL,
+            content_type TEXT,
+            text TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_ts INTEGER NOT NULL,
+            created_ts INTEGER NOT NULL,
+            sent_ts INTEGER,
+            message_id INTEGER,
+            last_error TEXT
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(next_attempt_ts) WHERE status = 'pending'")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_chat ON outbox(chat_id, id) WHERE status = 'pending'")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_status ON outbox(status, sent_ts)")
+
+def migrate_title_original(conn):
+    """Заголовок на языке источника - для перевода на языки других каналов"""
+    conn.execute("ALTER TABLE news ADD COLUMN title_original TEXT")
+
+def migrate_sources(conn):
+    """Состояние источников: время самой свежей разобранной записи (high-water mark)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sources (
+            url TEXT PRIMARY KEY,
+            high_water_ts INTEGER
+        )
+    ''')
+
+def migrate_source_state(conn):
+    """Состояние опроса источников и хэш канонической ссылки новости для дедупликации"""
+    for column in ('last_guid TEXT', 'last_fetch_ts INTEGER', 'fetch_ms REAL', 'fetches INTEGER DEFAULT 0',
+                   'errors INTEGER DEFAULT 0', 'new_items INTEGER DEFAULT 0', 'poll_interval INTEGER',
+                   'next_fetch_ts INTEGER'):
+        conn.execute(f"ALTER TABLE sources ADD COLUMN {column}")
+    
+    conn.execute("ALTER TABLE news ADD COLUMN link_hash INTEGER")
+    conn.executemany("UPDATE news SET link_hash = ? WHERE id = ?",
+                     [(link_hash(link), news_id) for news_id, link in conn.execute("SELECT id, link FROM news")])
+    # Не UNIQUE: в старых базах одна статья могла сохраниться под разными ссылками
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_news_link_hash ON news(link_hash)")
+
+def migrate_retention(conn):
+    """Счётчики для /stats на триггерах и дневные агрегаты трендов для хранения без сырых строк"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    # news и news_posted - за всё время: архивация их не уменьшает
+    conn.execute('''
+        INSERT OR REPLACE INTO counters (name, value) VALUES
+            ('news', (SELECT COUNT(*) FROM news)),
+            ('news_posted', (SELECT COUNT(*) FROM news WHERE posted = 1)),
+            ('news_archived', 0),
+            ('queue_pending', (SELECT COUNT(*) FROM content_queue WHERE posted = 0))
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_news_insert AFTER INSERT ON news BEGIN
+            UPDATE counters SET value = value + 1 WHERE name = 'news';
+            UPDATE counters SET value = value + 1 WHERE name = 'news_posted' AND NEW.posted = 1;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_news_posted AFTER UPDATE OF posted ON news
+        WHEN NEW.posted IS NOT OLD.posted BEGIN
+            UPDATE counters SET value = value + CASE WHEN NEW.posted = 1 THEN 1 ELSE -1 END WHERE name = 'news_posted';
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_queue_insert AFTER INSERT ON content_queue WHEN NEW.posted = 0 BEGIN
+            UPDATE counters SET value = value + 1 WHERE name = 'queue_pending';
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_queue_posted AFTER UPDATE OF posted ON content_queue
+        WHEN NEW.posted IS NOT OLD.posted BEGIN
+            UPDATE counters SET value = value + CASE WHEN NEW.posted = 0 THEN 1 ELSE -1 END WHERE name = 'queue_pending';
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_queue_delete AFTER DELETE ON content_queue WHEN OLD.posted = 0 BEGIN
+            UPDATE counters SET value = value - 1 WHERE name = 'queue_pending';
+        END
+    ''')
+    
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS trend_daily (
+            date TEXT NOT NULL,
+            topic TEXT NOT NULL,
+            detections INTEGER NOT NULL,
+            max_score REAL,
+            max_velocity REAL,
+            max_zscore REAL,
+            PRIMARY KEY (date, topic)
+        )
+    ''')
+
+def migrate_duplicate_index(conn):
+    """Индекс дубликатов: отметка posted кластера без полного прохода по news"""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_news_duplicate_of ON news(duplicate_of) WHERE duplicate_of IS NOT NULL")
+
+def migrate_archived_links(conn):
+    """Хэши ссылок архивных новостей: Bloom-фильтр их помнит, а в news строк уже нет"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archived_links (
+            link_hash INTEGER PRIMARY KEY,
+            archived_ts INTEGER NOT NULL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_archived_links_ts ON archived_links(archived_ts)")
+
+def migrate_news_topics(conn):
+    """Все темы новости (tags - только хештеги) - для фильтров каналов без повторного анализа"""
+    conn.execute("ALTER TABLE news ADD COLUMN topics TEXT")
+
+def migrate_source_backlog(conn):
+    """Записи ленты сверх лимита ингестии - до следующего цикла"""
+    conn.execute("ALTER TABLE sources ADD COLUMN backlog TEXT")
+
+# Версия схемы хранится в PRAGMA user_version; новые миграции - только в конец списка
+MIGRATIONS = [
+    (1, 'initial schema', migrate_initial_schema),
+    (2, 'priority, timestamps, partial indexes', migrate_priority_and_indexes),
+    (3, 'trend velocity metrics', migrate_trend_metrics),
+    (4, 'news tags', migrate_news_tags),
+    (5, 'story clusters', migrate_story_clusters),
+    (6, 'scheduler jobs', migrate_scheduler_jobs),
+    (7, 'delivery outbox', migrate_outbox),
+    (8, 'original news titles', migrate_title_original),
+    (9, 'source high-water marks', migrate_sources),
+    (10, 'source polling state, link hashes', migrate_source_state),
+    (11, 'retention counters, daily trend rollup', migrate_retention),
+    (12, 'duplicate index', migrate_duplicate_index),
+    (13, 'archived link hashes', migrate_archived_links),
+    (14, 'news topics', migrate_news_topics),
+    (15, 'source backlog', migrate_source_backlog),
+]
+
+def apply_migrations(conn, target=None):
+    """Применяем недостающие миграции, каждую со своим номером версии"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, name, migration in MIGRATIONS:
+        if number <= version or (target is not None and number > target):
+            continue
+        migration(conn)
+        conn.execute(f"PRAGMA user_version = {number}")
+        logger.info(f"🗄️ Миграция {number}: {name}")
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def init_db():
+    return db.transaction(apply_migrations)
 
 init_db()
 
+def today_range():
+    """Границы текущих суток UTC в unix-времени (как date('now') в SQLite)"""
+    start = int(time.time()) // 86400 * 86400
+    return start, start + 86400
+
+# ==================== TERM MATCHER ====================
+
+class TermMatcher:
+    """Поиск тысяч терминов за один проход по тексту.
+    
+    Автомат работает на уровне слов: текст один раз режется на слова
+    скомпилированным регэкспом, затем каждое слово - один поиск в словаре-дереве
+    фраз (многословные синонимы вроде "shiba inu") и в таблице префиксов для
+    шаблонов со звёздочкой ("hack*" ловит hacked, hackers).
+    
+    Словарь: {"topics": {тема: [синонимы]}, "content_types": {тип: [слова]},
+    "hashtags": [темы]}. Результат поиска - пары (категория, каноническое имя).
+    """
+    
+    WORD = re.compile(r'\w+')
+    END = object()
+    
+    def __init__(self, dictionary):
+        self.root = {}
+        self.prefixes = {}
+        self.content_types = list(dictionary.get('content_types', {}))
+        self.hashtags = list(dictionary.get('hashtags', []))
+        self.size = 0
+        
+        for topic, aliases in dictionary.get('topics', {}).items():
+            for alias in aliases:
+                self.add(alias, ('topic', topic))
+        for content_type, words in dictionary.get('content_types', {}).items():
+            for word in words:
+                self.add(word, ('content_type', content_type))
+        self.prefix_lengths = sorted({len(prefix) for prefix in self.prefixes})
+    
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+    
+    def add(self, pattern, payload):
+        pattern = pattern.lower()
+        self.size += 1
+        if pattern.endswith('*'):
+            self.prefixes.setdefault(pattern[:-1], []).append(payload)
+            return
+        
+        node = self.root
+        for word in self.WORD.findall(pattern):
+            node = node.setdefault(word, {})
+        node.setdefault(self.END, []).append(payload)
+    
+    def scan(self, text):
+        """Все совпадения в порядке появления: [(категория, имя), ...]"""
+        words = self.WORD.findall(text.lower())
+        root, end, prefixes, lengths = self.root, self.END, self.prefixes, self.prefix_lengths
+        found = []
+        
+        for i, word in enumerate(words):
+            node = root.get(word)
+            if node is not None:
+                # Самая длинная фраза, начинающаяся с этого слова
+                match = node.get(end)
+                j = i + 1
+                while j < len(words):
+                    node = node.get(words[j])
+                    if node is None:
+                        break
+                    match = node.get(end, match)
+                    j += 1
+                if match:
+                    found.extend(match)
+            
+            for length in lengths:
+                if length > len(word):
+                    break
+                match = prefixes.get(word[:length])
+                if match:
+                    found.extend(match)
+        
+        return found
+    
+    def analyze(self, text):
+        """Совпадения, разложенные по категориям: {'topic': [...], 'content_type': [...]}"""
+        result = {'topic': [], 'content_type': []}
+        for category, name in self.scan(text):
+            result[category].append(name)
+        return result
+    
+    def content_type(self, analysis):
+        """Тип контента с учётом порядка в словаре (breaking важнее analysis)"""
+        for content_type in self.content_types:
+            if content_type in analysis['content_type']:
+                return content_type
+        return 'regular'
+    
+    def tags(self, analysis):
+        """Темы для хештегов - в порядке списка hashtags, без повторов"""
+        topics = set(analysis['topic'])
+        return [topic for topic in self.hashtags if topic in topics]
+
+term_matcher = TermMatcher.from_file(TERMS_PATH)
+
+# ==================== STORY CLUSTERING ====================
+
+class StoryIndex:
+    """Поиск почти-дубликатов: MinHash-подписи по словам текста и LSH-корзины.
+    
+    Подпись режется на STORY_MINHASH_BANDS полос; совпадение хотя бы одной полосы
+    даёт кандидата, который подтверждается оценкой сходства Жаккара по подписи.
+    Индексируются только представители кластеров; в базе лежат их подписи
+    (story_signatures), корзины пересобираются из них при старте.
+    """
+    
+    PRIME = (1 << 31) - 1
+    STOPWORDS = frozenset('the and for with from that this into over after amid says will its are has have was were than about'.split())
+    WORD = re.compile(r'\w{3,}')
+    
+    def __init__(self, bands=STORY_MINHASH_BANDS, rows=STORY_MINHASH_ROWS, threshold=STORY_SIMILARITY,
+                 bucket_limit=16, seed=42):
+        self.bands = bands
+        self.rows = rows
+        self.threshold = threshold
+        self.bucket_limit = bucket_limit
+        # Фиксированное зерно: подписи хранятся в базе и должны совпадать между запусками
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, self.PRIME, bands * rows, dtype=np.uint64)[:, None]
+        self.b = rng.integers(0, self.PRIME, bands * rows, dtype=np.uint64)[:, None]
+        self.buckets = {}
+        self.signatures = {}
+    
+    def signature(self, text):
+        """MinHash-подпись множества слов текста (None для пустого текста)"""
+        words = {word for word in self.WORD.findall(text.lower()) if word not in self.STOPWORDS}
+        if not words:
+            return None
+        hashes = np.fromiter((zlib.crc32(word.encode()) & self.PRIME for word in words), dtype=np.uint64, count=len(words))
+        return ((self.a * hashes + self.b) % self.PRIME).min(axis=1).astype(np.uint32)
+    
+    def band_keys(self, signature):
+        # hash() кортежа целых детерминирован между запусками, в отличие от строк
+        return [hash((band, *signature[band * self.rows:(band + 1) * self.rows].tolist())) for band in range(self.bands)]
+    
+    def find(self, signature):
+        """Кластер, к которому относится подпись, или None"""
+        if signature is None:
+            return None
+        checked = set()
+        for key in self.band_keys(signature):
+            clusters = self.buckets.get(key, ())
+            # В корзине обычно один кластер (int), при коллизиях - кортеж
+            for cluster_id in (clusters,) if isinstance(clusters, int) else clusters:
+                if cluster_id in checked:
+                    continue
+                checked.add(cluster_id)
+                if np.mean(self.signatures[cluster_id] == signature) >= self.threshold:
+                    return cluster_id
+        return None
+    
+    def add(self, cluster_id, signature):
+        """Регистрируем представителя кластера"""
+        keys = self.band_keys(signature)
+        self.signatures[cluster_id] = signature
+        for key in keys:
+            clusters = self.buckets.get(key)
+            if clusters is None:
+                self.buckets[key] = cluster_id
+            elif isinstance(clusters, int):
+                self.buckets[key] = (clusters, cluster_id)
+            else:
+                # Корзина общих слов ("bitcoin price") ничего не различает - держим только свежие
+                self.buckets[key] = clusters[-(self.bucket_limit - 1):] + (cluster_id,)
+    
+    def remove(self, cluster_id):
+        signature = self.signatures.pop(cluster_id, None)
+        if signature is None:
+            return
+        for key in self.band_keys(signature):
+            clusters = self.buckets.get(key)
+            if clusters == cluster_id:
+                del self.buckets[key]
+            elif isinstance(clusters, tuple):
+                rest = tuple(c for c in clusters if c != cluster_id)
+                self.buckets[key] = rest[0] if len(rest) == 1 else rest
+    
+    def load(self):
+        """Поднимаем индекс из базы при старте"""
+        for row in db.fetchall("SELECT cluster_id, signature FROM story_signatures ORDER BY cluster_id"):
+            self.add(row['cluster_id'], np.frombuffer(row['signature'], dtype=np.uint32))
+        return len(self.signatures)
+
+story_index = StoryIndex()
+story_index.load()
+
+# ==================== LINK FILTER ====================
+
+class LinkFilter:
+    """Bloom-фильтр по хэшам канонических ссылок (link_hash) перед запросом в базу.
+    
+    "Нет" - ссылка точно новая, в базу не идём; "возможно" подтверждаем запросом
+    по индексу link_hash. Биты лежат в numpy-массиве и сохраняются на диск вместе
+    с id последней учтённой новости: при старте дочитываются только новые строки,
+    без файла фильтр пересобирается из news и archived_links. Удалять из фильтра
+    не нужно - id в news не переиспользуются, а ссылки архивных новостей остаются
+    в archived_links, и "возможно" по ним подтверждается там.
+    """
+    
+    CHUNK = 1 << 18
+    
+    def __init__(self, path, capacity=LINK_FILTER_CAPACITY, fp_rate=LINK_FILTER_FP_RATE, max_mb=LINK_FILTER_MAX_MB):
+        self.path = path
+        self.fp_rate = fp_rate
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.loaded = False
+        self.stats = {'checked': 0, 'skipped': 0, 'false_positives': 0, 'rebuilds': 0}
+        self.reset(capacity)
+    
+    def reset(self, capacity):
+        """Пустой фильтр на capacity ссылок; упёрлись в потолок памяти - растёт доля ложных срабатываний"""
+        self.capacity = max(1, capacity)
+        bits = -self.capacity * np.log(self.fp_rate) / np.log(2) ** 2
+        self.size = max(64, int(min(bits, self.max_bytes * 8)) // 64 * 64)
+        self.hashes = max(1, round(self.size / self.capacity * np.log(2)))
+        self.bits = np.zeros(self.size // 8, dtype=np.uint8)
+        self.count = 0
+        self.last_id = 0
+    
+    def _positions(self, hashes):
+        """Номера битов: k позиций на хэш двойным хэшированием из двух половин link_hash"""
+        values = np.asarray(hashes, dtype=np.int64).view(np.uint64)
+        h1 = values & 0xFFFFFFFF
+        h2 = (values >> 32) | 1
+        return (h1[:, None] + np.arange(self.hashes, dtype=np.uint64) * h2[:, None]) % np.uint64(self.size)
+    
+    def add(self, hashes):
+        """Малые пачки - побитовым OR на месте, большие (пересборка) - через развёрнутый массив bool"""
+        hashes = np.asarray(hashes, dtype=np.int64)
+        if len(hashes) * self.hashes * 64 < self.size:
+            positions = self._positions(hashes).ravel()
+            np.bitwise_or.at(self.bits, positions >> 3, np.left_shift(1, positions & 7).astype(np.uint8))
+        else:
+            flags = np.unpackbits(self.bits, bitorder='little').view(bool)
+            for i in range(0, len(hashes), self.CHUNK):
+                flags[self._positions(hashes[i:i + self.CHUNK]).ravel()] = True
+            self.bits = np.packbits(flags, bitorder='little')
+        self.count += len(hashes)
+    
+    def contains(self, hashes):
+        """Массив bool: True - ссылка, возможно, уже есть"""
+        hashes = np.asarray(hashes, dtype=np.int64)
+        if not len(hashes):
+            return np.zeros(0, dtype=bool)
+        positions = self._positions(hashes)
+        return ((self.bits[positions >> 3] >> (positions & 7).astype(np.uint8)) & 1).all(axis=1)
+    
+    def _news_hashes(self, after_id):
+        """Пачки (последний id, хэши) строк news новее after_id"""
+        while True:
+            rows = db.fetchall('''
+                SELECT id, link_hash, CASE WHEN link_hash IS NULL THEN link END
+                FROM news WHERE id > ? ORDER BY id LIMIT ?
+            ''', (after_id, self.CHUNK))
+            if not rows:
+                return
+            after_id = rows[-1][0]
+            # Строки, вставленные в обход ингестии, без link_hash - считаем на месте
+            yield after_id, np.fromiter((value if value is not None else link_hash(link) for _, value, link in rows),
+                                        dtype=np.int64, count=len(rows))
+    
+    def rebuild(self):
+        """Пересборка из news с запасом ёмкости вдвое"""
+        started = time.monotonic()
+        total = db.count("SELECT COUNT(*) FROM news") + db.count("SELECT COUNT(*) FROM archived_links")
+        self.reset(max(self.capacity, total * 2))
+        batches = [np.fromiter((row[0] for row in db.fetchall("SELECT link_hash FROM archived_links")), dtype=np.int64)]
+        last_id = 0
+        for last_id, hashes in self._news_hashes(0):
+            batches.append(hashes)
+        self.add(np.concatenate(batches))
+        self.last_id = last_id
+        self.stats['rebuilds'] += 1
+        logger.info(f"🧮 Фильтр ссылок: {self.count} ссылок, {self.bits.nbytes // 1024} КБ за {time.monotonic() - started:.1f}с")
+        self.save()
+    
+    def sync(self):
+        """Поднимаем фильтр (с диска или пересборкой) и дочитываем новые строки news - один запрос по id"""
+        if not self.loaded:
+            self.loaded = True
+            if not self.load():
+                self.rebuild()
+                return
+        for last_id, hashes in self._news_hashes(self.last_id):
+            if self.count + len(hashes) > self.capacity:
+                self.rebuild()
+                return
+            self.add(hashes)
+            self.last_id = last_id
+    
+    def load(self):
+        """Фильтр с диска, если он построен с теми же параметрами для этой базы"""
+        try:
+            with np.load(self.path) as data:
+                size, hashes, capacity, count, last_id = data['meta'].tolist()
+                fp_rate = float(data['fp_rate'])
+                bits = data['bits']
+        except (OSError, KeyError, ValueError):
+            return False
+        if fp_rate != self.fp_rate or last_id > db.count("SELECT MAX(id) FROM news"):
+            return False
+        self.size, self.hashes, self.capacity, self.count, self.last_id = size, hashes, capacity, count, last_id
+        self.bits = bits
+        return True
+    
+    def save(self):
+        """Атомарная запись на диск: временный файл и rename"""
+        temp = self.path + '.tmp.npz'
+        np.savez(temp, bits=self.bits, fp_rate=self.fp_rate,
+                 meta=np.array([self.size, self.hashes, self.capacity, self.count, self.last_id], dtype=np.int64))
+        os.replace(temp, self.path)
+
+link_filter = LinkFilter(LINK_FILTER_PATH)
+
 # ==================== TREND RADAR SYSTEM ====================
 
-def analyze_trends():
-    """Анализ трендов каждые 2 часа"""
-    print("📡 Запускаю Trend Radar...")
+class TrendEngine:
+    """Упоминания терминов по временным корзинам в кольцевом буфере NumPy.
+    
+    Строка массива - термин, столбец - корзина TREND_BUCKET_SECONDS. Скорость,
+    ускорение и z-score к базовой линии считаются одним проходом по всем терминам.
+    """
+    
+    def __init__(self, bucket_seconds=TREND_BUCKET_SECONDS, window_hours=TREND_WINDOW_HOURS,
+                 velocity_hours=TREND_VELOCITY_HOURS, capacity=64, seen_limit=50000):
+        self.bucket_seconds = bucket_seconds
+        self.n_buckets = window_hours * 3600 // bucket_seconds
+        self.window_buckets = velocity_hours * 3600 // bucket_seconds
+        if self.n_buckets % self.window_buckets:
+            raise ValueError("Окно скорости должно делить окно истории нацело")
+        self.velocity_hours = velocity_hours
+        self.counts = np.zeros((capacity, self.n_buckets), dtype=np.float32)
+        self.terms = {}
+        self.names = []
+        self.head = None  # абсолютный номер самой свежей корзины
+        self.seen = OrderedDict()
+        self.seen_limit = seen_limit
+    
+    def term_ids(self, terms):
+        """Номера строк для терминов, новые термины получают строки (массив растёт вдвое)"""
+        ids = []
+        for term in terms:
+            row = self.terms.get(term)
+            if row is None:
+                row = len(self.names)
+                if row == len(self.counts):
+                    self.counts = np.vstack([self.counts, np.zeros_like(self.counts)])
+                self.terms[term] = row
+                self.names.append(term)
+            ids.append(row)
+        return np.asarray(ids, dtype=np.int64)
+    
+    def advance(self, now):
+        """Сдвигаем кольцо до текущего времени, обнуляя устаревшие корзины"""
+        bucket = int(now) // self.bucket_seconds
+        if self.head is None:
+            self.head = bucket
+        elif bucket > self.head:
+            stale = np.arange(self.head + 1, min(bucket, self.head + self.n_buckets) + 1) % self.n_buckets
+            self.counts[:, stale] = 0
+            self.head = bucket
+    
+    def record(self, term_ids, timestamps, now=None):
+        """Добавляем пачку упоминаний (term_id, unix-время) одним вызовом"""
+        self.advance(time.time() if now is None else now)
+        buckets = np.asarray(timestamps, dtype=np.int64) // self.bucket_seconds
+        # Будущее прижимаем к текущей корзине, слишком старое отбрасываем
+        buckets = np.minimum(buckets, self.head)
+        fresh = buckets > self.head - self.n_buckets
+        np.add.at(self.counts, (np.asarray(term_ids)[fresh], buckets[fresh] % self.n_buckets), 1)
+    
+    def is_new(self, key):
+        """Одна запись ленты учитывается один раз, сколько бы раз её ни скачали"""
+        if key in self.seen:
+            return False
+        self.seen[key] = True
+        if len(self.seen) > self.seen_limit:
+            self.seen.popitem(last=False)
+        return True
     
-    trends = {}
+    def metrics(self, now=None):
+        """Скорость (упоминаний/час), ускорение и z-score для всех терминов разом"""
+        self.advance(time.time() if now is None else now)
+        counts = self.counts[:len(self.names)]
+        # Столбцы по времени: от самой старой корзины к текущей
+        order = (self.head - np.arange(self.n_buckets)[::-1]) % self.n_buckets
+        windows = counts[:, order].reshape(len(counts), -1, self.window_buckets).sum(axis=2)
+        rates = windows / self.velocity_hours
+        
+        velocity = rates[:, -1]
+        acceleration = rates[:, -1] - rates[:, -2]
+        baseline = rates[:, :-1]
+        # Пол для std: при пустой истории z-score вырождается в саму скорость
+        zscore = (velocity - baseline.mean(axis=1)) / np.maximum(baseline.std(axis=1), 1.0)
+        return {
+            'score': windows[:, -1],
+            'velocity': velocity,
+            'acceleration': acceleration,
+            'zscore': zscore,
+        }
+    
+    def significant(self, now=None, min_velocity=TREND_MIN_VELOCITY, min_zscore=TREND_MIN_ZSCORE):
+        """Термины, чья скорость заметно выше базовой линии"""
+        if not self.names:
+            return {}
+        metrics = self.metrics(now)
+        mask = (metrics['velocity'] >= min_velocity) & (metrics['zscore'] >= min_zscore)
+        return {
+            self.names[row]: {name: round(float(values[row]), 2) for name, values in metrics.items()}
+            for row in np.flatnonzero(mask)
+        }
+
+trend_engine = TrendEngine()
+
+# Ручной /trends и плановый скан не должны пересекаться на trend_engine
+TREND_LOCK = asyncio.Lock()
+
+def scan_trend_entries(source_urls, feeds, now):
+    """Разбор лент трендов и пересчёт метрик - CPU, выполняется в пуле потоков"""
+    mentions = []
+    timestamps = []
     
     # Анализ социальных активностей
-    for source_name, source_url in TREND_SOURCES.items():
+    for source_name, source_url in source_urls:
         try:
-            feed = feedparser.parse(source_url)
-            for entry in feed.entries[:20]:
-                content = f"{entry.title} {entry.summary if hasattr(entry, 'summary') else ''}".lower()
+            entries = feeds.get(source_url)
+            if entries is None:
+                continue
+            for entry in entries[:20]:
+                if not trend_engine.is_new(entry['link']):
+                    continue
+                content = f"{entry['title']} {entry['summary']}"
                 
-                # Ищем крипто-термины
-                crypto_terms = re.findall(r'\b(bitcoin|btc|ethereum|eth|jasmy|defi|nft|web3|airdrop|staking)\b', content)
+                # Ищем крипто-термины (синонимы сводятся к одной теме: btc -> bitcoin)
+                crypto_terms = term_matcher.analyze(content)['topic']
                 
-                for term in crypto_terms:
-                    if term in trends:
-                        trends[term] += 1
-                    else:
-                        trends[term] = 1
+                mentions.extend(crypto_terms)
+                timestamps.extend([entry['published'] or now] * len(crypto_terms))
                         
         except Exception as e:
-            print(f"❌ Ошибка анализа {source_name}: {e}")
+            logger.error(f"❌ Ошибка анализа {source_name}: {e}")
+    
+    if mentions:
+        trend_engine.record(trend_engine.term_ids(mentions), timestamps, now)
     
-    # Фильтруем значимые тренды
-    significant_trends = {k: v for k, v in trends.items() if v >= 3}
+    # Значимые тренды - скорость выше базовой линии
+    return trend_engine.significant(now)
+
+TRENDS_DETECTED = metrics_registry.counter('trends_detected_total', 'Значимые тренды Trend Radar')
+
+@metrics_registry.timed('analyze_trends_seconds', 'Цикл Trend Radar')
+async def analyze_trends():
+    """Анализ трендов каждые 2 часа"""
+    logger.info("📡 Запускаю Trend Radar...")
     
-    # Сохраняем в базу
-    if significant_trends:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
+    async with TREND_LOCK:
+        now = int(time.time())
         
-        for topic, score in significant_trends.items():
-            cursor.execute('''
-                INSERT INTO trend_data (topic, score)
-                VALUES (?, ?)
-            ''', (topic, score))
-            
-            # Добавляем в очередь контента
-            trend_content = generate_trend_content(topic, score)
-            scheduled_time = datetime.now() + timedelta(minutes=random.randint(5, 30))
-            
-            cursor.execute('''
-                INSERT INTO content_queue (content_type, content_text, scheduled_time)
-                VALUES (?, ?, ?)
-            ''', ('trend_alert', trend_content, scheduled_time))
+        # Все ленты скачиваем разом, значения TREND_SOURCES - списки URL; ленты вроде /hot
+        # не хронологические, поэтому без отсечки по high-water mark (повторы отсекает is_new)
+        source_urls = [(group, url) for group, urls in TREND_SOURCES.items() for url in urls]
+        feeds = await fetch_feeds([url for _, url in source_urls], high_water=False)
         
-        conn.commit()
-        conn.close()
+        significant_trends = await run_blocking(scan_trend_entries, source_urls, feeds, now)
         
-        print(f"🎯 Обнаружено трендов: {len(significant_trends)}")
+        # Сохраняем в базу
+        if significant_trends:
+            trend_rows = []
+            queue_rows = []
+            for topic, metrics in significant_trends.items():
+                trend_rows.append((topic, metrics['score'], metrics['velocity'], metrics['acceleration'], metrics['zscore'], now))
+                
+                # Добавляем в очередь контента
+                trend_content = generate_trend_content(topic, metrics)
+                delay = random.randint(5, 30) * 60
+                queue_rows.append((trend_content, now + delay))
+            
+            def save(conn):
+                conn.executemany('''
+                    INSERT INTO trend_data (topic, score, velocity, acceleration, zscore, detected_ts)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', trend_rows)
+                for trend_content, scheduled_ts in queue_rows:
+                    queue_content(conn, 'trend_alert', trend_content, scheduled_ts)
+                # Новости по этим темам поднимаются в очереди публикации
+                publish_queue.set_trends({topic: metrics['zscore'] for topic, metrics in significant_trends.items()})
+                daily_aggregates.add_trends(conn, {topic: metrics['score'] for topic, metrics in significant_trends.items()}, now)
+            
+            await run_blocking(db.transaction, save)
+            
+            TRENDS_DETECTED.inc(len(significant_trends))
+            logger.info(f"🎯 Обнаружено трендов: {len(significant_trends)}",
+                        extra={'event': 'trends', 'topics': sorted(significant_trends)})
     
     return significant_trends
 
-def generate_trend_content(topic, score):
+def generate_trend_content(topic, metrics):
     """Генерируем контент для тренда"""
-    trend_level = "🟢 НАБЛЮДЕНИЕ" if score < 5 else "🟡 ВНИМАНИЕ" if score < 10 else "🔴 ТРЕНД"
+    zscore = metrics['zscore']
+    trend_level = "🟢 НАБЛЮДЕНИЕ" if zscore < 3 else "🟡 ВНИМАНИЕ" if zscore < 5 else "🔴 ТРЕНД"
     
     content = f"{trend_level}\n{topic.upper()} набирает популярность\n\n"
-    content += f"📊 Интенсивность: {score} упоминаний/час\n\n"
+    content += f"📊 Интенсивность: {metrics['velocity']:g} упоминаний/час"
+    if metrics['acceleration'] > 0:
+        content += f" (+{metrics['acceleration']:g} к прошлому окну)"
+    content += "\n\n"
     
     # Добавляем контекст в зависимости от темы
     context = {
@@ -159,11 +1366,38 @@ def generate_trend_content(topic, score):
     
     return content
 
-# Free Google Translate API
-def translate_text(text, target_lang='ru'):
-    """Профессиональный перевод через Google Translate API"""
-    try:
-        url = "https://translate.googleapis.com/translate_a/single"
+# ==================== TRANSLATION ====================
+
+class TranslationBackend(abc.ABC):
+    """Бэкенд перевода: переводит пачку строк за один вызов"""
+    name = 'base'
+    
+    @abc.abstractmethod
+    async def translate_batch(self, texts, target_lang):
+        """Переводы texts на target_lang в том же порядке"""
+
+class GoogleTranslateBackend(TranslationBackend):
+    """Бесплатный Google Translate API: пачка склеивается через перевод строки"""
+    name = 'google'
+    url = "https://translate.googleapis.com/translate_a/single"
+    
+    def __init__(self, max_chars=1800):
+        self.max_chars = max_chars
+        self.requests = 0
+    
+    def _chunks(self, texts):
+        """Режем пачку так, чтобы запрос не вышел за лимит длины"""
+        chunk, size = [], 0
+        for text in texts:
+            if chunk and size + len(text) + 1 > self.max_chars:
+                yield chunk
+                chunk, size = [], 0
+            chunk.append(text)
+            size += len(text) + 1
+        if chunk:
+            yield chunk
+    
+    async def _request(self, text, target_lang):
         params = {
             'client': 'gtx',
             'sl': 'auto',
@@ -171,52 +1405,261 @@ def translate_text(text, target_lang='ru'):
             'dt': 't',
             'q': text
         }
-        
-        response = requests.get(url, params=params, timeout=10)
-        if response.status_code == 200:
-            data = response.json()
-            translated = data[0][0][0]
+        self.requests += 1
+        response = await get_http_client().get(self.url, params=params, timeout=TRANSLATE_TIMEOUT)
+        response.raise_for_status()
+        data = response.json()
+        return ''.join(segment[0] for segment in data[0] if segment[0])
+    
+    async def translate_batch(self, texts, target_lang):
+        results = []
+        for chunk in self._chunks(texts):
+            # Переводы строк внутри заголовков ломают разбиение ответа
+            joined = '\n'.join(text.replace('\n', ' ') for text in chunk)
+            translated = (await self._request(joined, target_lang)).split('\n')
+            if len(translated) != len(chunk):
+                # Google склеил или разбил строки - переводим по одной
+                translated = [await self._request(text, target_lang) for text in chunk]
+            results.extend(line.strip() for line in translated)
+        return results
+
+class FakeTranslateBackend(TranslationBackend):
+    """Локальный переводчик для бенчмарков и офлайн-запуска"""
+    name = 'fake'
+    
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.requests = 0
+    
+    async def translate_batch(self, texts, target_lang):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [f"[{target_lang}] {text}" for text in texts]
+
+TRANSLATE_BACKEND_SECONDS = metrics_registry.histogram('translate_backend_seconds', 'Запрос к бэкенду перевода (только промахи кэша)')
+
+class Translator:
+    """Перевод с LRU-кэшем в памяти и долговременным кэшем в SQLite.
+    
+    LRU общий для event loop (translate_many) и потока писателя (cached при рендере
+    в enqueue_next_content), поэтому все обращения к нему - под self._lock.
+    """
+    
+    def __init__(self, backend, cache_size=5000, ttl_days=30):
+        self.backend = backend
+        self.cache_size = cache_size
+        self.ttl = ttl_days * 86400
+        self.memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'errors': 0}
+    
+    @staticmethod
+    def cache_key(text, target_lang):
+        return hashlib.sha1(f"{target_lang}\0{text}".encode()).hexdigest()
+    
+    def _remember(self, key, translated):
+        with self._lock:
+            self.memory[key] = translated
+            self.memory.move_to_end(key)
+            if len(self.memory) > self.cache_size:
+                self.memory.popitem(last=False)
+    
+    def _recall(self, key):
+        """Перевод из LRU (None, если нет) с отметкой свежести"""
+        with self._lock:
+            translated = self.memory.get(key)
+            if translated is not None:
+                self.memory.move_to_end(key)
+                self.stats['memory_hits'] += 1
             return translated
-        return text
-    except Exception as e:
-        print(f"❌ Ошибка перевода: {e}")
-        return text
+    
+    def _load(self, keys):
+        """Ищем переводы в SQLite одним запросом"""
+        rows = db.fetchall(f'''
+            SELECT hash, translated FROM translations
+            WHERE hash IN ({','.join('?' * len(keys))}) AND created_at >= ?
+        ''', (*keys, time.time() - self.ttl))
+        return {row['hash']: row['translated'] for row in rows}
+    
+    def _store(self, rows):
+        db.executemany('''
+            INSERT OR REPLACE INTO translations (hash, lang, translated, created_at)
+            VALUES (?, ?, ?, ?)
+        ''', rows)
+    
+    def cached(self, text, target_lang):
+        """Перевод только из кэша (память, затем SQLite), без обращения к бэкенду"""
+        key = self.cache_key(text, target_lang)
+        translated = self._recall(key)
+        if translated is not None:
+            return translated
+        translated = self._load([key]).get(key)
+        if translated is not None:
+            self._remember(key, translated)
+            self.stats['db_hits'] += 1
+        return translated
+    
+    @metrics_registry.timed('translate_seconds', 'Перевод пачки строк с учётом кэшей')
+    async def translate_many(self, texts, target_lang='ru'):
+        """Переводим список строк; повторы и уже известные тексты в бэкенд не уходят"""
+        keys = {text: self.cache_key(text, target_lang) for text in texts if text}
+        result = {}
+        
+        pending = []
+        for text, key in keys.items():
+            translated = self._recall(key)
+            if translated is None:
+                pending.append(text)
+            else:
+                result[text] = translated
+        
+        if pending:
+            # SQLite - в пуле: чтение не должно стоять в event loop за занятым писателем
+            stored = await run_blocking(self._load, [keys[text] for text in pending])
+            missing = []
+            for text in pending:
+                translated = stored.get(keys[text])
+                if translated is None:
+                    missing.append(text)
+                else:
+                    result[text] = translated
+                    self._remember(keys[text], translated)
+                    self.stats['db_hits'] += 1
+            
+            if missing:
+                self.stats['misses'] += len(missing)
+                started = time.perf_counter()
+                try:
+                    translated = await self.backend.translate_batch(missing, target_lang)
+                    TRANSLATE_BACKEND_SECONDS.observe(time.perf_counter() - started)
+                except Exception as e:
+                    logger.error(f"❌ Ошибка перевода: {e!r}")
+                    self.stats['errors'] += 1
+                    translated = None
+                
+                if translated:
+                    now = time.time()
+                    rows = []
+                    for text, value in zip(missing, translated):
+                        value = value or text
+                        result[text] = value
+                        self._remember(keys[text], value)
+                        rows.append((keys[text], target_lang, value, now))
+                    await run_blocking(self._store, rows)
+        
+        # Без перевода оставляем оригинал
+        return [result.get(text, text) for text in texts]
+    
+    def hit_rate(self):
+        hits = self.stats['memory_hits'] + self.stats['db_hits']
+        total = hits + self.stats['misses']
+        return hits / total if total else 0.0
+
+TRANSLATION_BACKENDS = {
+    'google': GoogleTranslateBackend,
+    'fake': FakeTranslateBackend,
+}
+
+translator = Translator(
+    TRANSLATION_BACKENDS[TRANSLATE_BACKEND](),
+    cache_size=TRANSLATION_CACHE_SIZE,
+    ttl_days=TRANSLATION_TTL_DAYS,
+)
+
+@metrics_registry.timed('translate_text_seconds', 'Перевод одной строки')
+async def translate_text(text, target_lang='ru'):
+    """Профессиональный перевод через Google Translate API"""
+    return (await translator.translate_many([text], target_lang))[0]
+
+# ==================== TEXT FORMATTING ====================
+
+# Разметка: скрипты/стили/комментарии целиком, теги (блочные отделяем пробелом)
+_HIDDEN = r'<(?:script|style)\b.*?</(?:script|style)\s*>|<!--.*?-->'
+_BLOCK_TAG = r'<(/?)(p|br|div|li|ul|ol|h[1-6]|tr|td|th|blockquote|section|article|hr|img|figure|figcaption)\b[^>]*>'
+_MARKUP = re.compile(f'{_HIDDEN}|{_BLOCK_TAG}|<[^>]*>', re.S | re.I)
+# Для полного текста - те же правила подстановками на C без вызова Python на каждый тег
+_HIDDEN_RE = re.compile(_HIDDEN, re.S | re.I)
+_BLOCK_TAG_RE = re.compile(_BLOCK_TAG, re.I)
+_TAG_RE = re.compile(r'<[^>]*>')
+# Управляющие и невидимые символы; буквы любых алфавитов, пунктуация и эмодзи остаются
+_INVISIBLE = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\x7f\u00ad\u200b-\u200f\u2028\u2029\u2060\ufeff]')
+# Конец предложения: знак, возможно закрывающие кавычки/скобки, затем пробел или конец;
+# точка после одиночной заглавной (U.S., J. Smith) предложение не завершает
+_SENTENCE_END = re.compile(r'(?<!\b[A-ZА-ЯЁ])[.!?…]+["»”’)]*(?=\s|$)')
+
+def iter_text(markup):
+    """Фрагменты видимого текста по порядку; разбор ленивый - дальше нужного не читаем"""
+    position = 0
+    for match in _MARKUP.finditer(markup):
+        if match.start() > position:
+            yield markup[position:match.start()]
+        if match.group(2):
+            yield ' '
+        position = match.end()
+    if position < len(markup):
+        yield markup[position:]
+
+def _normalize(fragment):
+    if '&' in fragment:
+        fragment = unescape(fragment)
+    return _INVISIBLE.sub('', fragment)
+
+def _squeeze(text):
+    # split() без аргументов - схлопывание пробелов и strip за один проход на C
+    return ' '.join(text.split())
 
 def clean_text(text):
-    """Очищаем текст от HTML тегов и лишних символов"""
+    """Очищаем текст от HTML тегов, сущностей и невидимых символов"""
     if not text:
         return ""
     
-    # Удаляем HTML теги
-    clean = re.sub(r'<[^>]+>', '', text)
-    # Удаляем лишние пробелы
-    clean = re.sub(r'\s+', ' ', clean)
-    # Удаляем специальные символы (кроме основных пунктуации)
-    clean = re.sub(r'[^\w\s\.\,\!\?\-\:\;\(\)]', '', clean)
-    
-    return clean.strip()
+    if '<' in text:
+        text = _TAG_RE.sub('', _BLOCK_TAG_RE.sub(' ', _HIDDEN_RE.sub('', text)))
+    return _squeeze(_normalize(text))
 
 def extract_clean_summary(text, max_length=120):
     """Извлекаем чистое первое предложение из текста"""
     if not text:
         return ""
     
-    # Очищаем текст
-    clean = clean_text(text)
-    
-    # Ищем первое предложение (до точки, ! или ?)
-    sentence_match = re.match(r'^[^\.!?]*[\.!?]', clean)
-    if sentence_match:
-        first_sentence = sentence_match.group(0)
-    else:
-        # Если нет пунктуации, берем первые слова
-        first_sentence = clean[:max_length]
+    # Набираем очищенный текст, пока не встретим конец предложения или не превысим длину
+    parts = []
+    size = 0
+    sentence = None
+    for fragment in iter_text(text):
+        fragment = _normalize(fragment)
+        if not fragment:
+            continue
+        parts.append(fragment)
+        size += len(fragment)
+        if size > max_length or _SENTENCE_END.search(fragment):
+            # Конец может оказаться на стыке фрагментов - проверяем склеенное;
+            # знак в самом конце ещё не конец: следующий фрагмент может продолжить слово
+            joined = _squeeze(''.join(parts))
+            end = _SENTENCE_END.search(joined)
+            if end and end.end() < len(joined):
+                if end.end() <= max_length:
+                    sentence = joined[:end.end()]
+                break
+            if len(joined) > max_length:
+                break
+    
+    clean = sentence or _squeeze(''.join(parts))
+    if sentence is None:
+        end = _SENTENCE_END.search(clean)
+        if end and end.end() <= max_length:
+            clean = clean[:end.end()]
     
     # Обрезаем если слишком длинное
-    if len(first_sentence) > max_length:
-        first_sentence = first_sentence[:max_length].rsplit(' ', 1)[0] + '...'
+    if len(clean) > max_length:
+        clean = clean[:max_length].rsplit(' ', 1)[0] + '...'
     
-    return first_sentence
+    return clean
+
+def extract_clean_summaries(texts, max_length=120):
+    """Пакетная версия extract_clean_summary для записей одного цикла"""
+    return [extract_clean_summary(text, max_length) for text in texts]
 
 # Умные шаблоны оформления
 CONTENT_TEMPLATES = {
@@ -252,37 +1695,512 @@ TREND_SOURCES = {
     ]
 }
 
+# Источники новостей
+NEWS_SOURCES = {
+    'cointelegraph': 'https://cointelegraph.com/rss',
+    'decrypt': 'https://decrypt.co/feed',
+    'cryptonews': 'https://cryptonews.com/news/feed/',
+    'coin desk': 'https://www.coindesk.com/arc/outboundfeeds/rss/',
+}
+# Ленты без хронологического порядка (свежая запись может стоять ниже старой):
+# их записи сверяются с high-water mark до конца, без остановки на первой старой
+UNORDERED_FEEDS = {u.strip() for u in os.environ.get('UNORDERED_FEEDS', '').split(',') if u.strip()}
+
+# ==================== FEED FETCHER ====================
+
+# feedparser - чистый Python, поэтому разбор уносим из event loop в пул потоков
+FEED_PARSE_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix='feedparse')
+
+# Один клиент (и пул keep-alive соединений) на каждый event loop
+_http_clients = {}
+
+def get_http_client():
+    """Общий HTTP-клиент для текущего event loop"""
+    loop = asyncio.get_running_loop()
+    client = _http_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=FEED_FETCH_TIMEOUT,
+            follow_redirects=True,
+            headers={'User-Agent': FEED_USER_AGENT},
+            limits=httpx.Limits(
+                max_connections=FEED_FETCH_CONCURRENCY * 2,
+                max_keepalive_connections=FEED_FETCH_CONCURRENCY,
+            ),
+        )
+        _http_clients[loop] = client
+    return client
+
+# Кэш лент: url -> {etag, last_modified, entries, size, fetched_at}; entries - без отсечки
+# по high-water mark, её каждый вызывающий применяет сам (ингестия и радар делят ленты)
+FEED_CACHE = {}
+FEED_CACHE_STATS = {'hits': 0, 'revalidated': 0, 'misses': 0, 'errors': 0, 'bytes_downloaded': 0, 'bytes_saved': 0}
+_feed_cache_loaded = False
+_feed_cache_lock = threading.Lock()
+# Состояние опроса источников: url -> {high_water_ts, last_guid, интервал, метрики, backlog};
+# high_water_ts - published самой свежей сохранённой записи новостной ленты, более старые не разбираем;
+# backlog - записи, не вошедшие в лимит ингестии, их разбирает следующий цикл
+SOURCE_STATE = {}
+SOURCE_COLUMNS = ('high_water_ts', 'last_guid', 'last_fetch_ts', 'fetch_ms', 'fetches', 'errors',
+                  'new_items', 'poll_interval', 'next_fetch_ts')
+# Время каждого обращения к лентам за последний час - для fetches/hour в /stats
+FETCH_LOG = deque()
+
+def source_state(url):
+    """Состояние источника; новый источник опрашиваем сразу"""
+    state = SOURCE_STATE.get(url)
+    if state is None:
+        state = SOURCE_STATE[url] = {
+            'high_water_ts': None, 'last_guid': None, 'last_fetch_ts': None, 'fetch_ms': 0.0,
+            'fetches': 0, 'errors': 0, 'new_items': 0,
+            'poll_interval': NEWS_INTERVAL_SECONDS, 'next_fetch_ts': 0, 'backlog': [],
+            # Не сохраняется: после рестарта лента снова считается активной
+            'empty_polls': 0,
+        }
+    return state
+
+def next_poll_interval(interval, new_items, error=False, empty_polls=0):
+    """Интервал опроса: есть новые записи - вдвое чаще, пусто или ошибка - реже.
+    
+    empty_polls - пустых опросов подряд, включая этот; до SOURCE_IDLE_POLLS рост
+    ограничен SOURCE_BUSY_MAX_POLL_SECONDS.
+    """
+    if error:
+        interval *= 2
+    elif new_items is None:
+        pass
+    elif new_items:
+        interval /= 2
+    elif new_items == 0:
+        interval *= SOURCE_POLL_BACKOFF
+        if empty_polls < SOURCE_IDLE_POLLS:
+            interval = min(interval, SOURCE_BUSY_MAX_POLL_SECONDS)
+    return int(min(SOURCE_MAX_POLL_SECONDS, max(SOURCE_MIN_POLL_SECONDS, interval)))
+
+def count_new_entries(entries, state):
+    """Сколько записей появилось с прошлого опроса; None, если сравнивать не с чем"""
+    if state['high_water_ts'] is not None:
+        # Порядок записей не гарантирован - считаем все новее отметки
+        return sum(1 for entry in entries if (entry['published'] or 0) > state['high_water_ts'])
+    if state['last_guid'] is None:
+        return None
+    new = 0
+    for entry in entries:
+        if entry['link'] == state['last_guid']:
+            break
+        new += 1
+    return new
+
+def take_feed_entries(feeds, limit):
+    """Записи к ингестии {url: записи} и новое состояние лент [(high_water_ts, backlog, url)].
+    
+    К свежим записям добавляется backlog прошлого цикла; первые limit идут в разбор,
+    остальные - в новый backlog. Отметка - самая свежая из разобранных записей.
+    """
+    batches = {}
+    marks = []
+    for url, entries in feeds.items():
+        state = source_state(url)
+        if not entries and not state['backlog']:
+            continue
+        pending = list({entry['link']: entry for entry in [*(entries or []), *state['backlog']]}.values())
+        batches[url] = pending[:limit]
+        backlog = pending[limit:limit + FEED_CACHE_MAX_ENTRIES]
+        mark = max((entry['published'] for entry in batches[url] if entry['published']), default=None)
+        mark = max(mark or 0, state['high_water_ts'] or 0) or None
+        if mark != state['high_water_ts'] or backlog != state['backlog']:
+            marks.append((mark, backlog, url))
+    return batches, marks
+
+FEED_FETCH_SECONDS = metrics_registry.histogram('feed_fetch_seconds', 'Загрузка и разбор одной ленты')
+FEED_FETCHES = metrics_registry.counter('feed_fetches_total', 'Обращения к лентам по итогу', ['result'])
+
+def record_fetch(url, seconds, entries=None, error=False):
+    """Итог обращения к ленте: метрики и время следующего опроса (high-water mark двигает ингестия)"""
+    now = time.time()
+    FEED_FETCH_SECONDS.observe(seconds)
+    FEED_FETCHES.labels('error' if error else 'ok').inc()
+    state = source_state(url)
+    new_items = None if error else count_new_entries(entries, state)
+    
+    state['fetches'] += 1
+    state['last_fetch_ts'] = int(now)
+    # Скользящее среднее длительности загрузки
+    ms = seconds * 1000
+    state['fetch_ms'] = round(ms if not state['fetch_ms'] else 0.8 * state['fetch_ms'] + 0.2 * ms, 1)
+    if error:
+        state['errors'] += 1
+    else:
+        state['new_items'] += new_items or 0
+        if entries:
+            state['last_guid'] = entries[0]['link']
+        if new_items is not None:
+            state['empty_polls'] = 0 if new_items else state['empty_polls'] + 1
+    
+    state['poll_interval'] = next_poll_interval(state['poll_interval'], new_items, error, state['empty_polls'])
+    state['next_fetch_ts'] = int(now) + state['poll_interval']
+    FETCH_LOG.append(now)
+
+def due_sources(urls, now=None):
+    """Источники, которым пора на опрос"""
+    load_feed_cache()
+    now = time.time() if now is None else now
+    return [url for url in urls if source_state(url)['next_fetch_ts'] <= now]
+
+def fetches_per_hour():
+    """Обращений к лентам за последний час"""
+    cutoff = time.time() - 3600
+    while FETCH_LOG and FETCH_LOG[0] < cutoff:
+        FETCH_LOG.popleft()
+    return len(FETCH_LOG)
+
+def load_feed_cache():
+    """Поднимаем кэш лент и состояние источников из базы (один раз за процесс)"""
+    global _feed_cache_loaded
+    if _feed_cache_loaded:
+        return
+    
+    # Вызывается из пула: ингестия и радар трендов могут прийти сюда одновременно
+    with _feed_cache_lock:
+        if _feed_cache_loaded:
+            return
+        rows = db.fetchall("SELECT url, etag, last_modified, entries, size, fetched_at FROM feed_cache")
+        for url, etag, last_modified, entries, size, fetched_at in rows:
+            FEED_CACHE[url] = {
+                'etag': etag,
+                'last_modified': last_modified,
+                'entries': json.loads(entries),
+                'size': size,
+                'fetched_at': fetched_at,
+            }
+        for url, backlog, *values in db.fetchall(f"SELECT url, backlog, {', '.join(SOURCE_COLUMNS)} FROM sources"):
+            state = source_state(url)
+            state.update((column, value) for column, value in zip(SOURCE_COLUMNS, values) if value is not None)
+            state['backlog'] = json.loads(backlog) if backlog else []
+        _feed_cache_loaded = True
+
+def save_feed_cache(urls, fetched=()):
+    """Сохраняем обновлённые записи кэша и состояние опрошенных источников одной транзакцией"""
+    rows = [
+        (url, c['etag'], c['last_modified'], json.dumps(c['entries'], ensure_ascii=False), c['size'], c['fetched_at'])
+        for url, c in ((url, FEED_CACHE[url]) for url in urls)
+    ]
+    states = [(url, *(SOURCE_STATE[url][column] for column in SOURCE_COLUMNS)) for url in fetched]
+    if not rows and not states:
+        return
+    
+    def save(conn):
+        conn.executemany('''
+            INSERT OR REPLACE INTO feed_cache (url, etag, last_modified, entries, size, fetched_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', rows)
+        conn.executemany(f'''
+            INSERT INTO sources (url, {', '.join(SOURCE_COLUMNS)}) VALUES ({', '.join('?' * (len(SOURCE_COLUMNS) + 1))})
+            ON CONFLICT(url) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in SOURCE_COLUMNS)}
+        ''', states)
+    
+    db.transaction(save)
+
+FEED_READ_CHUNK = 16 * 1024
+
+def _local(tag):
+    return tag.rsplit('}', 1)[-1]
+
+def _parse_date(value):
+    """RFC 822 (RSS) или ISO 8601 (Atom) -> epoch; None, если не разобрали"""
+    if not value:
+        return None
+    value = value.strip()
+    parsed = parsedate_tz(value)
+    if parsed:
+        return mktime_tz(parsed)
+    try:
+        moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        return calendar.timegm(moment.timetuple())
+    return int(moment.timestamp())
+
+def _entry_fields(item):
+    """Только нужные боту поля записи RSS <item> или Atom <entry>"""
+    fields = {}
+    link = guid = None
+    for child in item:
+        name = _local(child.tag)
+        text = child.text or ''
+        if name == 'title':
+            fields['title'] = text.strip()
+        elif name == 'link':
+            # RSS - текст; Atom - href, предпочитаем rel="alternate"
+            href = child.get('href')
+            if href is None:
+                link = link or text.strip()
+            elif child.get('rel', 'alternate') == 'alternate' or link is None:
+                link = href
+        elif name == 'guid' and child.get('isPermaLink', 'true') != 'false':
+            guid = text.strip()
+        elif name in ('description', 'summary'):
+            fields['summary'] = text
+        elif name in ('encoded', 'content'):
+            fields.setdefault('content', text)
+        elif name in ('pubDate', 'published', 'updated', 'date'):
+            if name != 'updated' or 'published' not in fields:
+                fields['published'] = _parse_date(text)
+    return {
+        'title': fields.get('title', ''),
+        'link': link or guid,
+        'summary': fields.get('summary') or fields.get('content', ''),
+        'published': fields.get('published'),
+    }
+
+def entries_since(entries, since=None, ordered=True):
+    """Записи не старше since. В хронологической ленте (ordered) дальше первой старой
+    записи только более старые - на ней останавливаемся, не дочитывая ленту"""
+    for entry in entries:
+        if since is not None and entry['published'] is not None and entry['published'] < since:
+            if ordered:
+                return
+            continue
+        yield entry
+
+def iter_feed_entries(content):
+    """Потоковый разбор RSS/Atom: записи по одной, в порядке ленты.
+    
+    Разбор ленивый: если потребитель остановился (entries_since, лимит), остаток
+    ленты не читается. Прочитанные элементы сразу удаляются из дерева, поэтому память не растёт
+    с размером ленты. При битом XML бросает ET.ParseError.
+    """
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    stack = []
+    for offset in range(0, len(content), FEED_READ_CHUNK):
+        parser.feed(content[offset:offset + FEED_READ_CHUNK])
+        for event, elem in parser.read_events():
+            if event == 'start':
+                stack.append(elem)
+                continue
+            stack.pop()
+            if _local(elem.tag) not in ('item', 'entry'):
+                continue
+            entry = _entry_fields(elem)
+            elem.clear()
+            if stack:
+                stack[-1].remove(elem)
+            if entry['link']:
+                yield entry
+    parser.close()
+
+def parse_feed_entries(content, since=None, limit=FEED_CACHE_MAX_ENTRIES, ordered=True):
+    """Разбираем ленту и оставляем только нужные боту поля (не больше limit записей не старше since)"""
+    try:
+        return list(itertools.islice(entries_since(iter_feed_entries(content), since, ordered), limit))
+    except ET.ParseError:
+        # Битый XML (HTML-сущности, мусор в начале) - feedparser справится
+        return parse_feed_entries_feedparser(content, since, limit, ordered)
+
+def parse_feed_entries_feedparser(content, since=None, limit=FEED_CACHE_MAX_ENTRIES, ordered=True):
+    """Полный разбор через feedparser - запасной путь для некорректных лент"""
+    feed = feedparser.parse(content)
+    entries = []
+    for entry in feed.entries:
+        if not entry.get('link'):
+            continue
+        published = entry.get('published_parsed') or entry.get('updated_parsed')
+        entries.append({
+            'title': entry.get('title', ''),
+            'link': entry.link,
+            'summary': entry.get('summary', ''),
+            'published': calendar.timegm(published) if published else None,
+        })
+    return list(itertools.islice(entries_since(entries, since, ordered), limit))
+
+async def fetch_feed(client, semaphore, url, high_water=True):
+    """Скачиваем одну ленту с учётом кэша: (entries или None, обновлена ли запись кэша).
+    
+    В кэше - ленты целиком; high_water=True оставляет записи не старше high-water mark.
+    """
+    since = source_state(url)['high_water_ts'] if high_water else None
+    ordered = url not in UNORDERED_FEEDS
+    cached = FEED_CACHE.get(url)
+    if cached and time.time() - cached['fetched_at'] < FEED_CACHE_TTL:
+        FEED_CACHE_STATS['hits'] += 1
+        FEED_CACHE_STATS['bytes_saved'] += cached['size']
+        return list(entries_since(cached['entries'], since, ordered)), False
+    
+    # Условный запрос: сервер ответит 304, если лента не менялась
+    headers = {}
+    if cached and cached['etag']:
+        headers['If-None-Match'] = cached['etag']
+    if cached and cached['last_modified']:
+        headers['If-Modified-Since'] = cached['last_modified']
+    
+    async with semaphore:
+        started = time.monotonic()
+        try:
+            response = await asyncio.wait_for(client.get(url, headers=headers), FEED_FETCH_TIMEOUT)
+            if response.status_code != 304:
+                response.raise_for_status()
+        except Exception as e:
+            logger.warning(f"❌ Ошибка загрузки {url}: {e!r}", extra={'event': 'feed_error', 'url': url})
+            FEED_CACHE_STATS['errors'] += 1
+            record_fetch(url, time.monotonic() - started, error=True)
+            # Лучше устаревшие записи, чем ничего
+            return (list(entries_since(cached['entries'], since, ordered)) if cached else None), False
+        elapsed = time.monotonic() - started
+    
+    if response.status_code == 304:
+        record_fetch(url, elapsed, [])
+        FEED_CACHE_STATS['revalidated'] += 1
+        FEED_CACHE_STATS['bytes_saved'] += cached['size']
+        cached['fetched_at'] = time.time()
+        return list(entries_since(cached['entries'], since, ordered)), True
+    
+    loop = asyncio.get_running_loop()
+    entries = await loop.run_in_executor(FEED_PARSE_POOL, parse_feed_entries, response.content)
+    record_fetch(url, elapsed, entries)
+    
+    FEED_CACHE_STATS['misses'] += 1
+    FEED_CACHE_STATS['bytes_downloaded'] += len(response.content)
+    FEED_CACHE[url] = {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'entries': entries,
+        'size': len(response.content),
+        'fetched_at': time.time(),
+    }
+    return list(entries_since(entries, since, ordered)), True
+
+async def fetch_feeds(urls, high_water=True):
+    """Параллельная загрузка лент: {url: список записей или None при ошибке}.
+    
+    high_water=False - разбирать ленты целиком, без отсечки по high-water mark.
+    """
+    urls = list(dict.fromkeys(urls))
+    await run_blocking(load_feed_cache)
+    client = get_http_client()
+    semaphore = asyncio.Semaphore(FEED_FETCH_CONCURRENCY)
+    
+    started = time.monotonic()
+    started_ts = int(time.time())
+    results = await asyncio.gather(*(fetch_feed(client, semaphore, url, high_water) for url in urls))
+    # Состояние сохраняем для всех, к кому обращались, в том числе с ошибкой
+    fetched = [url for url in urls if url in SOURCE_STATE and (SOURCE_STATE[url]['last_fetch_ts'] or 0) >= started_ts]
+    await run_blocking(save_feed_cache, [url for url, (_, updated) in zip(urls, results) if updated], fetched)
+    
+    feeds = [entries for entries, _ in results]
+    fetched, seconds = sum(f is not None for f in feeds), time.monotonic() - started
+    logger.info(f"🌐 Получено лент: {fetched}/{len(urls)} за {seconds:.1f}с",
+                extra={'event': 'feeds', 'fetched': fetched, 'urls': len(urls), 'seconds': round(seconds, 3)})
+    
+    return dict(zip(urls, feeds))
+
 # ==================== CONTENT STRATEGY ====================
 
-def generate_daily_content():
-    """Генерация контента по расписанию"""
-    current_time = datetime.now().strftime('%H:%M')
-    
-    if current_time in DAILY_SCHEDULE:
-        schedule = DAILY_SCHEDULE[current_time]
-        content = ""
+class DailyAggregates:
+    """Итоги текущих суток UTC для рубрик и /stats: счётчики растут по событиям, а не COUNT(*) на каждый вызов.
+    
+    На смене суток (и при первом обращении) итоги один раз читаются из базы, дальше
+    их увеличивают публикация новости и сохранение трендов. Изменения - в транзакциях
+    писателя, как и у publish_queue.
+    """
+    
+    def __init__(self):
+        self.day = None
+        self.news_posted = 0
+        self.trends = 0
+        self.topics = {}
+    
+    def refresh(self, conn, now=None):
+        """Перечитывает итоги из базы, если сутки сменились"""
+        day = int(time.time() if now is None else now) // 86400 * 86400
+        if day == self.day:
+            return
+        bounds = (day, day + 86400)
+        self.news_posted = conn.execute(
+            "SELECT COUNT(*) FROM news WHERE added_ts >= ? AND added_ts < ? AND posted = 1", bounds).fetchone()[0]
+        self.trends = conn.execute(
+            "SELECT COUNT(*) FROM trend_data WHERE detected_ts >= ? AND detected_ts < ?", bounds).fetchone()[0]
+        self.topics = dict(conn.execute(
+            "SELECT topic, MAX(score) FROM trend_data WHERE detected_ts >= ? AND detected_ts < ? GROUP BY topic", bounds).fetchall())
+        self.day = day
+    
+    def add_posted(self, conn, added_ts):
+        # Та же выборка, что и при чтении из базы: опубликованные новости, добавленные сегодня
+        self.refresh(conn)
+        if added_ts is not None and self.day <= added_ts < self.day + 86400:
+            self.news_posted += 1
+    
+    def add_trends(self, conn, trends, now):
+        """trends - {тема: счёт} одного срабатывания радара"""
+        self.refresh(conn, now)
+        self.trends += len(trends)
+        for topic, score in trends.items():
+            self.topics[topic] = max(self.topics.get(topic, score), score)
+    
+    def snapshot(self):
+        """Итоги на сейчас: (новостей опубликовано, трендов, (тема, счёт) или None)"""
+        db.transaction(self.refresh)
+        top = max(self.topics.items(), key=lambda item: item[1], default=None)
+        return self.news_posted, self.trends, top
+
+daily_aggregates = DailyAggregates()
+
+# Готовые тексты рубрик по слотам: (время генерации, текст)
+RUBRIC_CACHE = {}
+RUBRIC_STATS = {slot: {'render_ms': 0.0, 'rendered_at': None, 'publish_ms': 0.0, 'hits': 0, 'misses': 0}
+                for slot in DAILY_SCHEDULE}
+
+def prerender_slot(slot):
+    """Время подготовки рубрики 'ЧЧ:ММ' - за RUBRIC_PRERENDER_SECONDS до слота"""
+    moment = datetime.strptime(slot, '%H:%M') - timedelta(seconds=RUBRIC_PRERENDER_SECONDS)
+    return moment.strftime('%H:%M')
+
+def render_rubric(slot):
+    """Генерация рубрики слота в RUBRIC_CACHE - вне пути публикации"""
+    started = time.perf_counter()
+    content = RUBRIC_GENERATORS[DAILY_SCHEDULE[slot]['type']]()
+    stats = RUBRIC_STATS[slot]
+    stats['render_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    stats['rendered_at'] = time.time()
+    RUBRIC_CACHE[slot] = (stats['rendered_at'], content)
+    return content
+
+def generate_daily_content(slot):
+    """Рубрика слота расписания ('09:00' и т.д.) в очередь: готовый текст или генерация на месте"""
+    if slot in DAILY_SCHEDULE:
+        schedule = DAILY_SCHEDULE[slot]
+        stats = RUBRIC_STATS[slot]
+        started = time.perf_counter()
         
-        if schedule['type'] == 'morning_briefing':
-            content = generate_morning_briefing()
-        elif schedule['type'] == 'market_stats':
-            content = generate_market_stats()
-        elif schedule['type'] == 'hot_topic':
-            content = generate_hot_topic()
-        elif schedule['type'] == 'daily_summary':
-            content = generate_daily_summary()
+        rendered_at, content = RUBRIC_CACHE.pop(slot, (0, ''))
+        cached = bool(content) and time.time() - rendered_at <= RUBRIC_MAX_AGE_SECONDS
+        if cached:
+            stats['hits'] += 1
+        else:
+            # Подготовка пропущена (рестарт, /generate) - генерируем сейчас
+            stats['misses'] += 1
+            content = render_rubric(slot)
+            RUBRIC_CACHE.pop(slot)
         
         # Добавляем в очередь
         if content:
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO content_queue (content_type, content_text, scheduled_time)
-                VALUES (?, ?, ?)
-            ''', (schedule['type'], content, datetime.now()))
-            conn.commit()
-            conn.close()
+            db.transaction(lambda conn: queue_content(conn, schedule['type'], content))
+            stats['publish_ms'] = round((time.perf_counter() - started) * 1000, 1)
             
-            print(f"✅ Сгенерирована рубрика: {schedule['name']}")
+            logger.info(f"✅ Рубрика в очереди: {schedule['name']} за {stats['publish_ms']} мс "
+                        f"({'готова заранее' if cached else 'сгенерирована на месте'}, генерация {stats['render_ms']} мс)",
+                        extra={'event': 'rubric', 'slot': slot, 'cached': cached,
+                               'publish_ms': stats['publish_ms'], 'render_ms': stats['render_ms']})
+
+def rubric_summary():
+    """Строки для /stats: стоимость генерации и публикации рубрик"""
+    lines = []
+    for slot, schedule in DAILY_SCHEDULE.items():
+        stats = RUBRIC_STATS[slot]
+        rendered = datetime.fromtimestamp(stats['rendered_at']).strftime('%H:%M') if stats['rendered_at'] else '-'
+        lines.append(f"• {slot} {schedule['type']}: генерация {stats['render_ms']} мс (в {rendered}), "
+                     f"публикация {stats['publish_ms']} мс, из кэша {stats['hits']}/{stats['hits'] + stats['misses']}")
+    return lines
 
 def generate_morning_briefing():
     """Утренний брифинг"""
@@ -291,6 +2209,14 @@ def generate_morning_briefing():
     content = "🌅 УТРЕННИЙ БРИФИНГ\n\n"
     content += "💹 Ключевые движения за ночь:\n"
     
+    # Движения за ночь из потока цен, без истории - изменение за 24ч
+    for crypto in binance_data:
+        night = price_book.change(crypto['symbol'] + 'USDT', PRICE_NIGHT_MINUTES)
+        if night is not None:
+            crypto['change'] = round(night, 2)
+            crypto['emoji'] = change_emoji(night)
+    binance_data.sort(key=lambda x: abs(x['change']), reverse=True)
+    
     for crypto in binance_data[:3]:
         change_text = f"+{crypto['change']:.1f}%" if crypto['change'] > 0 else f"{crypto['change']:.1f}%"
         content += f"{crypto['emoji']} {crypto['symbol']}: ${crypto['price']} ({change_text})\n"
@@ -304,43 +2230,50 @@ def generate_morning_briefing():
     return content
 
 def generate_market_stats():
-    """Рыночная статистика"""
+    """Рыночная статистика по истории тикеров: оборот, доли, волатильность и ширина рынка"""
     content = "📊 РЫНОЧНАЯ СТАТИСТИКА\n\n"
     
-    # Простая статистика
-    stats = [
-        "📈 Total Crypto Market Cap: $1.68T (+2.3%)",
-        "🔥 Fear & Greed Index: 76 (Greed)",
-        "💼 Bitcoin Dominance: 52.1%",
-        "🌊 Altcoin Season Index: 45"
-    ]
+    # Свежий снимок, чтобы рубрика не зависела от того, успел ли отработать планировщик
+    record_market_snapshot()
+    now = time.time()
+    volumes = market_history.latest('volume', now)
+    changes = market_history.change(24, now)
+    volatility = market_history.volatility(24, now)
+    
+    stats = []
+    volume = np.nansum(volumes)
+    if volume:
+        line = f"💵 Оборот {len(market_history.symbols)} пар за 24ч: ${volume / 1e9:.2f}B"
+        yesterday = np.nansum(market_history.latest('volume', now - 86400))
+        if yesterday:
+            line += f" ({(volume / yesterday - 1) * 100:+.1f}% к вчера)"
+        stats.append(line)
+        btc = market_history.index.get('BTCUSDT')
+        if btc is not None and not np.isnan(volumes[btc]):
+            stats.append(f"💼 Доля BTC в обороте: {volumes[btc] / volume * 100:.1f}%")
+    if np.isfinite(volatility).any():
+        stats.append(f"🌊 Волатильность за 24ч (медиана по парам): {np.nanmedian(volatility):.1f}%")
+    if np.isfinite(changes).any():
+        stats.append(f"⚖️ Растут за 24ч: {int((changes > 0).sum())} из {int(np.isfinite(changes).sum())} пар")
     
     for stat in stats:
         content += f"• {stat}\n"
     
     content += "\n📈 ТОП-3 движения дня:\n"
-    binance_data = get_binance_data()
-    for crypto in binance_data[:3]:
-        change_text = f"+{crypto['change']:.1f}%" if crypto['change'] > 0 else f"{crypto['change']:.1f}%"
-        content += f"{crypto['emoji']} {crypto['symbol']}: {change_text}\n"
+    movers = market_history.top_movers(24, 3, now)
+    if len(movers) < 3:
+        # Истории меньше суток - берём 24ч-изменение из тикеров
+        movers = [(crypto['symbol'], crypto['change']) for crypto in get_binance_data()[:3]]
+    for symbol, change in movers:
+        content += f"{change_emoji(change)} {symbol.replace('USDT', '')}: {change:+.1f}%\n"
     
     content += "\n#статистика #рынок"
     return content
 
 def generate_hot_topic():
     """Горячая тема дня"""
-    # Анализируем последние тренды
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT topic, score FROM trend_data 
-        WHERE date(detected_date) = date('now') 
-        ORDER BY score DESC 
-        LIMIT 1
-    ''')
-    
-    trend = cursor.fetchone()
-    conn.close()
+    # Самый сильный тренд за сутки - из дневных итогов
+    trend = daily_aggregates.snapshot()[2]
     
     if trend:
         topic, score = trend
@@ -368,18 +2301,20 @@ def generate_hot_topic():
     
     return content
 
+def market_activity(binance_data):
+    """Активность рынка: волатильность за сутки против средней за неделю по истории тикеров"""
+    today = market_history.volatility(24)
+    week = market_history.volatility(24 * 7)
+    if not (np.isfinite(today).any() and np.isfinite(week).any()):
+        # Истории ещё нет - по 24ч-изменениям тикеров
+        return 'Высокая' if any(abs(x['change']) > 5 for x in binance_data) else 'Умеренная'
+    today, week = np.nanmedian(today), np.nanmedian(week)
+    level = 'Высокая' if today > week * 1.3 else 'Низкая' if today < week * 0.7 else 'Умеренная'
+    return f"{level} (волатильность {today:.1f}% при средней за неделю {week:.1f}%)"
+
 def generate_daily_summary():
     """Итоги дня"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT COUNT(*) FROM news WHERE date(added_date) = date('now') AND posted = TRUE")
-    news_count = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT COUNT(*) FROM trend_data WHERE date(detected_date) = date('now')")
-    trends_count = cursor.fetchone()[0]
-    
-    conn.close()
+    news_count, trends_count, _ = daily_aggregates.snapshot()
     
     binance_data = get_binance_data()
     
@@ -387,7 +2322,7 @@ def generate_daily_summary():
     content += "📈 Сегодняшние итоги:\n"
     content += f"• Опубликовано новостей: {news_count}\n"
     content += f"• Обнаружено трендов: {trends_count}\n"
-    content += f"• Активность рынка: {'Высокая' if any(abs(x['change']) > 5 for x in binance_data) else 'Умеренная'}\n\n"
+    content += f"• Активность рынка: {market_activity(binance_data)}\n\n"
     
     content += "🔮 Прогноз на завтра:\n"
     content += "• Ожидаем новостей из Азии\n"
@@ -400,171 +2335,878 @@ def generate_daily_summary():
     content += "#итоги #прогноз"
     return content
 
+RUBRIC_GENERATORS = {
+    'morning_briefing': generate_morning_briefing,
+    'market_stats': generate_market_stats,
+    'hot_topic': generate_hot_topic,
+    'daily_summary': generate_daily_summary,
+}
+
 # ==================== NEWS SYSTEM ====================
 
-def parse_news():
-    """Парсинг новостей - 1 новость в 10 минут"""
-    print(f"{datetime.now().strftime('%H:%M:%S')} 🔍 Поиск новостей...")
-    
-    NEWS_SOURCES = {
-        'cointelegraph': 'https://cointelegraph.com/rss',
-        'decrypt': 'https://decrypt.co/feed',
-        'cryptonews': 'https://cryptonews.com/news/feed/',
-        'coin desk': 'https://www.coindesk.com/arc/outboundfeeds/rss/',
-    }
-    
-    for source_name, source_url in NEWS_SOURCES.items():
+# Метрики ингестии: последний цикл и накопленные итоги
+INGEST_STATS = {'cycles': 0, 'last_new': 0, 'last_duplicates': 0, 'last_seconds': 0.0, 'total_new': 0, 'total_duplicates': 0}
+
+# Ручной /news и плановая ингестия не должны пересекаться на story_index
+INGEST_LOCK = asyncio.Lock()
+# Свежесть: задержка от published записи до сохранения, по последним историям
+INGEST_LAGS = deque(maxlen=500)
+
+NEWS_INGESTED = metrics_registry.counter('news_ingested_total', 'Новые истории, сохранённые ингестией')
+NEWS_DUPLICATES = metrics_registry.counter('news_duplicates_total', 'Дубликаты историй из других источников')
+
+@metrics_registry.timed('parse_news_seconds', 'Цикл ингестии новостей')
+async def parse_news(due_only=True):
+    """Ингестия новостей: все новые записи лент, которым пора на опрос, за один цикл.
+    
+    Темп публикации задаёт только доставка (publish_next и outbox), здесь сохраняется
+    всё новое одной транзакцией. due_only=False опрашивает все ленты (ручной /news).
+    Возвращает число новых историй.
+    """
+    async with INGEST_LOCK:
+        due = set(await run_blocking(due_sources, NEWS_SOURCES.values()) if due_only else NEWS_SOURCES.values())
+        if not due:
+            return 0
+        logger.info(f"🔍 Поиск новостей ({len(due)}/{len(NEWS_SOURCES)} лент)...")
+        started = time.monotonic()
+        
+        feeds = await fetch_feeds(due)
+        
+        # Одна статья под разными ссылками (utm_*, www, слэш) - один кандидат
+        # Сверх лимита записи ленты уходят в backlog источника до следующего цикла
+        batches, marks = take_feed_entries(feeds, NEWS_ENTRIES_PER_SOURCE)
+        candidates = {}
+        for source_name, source_url in NEWS_SOURCES.items():
+            for entry in batches.get(source_url, []):
+                candidates.setdefault(link_hash(entry['link']), (source_name, entry))
+        
+        # Проверяем дубликаты: Bloom-фильтр отсекает точно новые ссылки, остальные -
+        # один запрос по индексу link_hash
+        await run_blocking(link_filter.sync)
+        hashes = list(candidates)
+        maybe = link_filter.contains(hashes)
+        hashes = [key for key, seen in zip(hashes, maybe) if seen]
+        link_filter.stats['checked'] += len(maybe)
+        link_filter.stats['skipped'] += len(maybe) - len(hashes)
+        known = set()
+        for i in range(0, len(hashes), 500):
+            chunk = hashes[i:i + 500]
+            placeholders = ','.join('?' * len(chunk))
+            # Ссылки архивных новостей тоже известны: иначе старая статья из ленты вернётся как новая
+            known.update(row[0] for row in await run_blocking(db.fetchall, f'''
+                SELECT link_hash FROM news WHERE link_hash IN ({placeholders})
+                UNION SELECT link_hash FROM archived_links WHERE link_hash IN ({placeholders})
+            ''', chunk * 2))
+        
+        link_filter.stats['false_positives'] += len(hashes) - len(known)
+        
+        now = int(time.time())
+        stories = []
+        duplicates = []
+        fresh = [(key, source_name, entry) for key, (source_name, entry) in candidates.items() if key not in known]
+        # Чистое первое предложение из статьи - пачкой для всех новых записей
+        summaries = extract_clean_summaries([entry['summary'] for _, _, entry in fresh])
+        # Временные отрицательные id попадают в story_index по ходу разбора: любой сбой
+        # дальше (перевод, запись) должен их убрать, иначе следующий цикл сошлётся на них
+        ids = {}
         try:
-            feed = feedparser.parse(source_url)
+            for (key, source_name, entry), clean_summary in zip(fresh, summaries):
+                try:
+                    # Тип контента и темы - один проход по заголовку
+                    analysis = term_matcher.analyze(entry['title'])
+                    content_type = term_matcher.content_type(analysis)
+                    item = {
+                        'title': entry['title'],
+                        'link': entry['link'],
+                        'link_hash': key,
+                        'published': entry['published'],
+                        'summary': clean_summary,
+                        'source': source_name,
+                        'content_type': content_type,
+                        'priority': CONTENT_PRIORITY.get(content_type, DEFAULT_PRIORITY),
+                        'added_ts': now,
+                        'tags': ' '.join(term_matcher.tags(analysis)),
+                        'topics': ','.join(dict.fromkeys(analysis['topic'])),
+                        'signature': story_index.signature(f"{entry['title']} {clean_summary}"),
+                    }
+                except Exception as e:
+                    logger.error(f"❌ Ошибка {source_name}: {e}")
+                    continue
+                
+                # Та же история из другого источника (в том числе из этой же пачки)
+                item['duplicate_of'] = story_index.find(item['signature'])
+                if item['duplicate_of'] is not None:
+                    duplicates.append(item)
+                    continue
+                
+                stories.append(item)
+                if item['signature'] is not None:
+                    # Временный отрицательный id до вставки в базу
+                    story_index.add(-len(stories), item['signature'])
             
-            for entry in feed.entries[:5]:
-                # Проверяем дубликаты
-                conn = sqlite3.connect(DB_PATH)
-                cursor = conn.cursor()
-                cursor.execute("SELECT 1 FROM news WHERE link = ?", (entry.link,))
-                exists = cursor.fetchone() is not None
+            # Профессиональный перевод заголовков - одной пачкой на каждый язык каналов
+            titles = [item['title'] for item in stories]
+            translated = await translator.translate_many(titles, DEFAULT_LANGUAGE)
+            for lang in sorted(channel_languages() - {DEFAULT_LANGUAGE}):
+                await translator.translate_many(titles, lang)
+            
+            def save(conn):
+                conn.executemany('''
+                    INSERT OR IGNORE INTO news (title, title_original, link, link_hash, summary, source, content_type, priority, added_ts, tags, topics)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', [(title, item['title'], item['link'], item['link_hash'], item['summary'], item['source'], item['content_type'],
+                       item['priority'], item['added_ts'], item['tags'], item['topics']) for title, item in zip(translated, stories)])
                 
-                if not exists:
-                    # Профессиональный перевод заголовка
-                    translated_title = translate_text(entry.title)
-                    
-                    # Извлекаем чистое первое предложение из статьи
-                    article_text = entry.summary if hasattr(entry, 'summary') and entry.summary else ""
-                    clean_summary = extract_clean_summary(article_text)
-                    
-                    # Определяем тип контента
-                    content_type = 'regular'
-                    title_lower = entry.title.lower()
-                    if any(word in title_lower for word in ['break', 'urgent', 'alert']):
-                        content_type = 'breaking'
-                    elif any(word in title_lower for word in ['analysis', 'research']):
-                        content_type = 'analysis'
-                    elif any(word in title_lower for word in ['exploit', 'hack', 'warning']):
-                        content_type = 'warning'
-                    
-                    # Сохраняем новость
-                    cursor.execute('''
-                        INSERT INTO news (title, link, summary, source, content_type)
-                        VALUES (?, ?, ?, ?, ?)
-                    ''', (translated_title, entry.link, clean_summary, source_name, content_type))
-                    
-                    print(f"   ✅ {source_name}: {translated_title[:60]}...")
-                    conn.commit()
-                    conn.close()
-                    return True  # Только одну новость за раз
+                ids = {}
+                for i in range(0, len(stories), 500):
+                    chunk = [item['link'] for item in stories[i:i + 500]]
+                    ids.update(conn.execute(
+                        f"SELECT link, id FROM news WHERE link IN ({','.join('?' * len(chunk))})", chunk).fetchall())
                 
-                conn.close()
-                    
-        except Exception as e:
-            print(f"❌ Ошибка {source_name}: {e}")
-    
-    print("📭 Новых новостей не найдено")
-    return False
+                conn.executemany("INSERT INTO story_signatures (cluster_id, signature) VALUES (?, ?)",
+                                 [(ids[item['link']], item['signature'].tobytes())
+                                  for item in stories if item['signature'] is not None])
+                for item in stories:
+                    publish_queue.push_news(ids[item['link']], item['priority'], item['added_ts'], item['tags'],
+                                            item['content_type'], item['topics'])
+                
+                # Дубликаты - без перевода, со ссылкой на представителя
+                conn.executemany('''
+                    INSERT OR IGNORE INTO news (title, title_original, link, link_hash, summary, source, content_type, priority, added_ts, tags, topics, duplicate_of)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', [(item['title'], item['title'], item['link'], item['link_hash'], item['summary'], item['source'], item['content_type'], item['priority'],
+                       item['added_ts'], item['tags'], item['topics'],
+                       ids[stories[-item['duplicate_of'] - 1]['link']] if item['duplicate_of'] < 0 else item['duplicate_of'])
+                      for item in duplicates])
+                # Отметки и backlog лент сдвигаются в той же транзакции, что и сохранение их записей
+                conn.executemany("UPDATE sources SET high_water_ts = ?, backlog = ? WHERE url = ?",
+                                 [(mark, json.dumps(backlog, ensure_ascii=False), url) for mark, backlog, url in marks])
+                return ids
+            
+            ids = await run_blocking(db.transaction, save) if stories or duplicates or marks else {}
+            for mark, backlog, url in marks:
+                source_state(url).update(high_water_ts=mark, backlog=backlog)
+        finally:
+            # Временные id заменяем настоящими
+            for n, item in enumerate(stories, 1):
+                if item['signature'] is not None:
+                    story_index.remove(-n)
+                    if item['link'] in ids:
+                        story_index.add(ids[item['link']], item['signature'])
+        
+        for title, item in zip(translated, stories):
+            logger.info(f"   ✅ {item['source']}: {title[:60]}...")
+            if item['published']:
+                INGEST_LAGS.append(max(0, item['added_ts'] - item['published']))
+        
+        INGEST_STATS['cycles'] += 1
+        INGEST_STATS['last_new'] = len(stories)
+        INGEST_STATS['last_duplicates'] = len(duplicates)
+        INGEST_STATS['last_seconds'] = round(time.monotonic() - started, 2)
+        INGEST_STATS['total_new'] += len(stories)
+        INGEST_STATS['total_duplicates'] += len(duplicates)
+        NEWS_INGESTED.inc(len(stories))
+        NEWS_DUPLICATES.inc(len(duplicates))
+        
+        if not stories:
+            logger.info("📭 Новых новостей не найдено")
+        else:
+            logger.info(f"📥 Новых историй: {len(stories)}, дубликатов: {len(duplicates)} за {INGEST_STATS['last_seconds']}с",
+                        extra={'event': 'ingest', 'new': len(stories), 'duplicates': len(duplicates),
+                               'seconds': INGEST_STATS['last_seconds']})
+        return len(stories)
+
+def source_summary():
+    """Строки для /stats: нагрузка на ленты, интервалы опроса и свежесть новостей"""
+    states = [source_state(url) for url in NEWS_SOURCES.values()]
+    intervals = sorted(state['poll_interval'] for state in states) or [NEWS_INTERVAL_SECONDS]
+    errors = sum(state['errors'] for state in states)
+    fixed = len(states) * 3600 // NEWS_INTERVAL_SECONDS
+    lines = [
+        f"• Загрузок за час: {fetches_per_hour()} (при опросе всех раз в {NEWS_INTERVAL_SECONDS // 60} мин: {fixed})",
+        f"• Интервал опроса: {intervals[0] // 60}-{intervals[-1] // 60} мин, медиана {intervals[len(intervals) // 2] // 60} мин",
+        f"• Ошибок загрузки: {errors}",
+    ]
+    if INGEST_LAGS:
+        p50, p99 = np.percentile(INGEST_LAGS, [50, 99]) / 60
+        lines.append(f"• Свежесть: p50 {p50:.0f} мин, p99 {p99:.0f} мин от публикации до базы")
+    return lines
+
+# ==================== MARKET DATA ====================
+
+class MarketData:
+    """Тикеры Binance за 24ч: один пакетный запрос на все пары и общий TTL-кэш.
+    
+    Утренний брифинг, статистика и итоги дня берут данные отсюда, поэтому за
+    время жизни кэша к Binance уходит не больше одного запроса на пачку символов.
+    """
+    
+    def __init__(self, base_url, symbols, ttl=60, timeout=5, batch_size=100):
+        self.base_url = base_url.rstrip('/')
+        self.symbols = list(symbols)
+        self.ttl = ttl
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=8)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._lock = threading.Lock()
+        self._tickers = {}
+        self._fetched = 0.0
+        self.stats = {'requests': 0, 'hits': 0, 'errors': 0}
+    
+    @metrics_registry.timed('binance_request_seconds', 'Запросы тикеров к Binance REST')
+    def _fetch(self):
+        tickers = {}
+        for i in range(0, len(self.symbols), self.batch_size):
+            chunk = self.symbols[i:i + self.batch_size]
+            self.stats['requests'] += 1
+            response = self.session.get(f"{self.base_url}/api/v3/ticker/24hr",
+                                        params={'symbols': json.dumps(chunk, separators=(',', ':'))},
+                                        timeout=self.timeout)
+            response.raise_for_status()
+            for ticker in response.json():
+                tickers[ticker['symbol']] = ticker
+        return tickers
+    
+    def tickers(self):
+        """Словарь symbol -> тикер; при ошибке Binance - последние полученные данные"""
+        with self._lock:
+            if self._tickers and time.monotonic() - self._fetched < self.ttl:
+                self.stats['hits'] += 1
+                return self._tickers
+            try:
+                self._tickers = self._fetch()
+                self._fetched = time.monotonic()
+            except (requests.RequestException, ValueError, KeyError) as e:
+                self.stats['errors'] += 1
+                logger.error(f"❌ Ошибка Binance: {e}")
+            return self._tickers
 
+def change_emoji(change_percent):
+    if change_percent > 5:
+        return "🚀"
+    elif change_percent > 2:
+        return "📈"
+    elif change_percent > 0:
+        return "↗️"
+    elif change_percent < -5:
+        return "💥"
+    elif change_percent < -2:
+        return "📉"
+    return "➡️"
+
+market_data = MarketData(BINANCE_API_URL, BINANCE_SYMBOLS, BINANCE_CACHE_TTL)
+
+@metrics_registry.timed('get_binance_data_seconds', 'Тикеры Binance с учётом кэша')
 def get_binance_data():
     """Данные с Binance"""
-    try:
-        symbols = ['BTCUSDT', 'ETHUSDT', 'ADAUSDT', 'JASMYUSDT', 'SOLUSDT']
-        data = []
+    data = []
+    for symbol, ticker in market_data.tickers().items():
+        change_percent = float(ticker['priceChangePercent'])
+        price = float(ticker['lastPrice'])
+        data.append({
+            'symbol': symbol.replace('USDT', ''),
+            # Дешёвым монетам вроде JASMY нужно больше знаков
+            'price': round(price, 4 if price < 1 else 2),
+            'change': change_percent,
+            'emoji': change_emoji(change_percent)
+        })
+    
+    return sorted(data, key=lambda x: abs(x['change']), reverse=True)
+
+# ==================== PRICE STREAM ====================
+
+class PriceBook:
+    """Минутные свечи OHLC по каждой паре в кольцевых буферах NumPy.
+    
+    Слот свечи - минута по модулю длины истории, поэтому обновление и поиск
+    цены N минут назад стоят O(1) без сдвигов массивов.
+    """
+    
+    def __init__(self, symbols, minutes=PRICE_HISTORY_MINUTES):
+        self.size = minutes
+        self.index = {symbol: i for i, symbol in enumerate(symbols)}
+        shape = (len(self.index), minutes)
+        self.ohlc = np.zeros(shape + (4,), dtype=np.float64)
+        # Минута, которой принадлежит слот; -1 - слот пуст
+        self.minute = np.full(shape, -1, dtype=np.int64)
+        self.last = np.full(len(self.index), -1, dtype=np.int64)
+    
+    def update(self, symbol, price, ts):
+        """Учитывает сделку/тик; возвращает номер строки пары или None"""
+        row = self.index.get(symbol)
+        if row is None:
+            return None
+        minute = int(ts // 60)
+        slot = minute % self.size
+        candle = self.ohlc[row, slot]
+        if self.minute[row, slot] != minute:
+            self.minute[row, slot] = minute
+            candle[:] = price
+        else:
+            if price > candle[1]:
+                candle[1] = price
+            if price < candle[2]:
+                candle[2] = price
+            candle[3] = price
+        if minute > self.last[row]:
+            self.last[row] = minute
+        return row
+    
+    def change(self, symbol, minutes):
+        """Изменение цены в процентах за minutes минут или None, если истории нет"""
+        row = self.index.get(symbol)
+        if row is None or self.last[row] < 0:
+            return None
+        now = self.last[row]
+        past = now - minutes
+        slot = past % self.size
+        if minutes >= self.size or self.minute[row, slot] != past:
+            return None
+        base = self.ohlc[row, slot, 3]
+        return (self.ohlc[row, now % self.size, 3] / base - 1) * 100 if base else None
+    
+    def price(self, symbol):
+        row = self.index.get(symbol)
+        if row is None or self.last[row] < 0:
+            return None
+        return float(self.ohlc[row, self.last[row] % self.size, 3])
+
+class PriceStream:
+    """Потребитель комбинированного потока Binance (miniTicker или kline).
+    
+    Держит PriceBook в актуальном состоянии, при пересечении порога вызывает
+    on_alert(symbol, change, price) и переподключается с экспоненциальной паузой.
+    """
+    
+    def __init__(self, url, symbols, book, on_alert=None, stream='miniTicker',
+                 threshold=PRICE_ALERT_PERCENT, window=PRICE_ALERT_WINDOW_MINUTES,
+                 cooldown=PRICE_ALERT_COOLDOWN_MINUTES):
+        self.url = url.rstrip('/')
+        self.symbols = list(symbols)
+        self.book = book
+        self.on_alert = on_alert
+        self.stream = stream
+        self.threshold = threshold
+        self.window = window
+        self.cooldown = cooldown * 60
+        self._alerted = {}
+        self.stats = {'messages': 0, 'connects': 0, 'errors': 0, 'alerts': 0}
+    
+    def stream_url(self):
+        streams = '/'.join(f"{symbol.lower()}@{self.stream}" for symbol in self.symbols)
+        return f"{self.url}/stream?streams={streams}"
+    
+    def handle(self, message):
+        """Разбирает один кадр потока; возвращает алерт (symbol, change, price) или None"""
+        data = json.loads(message)
+        data = data.get('data', data)
+        kline = data.get('k')
+        symbol = data['s']
+        price = float(kline['c'] if kline else data['c'])
+        ts = data['E'] / 1000
+        self.stats['messages'] += 1
         
-        for symbol in symbols:
+        if self.book.update(symbol, price, ts) is None:
+            return None
+        change = self.book.change(symbol, self.window)
+        if change is None or abs(change) < self.threshold:
+            return None
+        if ts - self._alerted.get(symbol, float('-inf')) < self.cooldown:
+            return None
+        self._alerted[symbol] = ts
+        self.stats['alerts'] += 1
+        return symbol, change, price
+    
+    async def run(self, min_backoff=1, max_backoff=60):
+        """Читает поток бесконечно, переподключаясь после обрывов"""
+        backoff = min_backoff
+        while True:
             try:
-                url = f"https://api.binance.com/api/v3/ticker/24hr?symbol={symbol}"
-                response = requests.get(url, timeout=5)
-                
-                if response.status_code == 200:
-                    ticker = response.json()
-                    change_percent = float(ticker['priceChangePercent'])
-                    
-                    if change_percent > 5:
-                        emoji = "🚀"
-                    elif change_percent > 2:
-                        emoji = "📈" 
-                    elif change_percent > 0:
-                        emoji = "↗️"
-                    elif change_percent < -5:
-                        emoji = "💥"
-                    elif change_percent < -2:
-                        emoji = "📉"
-                    else:
-                        emoji = "➡️"
-                    
-                    data.append({
-                        'symbol': symbol.replace('USDT', ''),
-                        'price': round(float(ticker['lastPrice']), 4 if symbol == 'JASMYUSDT' else 2),
-                        'change': change_percent,
-                        'emoji': emoji
-                    })
-            except:
-                continue
+                async with websockets.connect(self.stream_url(), ping_interval=20, max_queue=1024) as ws:
+                    self.stats['connects'] += 1
+                    logger.info(f"📡 Поток цен подключен: {len(self.symbols)} пар")
+                    backoff = min_backoff
+                    async for message in ws:
+                        try:
+                            alert = self.handle(message)
+                        except (ValueError, KeyError, TypeError) as e:
+                            self.stats['errors'] += 1
+                            logger.warning(f"⚠️ Кадр потока цен пропущен: {e}")
+                            continue
+                        if alert and self.on_alert:
+                            await run_blocking(self.on_alert, *alert)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.warning(f"❌ Поток цен оборвался: {e}, повтор через {backoff}с", extra={'event': 'stream_reconnect'})
+            await asyncio.sleep(backoff * random.uniform(0.8, 1.2))
+            backoff = min(backoff * 2, max_backoff)
+
+def generate_price_alert(symbol, change, price):
+    """Пост о резком движении цены"""
+    direction = "🚀 РЕЗКИЙ РОСТ" if change > 0 else "💥 РЕЗКОЕ ПАДЕНИЕ"
+    name = symbol.replace('USDT', '')
+    content = f"{direction}\n{name}: {change:+.1f}% за {PRICE_ALERT_WINDOW_MINUTES} мин\n\n"
+    content += f"💰 Цена: ${round(price, 4 if price < 1 else 2)}\n\n"
+    content += f"#алерт #{name.lower()}"
+    return content
+
+PRICE_ALERTS = metrics_registry.counter('price_alerts_total', 'Ценовые алерты в очереди')
+
+def queue_price_alert(symbol, change, price):
+    """Ставит ценовой алерт в очередь на немедленную публикацию"""
+    text = generate_price_alert(symbol, change, price)
+    db.transaction(lambda conn: queue_content(conn, 'price_alert', text))
+    PRICE_ALERTS.inc()
+    logger.info(f"🚨 Ценовой алерт: {symbol} {change:+.1f}%", extra={'event': 'price_alert', 'symbol': symbol, 'change': round(change, 2)})
+
+price_book = PriceBook(BINANCE_SYMBOLS)
+price_stream = PriceStream(BINANCE_WS_URL, BINANCE_SYMBOLS, price_book, queue_price_alert)
+
+# ==================== MARKET HISTORY ====================
+
+class MarketHistory:
+    """Минутная история тикеров: дневные сегменты-столбцы в memory-mapped файлах.
+    
+    Сегмент - ГГГГ-ММ-ДД.npy формы (пары, 1440, 2) float32: цена и 24ч-оборот
+    в котируемой валюте, NaN - снимка не было. Номер строки пары задаёт
+    append-only реестр symbols.json, поэтому строка i во всех днях - одна пара.
+    Запись - один столбец минуты за раз, агрегаты считаются векторно по всем
+    парам сразу и читают только дни, попавшие в окно.
+    """
+    
+    FIELDS = ('price', 'volume')
+    MINUTES = 1440
+    
+    def __init__(self, path, symbols=()):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._segments = {}
+        registry = os.path.join(path, 'symbols.json')
+        self.symbols = []
+        if os.path.exists(registry):
+            with open(registry) as f:
+                self.symbols = json.load(f)
+        self.index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.stats = {'snapshots': 0, 'last_ts': None}
+        self.register(symbols)
+    
+    def register(self, symbols):
+        """Добавляет новые пары в конец реестра"""
+        new = [symbol for symbol in dict.fromkeys(symbols) if symbol not in self.index]
+        if not new:
+            return
+        with self._lock:
+            for symbol in new:
+                self.index[symbol] = len(self.symbols)
+                self.symbols.append(symbol)
+            temp = os.path.join(self.path, 'symbols.json.tmp')
+            with open(temp, 'w') as f:
+                json.dump(self.symbols, f)
+            os.replace(temp, os.path.join(self.path, 'symbols.json'))
+    
+    def _file(self, day):
+        return os.path.join(self.path, time.strftime('%Y-%m-%d', time.gmtime(day * 86400)) + '.npy')
+    
+    def _segment(self, day, create=False):
+        """memmap сегмента дня (номер дня от эпохи) или None; create - создать или дорастить до всех пар"""
+        segment = self._segments.get(day)
+        if segment is not None and (not create or len(segment) >= len(self.symbols)):
+            return segment
+        with self._lock:
+            path = self._file(day)
+            if segment is None and os.path.exists(path):
+                segment = np.lib.format.open_memmap(path, mode='r+')
+            if create and (segment is None or len(segment) < len(self.symbols)):
+                # Новые пары посреди дня: сегмент пересоздаётся с запасом строк
+                grown = np.lib.format.open_memmap(path + '.tmp', mode='w+', dtype=np.float32,
+                                                  shape=(len(self.symbols), self.MINUTES, len(self.FIELDS)))
+                grown[:] = np.nan
+                if segment is not None:
+                    grown[:len(segment)] = segment
+                grown.flush()
+                os.replace(path + '.tmp', path)
+                segment = grown
+            if segment is not None:
+                self._segments[day] = segment
+            return segment
+    
+    def append(self, ts, prices, volumes=None):
+        """Снимок всех пар за минуту ts: массивы в порядке self.symbols (NaN - нет данных)"""
+        ts = int(ts)
+        segment = self._segment(ts // 86400, create=True)
+        minute = ts % 86400 // 60
+        segment[:len(prices), minute, 0] = prices
+        if volumes is not None:
+            segment[:len(volumes), minute, 1] = volumes
+        self.stats['snapshots'] += 1
+        self.stats['last_ts'] = ts
+    
+    def append_tickers(self, ts, tickers):
+        """Снимок из ответа /api/v3/ticker/24hr: {symbol: ticker}"""
+        self.register(tickers)
+        prices = np.full(len(self.symbols), np.nan, dtype=np.float32)
+        volumes = np.full(len(self.symbols), np.nan, dtype=np.float32)
+        for symbol, ticker in tickers.items():
+            row = self.index[symbol]
+            prices[row] = float(ticker['lastPrice'])
+            volumes[row] = float(ticker.get('quoteVolume') or 'nan')
+        self.append(ts, prices, volumes)
+    
+    def window(self, field, minutes, end=None):
+        """Матрица (пары, minutes) поля за минуты, заканчивающиеся минутой end включительно"""
+        end = int(time.time() if end is None else end) // 60
+        start = end - minutes + 1
+        column = self.FIELDS.index(field)
+        result = np.full((len(self.symbols), minutes), np.nan, dtype=np.float32)
+        minute = start
+        while minute <= end:
+            day = minute // self.MINUTES
+            stop = min(end + 1, (day + 1) * self.MINUTES)
+            segment = self._segment(day)
+            if segment is not None:
+                result[:len(segment), minute - start:stop - start] = \
+                    segment[:, minute % self.MINUTES:(stop - 1) % self.MINUTES + 1, column]
+            minute = stop
+        return result
+    
+    @staticmethod
+    def _ffill(values):
+        """Пропуски - последним известным значением слева (по строкам)"""
+        valid = ~np.isnan(values)
+        positions = np.where(valid, np.arange(values.shape[1]), 0)
+        np.maximum.accumulate(positions, axis=1, out=positions)
+        return values[np.arange(len(values))[:, None], positions]
+    
+    def change(self, hours, end=None):
+        """Изменение цены всех пар за hours часов, %; NaN - не хватает истории.
         
-        return sorted(data, key=lambda x: abs(x['change']), reverse=True)
-    except Exception as e:
-        return []
+        Читает только по часу у концов окна, поэтому не зависит от его длины.
+        """
+        end = time.time() if end is None else end
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return (self.latest('price', end) / self.latest('price', end - hours * 3600) - 1) * 100
+    
+    def volatility(self, hours, end=None):
+        """Реализованная волатильность за hours часов: σ минутных лог-доходностей, приведённая к суткам, %"""
+        prices = self._ffill(self.window('price', hours * 60 + 1, end))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            returns = np.diff(np.log(prices), axis=1)
+        # Меньше двух доходностей - не волатильность, а NaN (и без RuntimeWarning от nanstd)
+        result = np.full(len(returns), np.nan)
+        enough = np.isfinite(returns).sum(axis=1) >= 2
+        result[enough] = np.nanstd(returns[enough], axis=1) * np.sqrt(self.MINUTES) * 100
+        return result
+    
+    def latest(self, field, end=None, minutes=60):
+        """Последнее известное значение поля каждой пары не раньше minutes минут до end"""
+        return self._ffill(self.window(field, minutes, end))[:, -1]
+    
+    def dominance(self, end=None):
+        """Доля каждой пары в суммарном 24ч-обороте по последнему снимку, %"""
+        volumes = self.latest('volume', end)
+        total = np.nansum(volumes)
+        return volumes / total * 100 if total else np.full(len(volumes), np.nan)
+    
+    def top_movers(self, hours, count=3, end=None):
+        """Пары с наибольшим по модулю изменением: [(symbol, change)]"""
+        changes = self.change(hours, end)
+        order = np.argsort(-np.nan_to_num(np.abs(changes), nan=-1))[:count]
+        return [(self.symbols[i], float(changes[i])) for i in order if not np.isnan(changes[i])]
+    
+    def days(self):
+        return sorted(name[:-4] for name in os.listdir(self.path) if name.endswith('.npy'))
+    
+    def prune(self, keep_days):
+        """Удаляет сегменты старше keep_days суток; число удалённых"""
+        cutoff = int(time.time()) // 86400 - keep_days
+        removed = 0
+        for name in self.days():
+            day = calendar.timegm(time.strptime(name, '%Y-%m-%d')) // 86400
+            if day < cutoff:
+                with self._lock:
+                    self._segments.pop(day, None)
+                    os.remove(self._file(day))
+                removed += 1
+        return removed
+
+def record_market_snapshot():
+    """Минутный снимок тикеров в историю (тикеры из общего TTL-кэша MarketData)"""
+    tickers = market_data.tickers()
+    if tickers:
+        market_history.append_tickers(time.time(), tickers)
+
+market_history = MarketHistory(MARKET_HISTORY_DIR, BINANCE_SYMBOLS)
+
+# ==================== CHANNELS ====================
+
+# Подписи шаблонов для каналов не на русском
+CONTENT_TEMPLATES_EN = {
+    'breaking': "🚨 BREAKING\n{content}",
+    'analysis': "🔍 ANALYSIS\n{content}",
+    'educational': "🎓 LEARN\n{content}",
+    'alert': "⚠️ ALERT\n{content}",
+    'success': "✅ SUCCESS\n{content}",
+    'trend': "📈 TREND\n{content}",
+    'warning': "🔔 WARNING\n{content}",
+    'regular': "📰 {content}"
+}
+
+class Channel:
+    """Канал рассылки: язык, фильтры по типу контента и темам, минимальный интервал новостей"""
+    
+    def __init__(self, chat_id, lang=DEFAULT_LANGUAGE, content_types=None, keywords=None,
+                 cadence_minutes=0, style='full'):
+        self.chat_id = str(chat_id)
+        self.lang = lang
+        self.content_types = set(content_types) if content_types else None
+        # Ключевые слова сводим к темам словаря: "btc" и "bitcoin" - одно и то же
+        self.keywords = None
+        if keywords:
+            self.keywords = set()
+            for keyword in keywords:
+                self.keywords.update(term_matcher.analyze(keyword)['topic'] or [keyword.lower()])
+        self.cadence = cadence_minutes * 60
+        self.style = style
+        self.last_news_ts = 0
+    
+    @property
+    def variant(self):
+        """Каналы с одинаковым вариантом получают один и тот же текст"""
+        return (self.lang, self.style)
+    
+    def wants(self, kind, content_type, topics):
+        """Фильтры канала по типу контента и темам - без учёта интервала"""
+        if self.content_types is not None and content_type not in self.content_types:
+            return False
+        if kind != 'news':
+            return True
+        return self.keywords is None or bool(self.keywords & topics)
+    
+    def ready(self, now):
+        """Прошёл ли минимальный интервал с прошлой новости канала"""
+        return now - self.last_news_ts >= self.cadence
+    
+    def accepts(self, kind, content_type, topics, now):
+        return self.wants(kind, content_type, topics) and (kind != 'news' or self.ready(now))
+
+def load_channels(path=CHANNELS_PATH):
+    """Реестр каналов из JSON-списка [{"chat_id": ..., "lang": "en", ...}]"""
+    if not path:
+        return [Channel(chat_id) for chat_id in CHANNEL_IDS]
+    with open(path, encoding='utf-8') as f:
+        return [Channel(**config) for config in json.load(f)]
+
+CHANNELS = load_channels()
+
+def channel_languages():
+    return {channel.lang for channel in CHANNELS}
 
 # ==================== CONTENT DELIVERY ====================
 
+class PublishQueue:
+    """Очередь публикации в памяти поверх content_queue и news: выбор за O(log n) без SQL-сортировки.
+    
+    Рубрики лежат в куче по scheduled_ts (UTC), дошедшие до срока переходят в кучу
+    готовых по SCHEDULED_PRIORITY. Новости - в куче по рангу: ln(вес типа) + бонус тренда
+    + added_ts * ln2 / период полураспада. Затухание свежести одинаково для всех новостей,
+    поэтому порядок не зависит от текущего времени и ключи кучи не пересчитываются.
+    
+    База остаётся источником истины: запись идёт сначала в таблицу, потом в кучу
+    (в той же транзакции писателя), при старте кучи собираются из базы заново.
+    Все изменения - только в потоке писателя, поэтому без блокировок. Удалённые
+    или уже опубликованные строки пропускаются при выборе (ленивое удаление).
+    """
+    
+    def __init__(self, halflife=QUEUE_FRESHNESS_HALFLIFE, trend_weight=QUEUE_TREND_WEIGHT):
+        self.decay = math.log(2) / halflife
+        self.trend_weight = trend_weight
+        self.trends = {}
+        self.loaded = False
+        self._pending = []   # (scheduled_ts, id, content_type, text)
+        self._ready = []     # (приоритет рубрики, scheduled_ts, id, content_type, text)
+        self._news = []      # (-ранг, id, content_type, темы) - всё, что нужно фильтрам каналов
+        self._topic_sets = {}
+        self._taken = []     # (куча, элемент), снятые последним pop - для unpop
+        self.stats = {'pops': 0, 'stale': 0, 'deferred': 0, 'deferral_limit': 0, 'filtered': 0, 'rebuild_ms': 0.0}
+    
+    def __len__(self):
+        return len(self._pending) + len(self._ready) + len(self._news)
+    
+    def scheduled_count(self):
+        return len(self._pending) + len(self._ready)
+    
+    def news_rank(self, priority, added_ts, tags):
+        """Ранг новости - больше значит раньше"""
+        weight = max(DEFAULT_PRIORITY + 1 - (priority or DEFAULT_PRIORITY), 1)
+        trend = max((self.trends.get(tag, 0) for tag in tags.split(' ')), default=0) if tags else 0
+        return math.log(weight) + self.trend_weight * math.log1p(max(trend, 0)) + (added_ts or 0) * self.decay
+    
+    def topic_set(self, topics):
+        """Темы из колонки news.topics; одинаковые наборы делят один frozenset"""
+        topics = topics or ''
+        if topics not in self._topic_sets:
+            self._topic_sets[topics] = frozenset(topics.split(',')) if topics else frozenset()
+        return self._topic_sets[topics]
+    
+    def load(self, conn):
+        """Сборка куч из базы: непубликованные рубрики и представители кластеров"""
+        started = time.perf_counter()
+        now = int(time.time())
+        # Бонус тренда - по последнему срабатыванию радара в пределах окна
+        self.trends = dict(conn.execute('''
+            SELECT topic, MAX(zscore) FROM trend_data
+            WHERE detected_ts = (SELECT MAX(detected_ts) FROM trend_data) AND detected_ts >= ?
+            GROUP BY topic
+        ''', (now - TREND_WINDOW_HOURS * 3600,)).fetchall())
+        
+        self._pending = [tuple(row) for row in conn.execute(
+            "SELECT COALESCE(scheduled_ts, 0), id, content_type, content_text FROM content_queue WHERE posted = 0")]
+        heapq.heapify(self._pending)
+        self._ready = []
+        # Новости до миграции 14 без тем - разбираем заголовок один раз и сохраняем
+        conn.executemany("UPDATE news SET topics = ? WHERE id = ?", [
+            (','.join(dict.fromkeys(term_matcher.analyze(title)['topic'])), news_id) for news_id, title in conn.execute(
+                "SELECT id, COALESCE(title_original, title) FROM news WHERE topics IS NULL AND posted = 0 AND duplicate_of IS NULL")])
+        self._topic_sets = {}
+        self._news = [(-self.news_rank(priority, added_ts, tags), news_id, content_type, self.topic_set(topics))
+                      for news_id, priority, added_ts, tags, content_type, topics in conn.execute(
+                          "SELECT id, priority, added_ts, tags, content_type, topics FROM news WHERE posted = 0 AND duplicate_of IS NULL")]
+        heapq.heapify(self._news)
+        self._taken = []
+        self.loaded = True
+        self.stats['rebuild_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    
+    def set_trends(self, trends):
+        """Z-score текущих трендов по темам - для новостей, добавленных дальше"""
+        self.trends = dict(trends)
+    
+    def push_scheduled(self, row_id, content_type, text, scheduled_ts):
+        # До первой сборки строка и так попадёт в кучу из базы
+        if self.loaded:
+            heapq.heappush(self._pending, (scheduled_ts, row_id, content_type, text))
+    
+    def push_news(self, news_id, priority, added_ts, tags, content_type, topics):
+        if self.loaded:
+            heapq.heappush(self._news, (-self.news_rank(priority, added_ts, tags), news_id, content_type, self.topic_set(topics)))
+    
+    def pop(self, conn, now=None, accept=None, news=True):
+        """(вид, текст или строка news, тип контента) следующего элемента, с отметкой posted.
+        
+        accept(тип контента, темы) решает судьбу новости по данным из кучи, без запросов:
+        True - публикуем, None - подходящим каналам пока рано (новость остаётся в куче,
+        берём следующую, но не больше QUEUE_MAX_DEFERRED за выбор), False - не нужна
+        ни одному каналу (снимаем с очереди без публикации). news=False - только рубрики.
+        """
+        if not self.loaded:
+            self.load(conn)
+        now = int(time.time()) if now is None else now
+        self._taken = []
+        
+        while self._pending and self._pending[0][0] <= now:
+            scheduled_ts, row_id, content_type, text = heapq.heappop(self._pending)
+            heapq.heappush(self._ready, (SCHEDULED_PRIORITY.get(content_type, DEFAULT_SCHEDULED_PRIORITY),
+                                         scheduled_ts, row_id, content_type, text))
+        
+        while self._ready:
+            entry = heapq.heappop(self._ready)
+            self._taken.append((self._ready, entry))
+            if conn.execute("UPDATE content_queue SET posted = 1 WHERE id = ? AND posted = 0", (entry[2],)).rowcount:
+                self.stats['pops'] += 1
+                return ('scheduled', entry[4], entry[3])
+            self.stats['stale'] += 1
+        
+        deferred = []
+        try:
+            while news and self._news:
+                entry = heapq.heappop(self._news)
+                verdict = accept(entry[2], entry[3]) if accept else True
+                if verdict is None:
+                    deferred.append(entry)
+                    self.stats['deferred'] += 1
+                    if len(deferred) >= QUEUE_MAX_DEFERRED:
+                        # Готовым каналам нужны не верхние новости - ждём cadence остальных
+                        self.stats['deferral_limit'] += 1
+                        break
+                    continue
+                # Строка читается одним запросом с отметкой posted и только для снятой новости
+                rows = conn.execute("UPDATE news SET posted = 1 WHERE id = ? AND posted = 0 AND duplicate_of IS NULL RETURNING *",
+                                    (entry[1],)).fetchall()
+                if not rows:
+                    self.stats['stale'] += 1
+                    continue
+                news_content = rows[0]
+                self._taken.append((self._news, entry))
+                # Публикуется один представитель, весь кластер считается опубликованным
+                conn.execute("UPDATE news SET posted = 1 WHERE duplicate_of = ? AND posted = 0", (entry[1],))
+                daily_aggregates.add_posted(conn, news_content['added_ts'])
+                if not verdict:
+                    self.stats['filtered'] += 1
+                    continue
+                self.stats['pops'] += 1
+                return ('news', news_content, entry[2])
+        finally:
+            for entry in deferred:
+                heapq.heappush(self._news, entry)
+        
+        return None
+    
+    def unpop(self):
+        """Возврат элементов, снятых последним pop, если транзакция откатилась"""
+        for heap, entry in self._taken:
+            heapq.heappush(heap, entry)
+        self._taken = []
+
+publish_queue = PublishQueue()
+
+def queue_content(conn, content_type, text, scheduled_ts=None):
+    """Рубрика или алерт в content_queue и сразу в кучу publish_queue, возвращает id"""
+    scheduled_ts = int(time.time()) if scheduled_ts is None else scheduled_ts
+    # scheduled_time - для совместимости, в UTC как CURRENT_TIMESTAMP
+    row_id = conn.execute('''
+        INSERT INTO content_queue (content_type, content_text, scheduled_time, scheduled_ts)
+        VALUES (?, ?, ?, ?)
+    ''', (content_type, text, time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(scheduled_ts)), scheduled_ts)).lastrowid
+    publish_queue.push_scheduled(row_id, content_type, text, scheduled_ts)
+    return row_id
+
+@metrics_registry.timed('get_next_content_seconds', 'Выбор следующего поста с отметкой posted')
 def get_next_content():
     """Получаем следующий контент для публикации"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Сначала рубрики по расписанию
-    cursor.execute('''
-        SELECT * FROM content_queue 
-        WHERE posted = FALSE AND scheduled_time <= datetime('now')
-        ORDER BY scheduled_time ASC
-        LIMIT 1
-    ''')
-    
-    scheduled_content = cursor.fetchone()
-    
-    if scheduled_content:
-        cursor.execute("UPDATE content_queue SET posted = TRUE WHERE id = ?", (scheduled_content[0],))
-        conn.commit()
-        conn.close()
-        return ('scheduled', scheduled_content[2], scheduled_content[1])
-    
-    # Потом обычные новости
-    cursor.execute('''
-        SELECT * FROM news 
-        WHERE posted = FALSE 
-        ORDER BY 
-            CASE content_type
-                WHEN 'breaking' THEN 1
-                WHEN 'warning' THEN 2  
-                WHEN 'analysis' THEN 3
-                ELSE 4
-            END,
-            added_date ASC
-        LIMIT 1
-    ''')
-    
-    news_content = cursor.fetchone()
-    
-    if news_content:
-        cursor.execute("UPDATE news SET posted = TRUE WHERE id = ?", (news_content[0],))
-        conn.commit()
-        conn.close()
-        return ('news', format_news_post(news_content), news_content[6])
-    
-    conn.close()
-    return None
+    # Выбор и отметка posted - одной транзакцией писателя
+    content = db.transaction(pick_next_content)
+    if content and content[0] == 'news':
+        return ('news', format_news_post(content[1]), content[2])
+    return content
 
-def format_news_post(news_item):
+def pick_next_content(conn, accept=None, news=True):
+    """(вид, текст или строка news, тип контента) следующего элемента очереди"""
+    # Рубрики к сроку раньше новостей; если отметка posted не прошла - элемент возвращается в кучу
+    try:
+        return publish_queue.pop(conn, accept=accept, news=news)
+    except Exception:
+        publish_queue.unpop()
+        raise
+
+def format_news_post(news_item, title=None, templates=CONTENT_TEMPLATES, compact=False):
     """Форматируем пост новости - ЧИСТЫЙ И КРАСИВЫЙ ВИД"""
-    title = news_item[1]
+    title = title or news_item[1]
     clean_summary = news_item[3]
     source = news_item[4]
     content_type = news_item[8]
     
     # Используем шаблоны оформления
-    template = CONTENT_TEMPLATES.get(content_type, "📰 {content}")
+    template = templates.get(content_type, "📰 {content}")
     
     content = template.format(content=title)
     
     # Добавляем чистое первое предложение если есть
-    if clean_summary and len(clean_summary) > 20:
+    if not compact and clean_summary and len(clean_summary) > 20:
         content += f"\n\n{clean_summary}"
     
     # Ссылка на статью (будет показывать превью с картинкой)
@@ -573,107 +3215,616 @@ def format_news_post(news_item):
     # Источник
     content += f"\n\n📚 {source.upper()}"
     
-    # Хештеги
+    # Хештеги (у старых записей тем нет - ищем по заголовку)
+    tags = news_item['tags']
+    tags = tags.split(' ') if tags is not None else term_matcher.tags(term_matcher.analyze(title))
     content += f"\n\n#{content_type}"
-    if 'jasmy' in title.lower():
-        content += " #jasmy"
-    if 'bitcoin' in title.lower():
-        content += " #bitcoin"
-    if 'ethereum' in title.lower():
-        content += " #ethereum"
+    for tag in tags:
+        content += f" #{tag.replace(' ', '')}"
     
     return content
 
-async def send_to_channel(content):
-    """Отправляем контент в канал"""
-    try:
-        bot = Bot(token=BOT_TOKEN)
-        
-        print(f"📤 Публикую: {content[1][:80]}...")
+# Готовые тексты новостей по (id, язык, стиль) - общие для всех каналов варианта
+RENDER_CACHE = OrderedDict()
+RENDER_STATS = {'hits': 0, 'renders': 0}
+
+def render_news(news_item, lang, style):
+    """Текст новости для варианта канала: перевод заголовка из кэша переводчика, шаблон языка"""
+    key = (news_item['id'], lang, style)
+    if key in RENDER_CACHE:
+        RENDER_CACHE.move_to_end(key)
+        RENDER_STATS['hits'] += 1
+        return RENDER_CACHE[key]
+    
+    title = news_item['title']
+    original = news_item['title_original']
+    if lang != DEFAULT_LANGUAGE and original:
+        # Переводы на языки каналов сделаны при ингестии; если нет - оригинал
+        title = translator.cached(original, lang) or original
+    templates = CONTENT_TEMPLATES if lang == DEFAULT_LANGUAGE else CONTENT_TEMPLATES_EN
+    text = format_news_post(news_item, title, templates, compact=style == 'compact')
+    
+    RENDER_STATS['renders'] += 1
+    RENDER_CACHE[key] = text
+    if len(RENDER_CACHE) > RENDER_CACHE_SIZE:
+        RENDER_CACHE.popitem(last=False)
+    return text
+
+@metrics_registry.timed('enqueue_next_content_seconds', 'Выбор поста и запись в outbox каналов')
+def enqueue_next_content(channels=None):
+    """Следующий элемент очереди - в outbox подходящих каналов, одной транзакцией с отметкой posted"""
+    channels = CHANNELS if channels is None else channels
+    now = int(time.time())
+    
+    def accept(content_type, topics):
+        # Новость снимается с очереди, только если её сейчас возьмёт хоть один канал;
+        # пока все подходящие каналы ждут cadence, она остаётся в куче
+        wanting = [channel for channel in channels if channel.wants('news', content_type, topics)]
+        if not wanting:
+            return False
+        return True if any(channel.ready(now) for channel in wanting) else None
+    
+    def enqueue(conn, content):
+        kind, payload, content_type = content
+        topics = publish_queue.topic_set(payload['topics']) if kind == 'news' else frozenset()
         
-        await bot.send_message(
-            chat_id=CHANNEL_ID,
-            text=content[1]
-        )
+        rows = []
+        for channel in channels:
+            if not channel.accepts(kind, content_type, topics, now):
+                continue
+            if kind == 'news':
+                text = render_news(payload, *channel.variant)
+                channel.last_news_ts = now
+            else:
+                text = payload
+            rows.append((channel.chat_id, content_type, text, now, now))
         
-        # Обновляем статистику
+        conn.executemany('''
+            INSERT INTO outbox (chat_id, content_type, text, next_attempt_ts, created_ts)
+            VALUES (?, ?, ?, ?, ?)
+        ''', rows)
+        return content
+    
+    def pick_and_enqueue(conn):
+        # Ни один канал не готов к новости - не перебираем кучу впустую
+        content = pick_next_content(conn, accept, news=any(channel.ready(now) for channel in channels))
+        if not content:
+            return None
+        try:
+            return enqueue(conn, content)
+        except Exception:
+            # Откат транзакции - элемент снова в куче
+            publish_queue.unpop()
+            raise
+    
+    return db.transaction(pick_and_enqueue)
+
+# ==================== TELEGRAM DELIVERY ====================
+
+# Один Bot и его пул HTTP-соединений на процесс; при запуске бота - application.bot
+telegram_bot = None
+
+def get_bot():
+    """Общий экземпляр Bot"""
+    global telegram_bot
+    if telegram_bot is None:
+        telegram_bot = Bot(token=BOT_TOKEN, base_url=TELEGRAM_BASE_URL,
+                           request=HTTPXRequest(connection_pool_size=8))
+    return telegram_bot
+
+class TokenBucket:
+    """Ведро токенов: rate в секунду, не больше capacity подряд; pause() - флуд-контроль Telegram"""
+    
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+    
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+    
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+TELEGRAM_MESSAGES = metrics_registry.counter('telegram_messages_total', 'Попытки доставки по итогу', ['status'])
+
+class Outbox:
+    """Доставка сообщений из таблицы outbox с учётом лимитов Telegram.
+    
+    Строка забирается в статус sending, после ответа API становится sent,
+    при RetryAfter возвращается в pending на указанное время, при сетевых
+    ошибках - с экспоненциальной паузой, после DELIVERY_MAX_ATTEMPTS - failed.
+    Каналы обслуживаются параллельно, сообщения одного канала - по порядку.
+    """
+    
+    def __init__(self, chat_rate=DELIVERY_CHAT_RATE, chat_burst=DELIVERY_CHAT_BURST,
+                 global_rate=DELIVERY_GLOBAL_RATE, max_attempts=DELIVERY_MAX_ATTEMPTS):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_attempts = max_attempts
+        self.global_bucket = TokenBucket(global_rate, max(1, int(global_rate)))
+        self.chat_buckets = {}
+        self._wake = asyncio.Event()
+        self.stats = {'sent': 0, 'retry_after': 0, 'retries': 0, 'failed': 0}
+    
+    def bucket(self, chat_id):
+        if chat_id not in self.chat_buckets:
+            self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return self.chat_buckets[chat_id]
+    
+    def notify(self):
+        """Разбудить доставку после постановки сообщений в outbox"""
+        self._wake.set()
+    
+    @staticmethod
+    def recover(conn):
+        # Строки, зависшие в sending при падении процесса, отправляем заново
+        return conn.execute("UPDATE outbox SET status = 'pending' WHERE status = 'sending'").rowcount
+    
+    @staticmethod
+    def claim(conn, now, limit):
+        # Сообщение канала не обгоняет более раннее, которое ждёт повтора
+        rows = conn.execute('''
+            SELECT id, chat_id, content_type, text, attempts FROM outbox AS o
+            WHERE status = 'pending' AND next_attempt_ts <= ?
+              AND NOT EXISTS (
+                  SELECT 1 FROM outbox AS h
+                  WHERE h.status = 'pending' AND h.chat_id = o.chat_id AND h.id < o.id AND h.next_attempt_ts > ?
+              )
+            ORDER BY id
+            LIMIT ?
+        ''', (now, now, limit)).fetchall()
+        conn.executemany("UPDATE outbox SET status = 'sending' WHERE id = ?", [(row['id'],) for row in rows])
+        return rows
+    
+    def _finish(self, row, message):
+        now = int(time.time())
         today = datetime.now().strftime('%Y-%m-%d')
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT OR REPLACE INTO stats (date, posts_count)
-            VALUES (?, COALESCE((SELECT posts_count FROM stats WHERE date = ?), 0) + 1)
-        ''', (today, today))
-        
-        if content[0] == 'trend':
-            cursor.execute('''
-                INSERT OR REPLACE INTO stats (date, trends_detected)
-                VALUES (?, COALESCE((SELECT trends_detected FROM stats WHERE date = ?), 0) + 1)
-            ''', (today, today))
-        
-        conn.commit()
-        conn.close()
         
-        print("✅ УСПЕШНО опубликовано!")
-        return True
+        def save(conn):
+            conn.execute("UPDATE outbox SET status = 'sent', sent_ts = ?, message_id = ?, attempts = attempts + 1 WHERE id = ?",
+                         (now, message.message_id, row['id']))
+            # UPSERT не затирает соседний счётчик, в отличие от INSERT OR REPLACE
+            conn.execute('''
+                INSERT INTO stats (date, posts_count) VALUES (?, 1)
+                ON CONFLICT(date) DO UPDATE SET posts_count = posts_count + 1
+            ''', (today,))
+            
+            if row['content_type'] == 'trend_alert':
+                conn.execute('''
+                    INSERT INTO stats (date, trends_detected) VALUES (?, 1)
+                    ON CONFLICT(date) DO UPDATE SET trends_detected = trends_detected + 1
+                ''', (today,))
+        
+        db.transaction(save)
+    
+    def _retry(self, row, delay, error, count_attempt=True):
+        attempts = row['attempts'] + (1 if count_attempt else 0)
+        status = 'failed' if attempts >= self.max_attempts else 'pending'
+        db.execute("UPDATE outbox SET status = ?, attempts = ?, next_attempt_ts = ?, last_error = ? WHERE id = ?",
+                   (status, attempts, int(time.time() + delay), str(error)[:500], row['id']))
+        return status
+    
+    @metrics_registry.timed('telegram_send_seconds', 'Вызов send_message Bot API')
+    async def send(self, row):
+        return await get_bot().send_message(chat_id=row['chat_id'], text=row['text'])
+    
+    async def deliver(self, row):
+        """Одна попытка доставки; возвращает итоговый статус строки"""
+        bucket = self.bucket(row['chat_id'])
+        await bucket.acquire()
+        await self.global_bucket.acquire()
+        try:
+            message = await self.send(row)
+        except RetryAfter as e:
+            # Флуд-контроль не считаем неудачной попыткой: канал просто ждёт
+            self.stats['retry_after'] += 1
+            TELEGRAM_MESSAGES.labels('retry_after').inc()
+            bucket.pause(e.retry_after)
+            logger.warning(f"⏳ Telegram просит подождать {e.retry_after}с ({row['chat_id']})",
+                           extra={'event': 'retry_after', 'chat_id': row['chat_id'], 'seconds': e.retry_after})
+            return await run_blocking(self._retry, row, e.retry_after, e, False)
+        except (BadRequest, Forbidden) as e:
+            # Повтор не поможет: неверный текст, канал или права
+            self.stats['failed'] += 1
+            TELEGRAM_MESSAGES.labels('rejected').inc()
+            logger.error(f"❌ Сообщение {row['id']} отклонено: {e}", extra={'event': 'send_rejected', 'outbox_id': row['id']})
+            await run_blocking(db.execute, "UPDATE outbox SET status = 'failed', attempts = attempts + 1, last_error = ? WHERE id = ?",
+                               (str(e)[:500], row['id']))
+            return 'failed'
+        except (NetworkError, TelegramError) as e:
+            self.stats['retries'] += 1
+            delay = min(DELIVERY_MAX_BACKOFF_SECONDS, DELIVERY_BACKOFF_SECONDS * 2 ** row['attempts'])
+            status = await run_blocking(self._retry, row, delay * random.uniform(0.8, 1.2), e)
+            if status == 'failed':
+                self.stats['failed'] += 1
+            TELEGRAM_MESSAGES.labels('error').inc()
+            logger.warning(f"⚠️ Ошибка отправки {row['id']}: {e}, статус {status}",
+                           extra={'event': 'send_error', 'outbox_id': row['id'], 'status': status})
+            return status
         
-    except Exception as e:
-        print(f"❌ Ошибка отправки: {e}")
-        return False
+        await run_blocking(self._finish, row, message)
+        self.stats['sent'] += 1
+        TELEGRAM_MESSAGES.labels('sent').inc()
+        logger.info(f"✅ Опубликовано в {row['chat_id']}: {row['text'][:60]}...",
+                    extra={'event': 'sent', 'chat_id': row['chat_id'], 'outbox_id': row['id']})
+        return 'sent'
+    
+    async def _deliver_chat(self, rows):
+        for i, row in enumerate(rows):
+            status = await self.deliver(row)
+            if status == 'pending':
+                # Сообщение ждёт повтора - остальное вернём в очередь за ним
+                await run_blocking(db.executemany, "UPDATE outbox SET status = 'pending' WHERE id = ?",
+                                   [(r['id'],) for r in rows[i + 1:]])
+                return
+    
+    async def run(self, idle=5):
+        """Цикл доставки: забираем созревшие строки, каналы шлём параллельно"""
+        await run_blocking(db.transaction, self.recover)
+        while True:
+            self._wake.clear()
+            rows = await run_blocking(db.transaction, lambda conn: self.claim(conn, int(time.time()), DELIVERY_BATCH))
+            if not rows:
+                next_ts = await run_blocking(db.scalar, "SELECT MIN(next_attempt_ts) FROM outbox WHERE status = 'pending'")
+                timeout = min(idle, max(0.05, next_ts - time.time())) if next_ts else idle
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            
+            by_chat = {}
+            for row in rows:
+                by_chat.setdefault(row['chat_id'], []).append(row)
+            await asyncio.gather(*(self._deliver_chat(chat_rows) for chat_rows in by_chat.values()))
+    
+    def summary(self):
+        """Состояние outbox для /stats"""
+        counts = dict(db.fetchall("SELECT status, COUNT(*) FROM outbox GROUP BY status"))
+        hour = db.count("SELECT COUNT(*) FROM outbox WHERE status = 'sent' AND sent_ts >= ?", (int(time.time()) - 3600,))
+        return counts, hour
 
-# ==================== AUTOMATION SYSTEM ====================
+outbox = Outbox()
+
+# ==================== RETENTION ====================
+
+# Итоги обслуживания базы: последний прогон и накопленные
+RETENTION_STATS = {'runs': 0, 'last_seconds': 0.0, 'archived': 0, 'rolled_up': 0, 'deleted': 0, 'vacuumed_pages': 0}
+
+def purge(table, where, params=()):
+    """Удаление по условию пачками по RETENTION_BATCH строк.
+    
+    Каждая пачка - отдельная короткая транзакция писателя, между ними проходят
+    остальные записи бота. Возвращает число удалённых строк.
+    """
+    total = 0
+    while True:
+        deleted = db.transaction(lambda conn: conn.execute(f'''
+            DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} WHERE {where} LIMIT {RETENTION_BATCH})
+        ''', params).rowcount)
+        total += deleted
+        if deleted < RETENTION_BATCH:
+            return total
+
+def archive_news_batch(cutoff):
+    """Пачка новостей старше cutoff - в архив news-ГГГГ-ММ.jsonl.gz и из базы; id удалённых.
+    
+    Сначала запись в архив, потом удаление: после сбоя между ними строки попадут
+    в архив повторно (при чтении архива дубликаты отсекаются по id), но не потеряются.
+    """
+    rows = db.fetchall("SELECT * FROM news WHERE added_ts < ? ORDER BY added_ts LIMIT ?", (cutoff, RETENTION_BATCH))
+    if not rows:
+        return []
+    
+    by_month = {}
+    for row in rows:
+        by_month.setdefault(time.strftime('%Y-%m', time.gmtime(row['added_ts'])), []).append(dict(row))
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    for month, items in by_month.items():
+        # Дозапись в gzip - новый member в том же файле, gzip/zcat читают его целиком;
+        # уровень 6 (умолчание zlib) в 2-3 раза быстрее 9-го при размере на ~5% больше
+        with gzip.open(os.path.join(ARCHIVE_DIR, f'news-{month}.jsonl.gz'), 'at', compresslevel=6, encoding='utf-8') as f:
+            f.writelines(json.dumps(item, ensure_ascii=False) + '\n' for item in items)
+    
+    ids = [row['id'] for row in rows]
+    placeholders = ','.join('?' * len(ids))
+    now = int(time.time())
+    tombstones = [(row['link_hash'] if row['link_hash'] is not None else link_hash(row['link']), now) for row in rows]
+    
+    def delete(conn):
+        conn.executemany("INSERT OR IGNORE INTO archived_links (link_hash, archived_ts) VALUES (?, ?)", tombstones)
+        conn.execute(f"DELETE FROM story_signatures WHERE cluster_id IN ({placeholders})", ids)
+        conn.execute(f"DELETE FROM news WHERE id IN ({placeholders})", ids)
+        conn.execute("UPDATE counters SET value = value + ? WHERE name = 'news_archived'", (len(ids),))
+    
+    db.transaction(delete)
+    return ids
 
-def auto_poster_worker():
-    """Умная система авто-постинга"""
-    async def auto_poster():
-        print("🤖 Запускаю PREMIUM-постинг...")
+def rollup_trends(cutoff):
+    """Сырые строки trend_data за полные сутки старше cutoff - в trend_daily, по дню за транзакцию"""
+    cutoff = cutoff // 86400 * 86400
+    rolled = 0
+    while True:
+        oldest = db.scalar("SELECT MIN(detected_ts) FROM trend_data")
+        if oldest is None or oldest >= cutoff:
+            return rolled
+        day_end = oldest // 86400 * 86400 + 86400
         
-        # Счетчики для разных типов контента
-        news_counter = 0
-        trend_counter = 0
+        def rollup(conn):
+            conn.execute('''
+                INSERT INTO trend_daily (date, topic, detections, max_score, max_velocity, max_zscore)
+                SELECT date(detected_ts, 'unixepoch'), topic, COUNT(*), MAX(score), MAX(velocity), MAX(zscore)
+                FROM trend_data WHERE detected_ts < ? GROUP BY 1, 2
+                ON CONFLICT(date, topic) DO UPDATE SET
+                    detections = detections + excluded.detections,
+                    max_score = MAX(max_score, excluded.max_score),
+                    max_velocity = MAX(max_velocity, excluded.max_velocity),
+                    max_zscore = MAX(max_zscore, excluded.max_zscore)
+            ''', (day_end,))
+            return conn.execute("DELETE FROM trend_data WHERE detected_ts < ?", (day_end,)).rowcount
         
+        rolled += db.transaction(rollup)
+
+def vacuum_step(pages=RETENTION_VACUUM_PAGES):
+    """Возвращаем ОС до pages свободных страниц; базу без auto_vacuum один раз переводим VACUUM"""
+    def step(conn):
+        # Только через писателя: читатели держат режим auto_vacuum, прочитанный при подключении
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            logger.info("🧹 Перевожу базу на auto_vacuum=INCREMENTAL (разовый VACUUM)...")
+            # До этого в транзакции не было DML - BEGIN не открыт, VACUUM допустим
+            conn.executescript("PRAGMA auto_vacuum=INCREMENTAL; VACUUM;")
+            return 0
+        before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        # executescript проходит прагму до конца; execute освободил бы одну страницу
+        conn.executescript(f"PRAGMA incremental_vacuum({int(pages)})")
+        return before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+    
+    return db.transaction(step)
+
+async def run_retention():
+    """Обслуживание базы: архив старых новостей, свёртка трендов, удаление по TTL и incremental_vacuum"""
+    started = time.monotonic()
+    now = int(time.time())
+    
+    archived = 0
+    while True:
+        ids = await run_blocking(archive_news_batch, now - NEWS_RETENTION_DAYS * 86400)
+        if ids:
+            # Индекс историй меняется только под замком ингестии
+            async with INGEST_LOCK:
+                for news_id in ids:
+                    story_index.remove(news_id)
+        archived += len(ids)
+        if len(ids) < RETENTION_BATCH:
+            break
+    if archived and publish_queue.loaded:
+        # Архивные новости уходят и из кучи публикации
+        await run_blocking(db.transaction, publish_queue.load)
+    
+    rolled = await run_blocking(rollup_trends, now - TREND_RETENTION_DAYS * 86400)
+    deleted = sum([
+        await run_blocking(purge, 'content_queue', 'posted = 1 AND scheduled_ts < ?', (now - QUEUE_RETENTION_DAYS * 86400,)),
+        await run_blocking(purge, 'outbox', "status IN ('sent', 'failed') AND created_ts < ?", (now - OUTBOX_RETENTION_DAYS * 86400,)),
+        await run_blocking(purge, 'translations', 'created_at < ?', (now - TRANSLATION_TTL_DAYS * 86400,)),
+        # Через ещё NEWS_RETENTION_DAYS ссылки из лент давно ушли, а high-water mark отсекает старые записи
+        await run_blocking(purge, 'archived_links', 'archived_ts < ?', (now - NEWS_RETENTION_DAYS * 86400,)),
+    ])
+    pages = await run_blocking(vacuum_step)
+    await run_blocking(market_history.prune, MARKET_HISTORY_DAYS)
+    
+    RETENTION_STATS['runs'] += 1
+    RETENTION_STATS['last_seconds'] = round(time.monotonic() - started, 2)
+    RETENTION_STATS['archived'] += archived
+    RETENTION_STATS['rolled_up'] += rolled
+    RETENTION_STATS['deleted'] += deleted
+    RETENTION_STATS['vacuumed_pages'] += pages
+    if archived or rolled or deleted or pages:
+        logger.info(f"🧹 Хранение: в архив {archived} новостей, свёрнуто {rolled} трендов, удалено {deleted} строк, "
+                    f"освобождено {pages} страниц за {RETENTION_STATS['last_seconds']}с",
+                    extra={'event': 'retention', 'archived': archived, 'rolled_up': rolled, 'deleted': deleted,
+                           'pages': pages, 'seconds': RETENTION_STATS['last_seconds']})
+
+# ==================== AUTOMATION SYSTEM ====================
+
+class Job:
+    """Задача планировщика: интервальная (every секунд) или ежедневная (at 'ЧЧ:ММ' местного времени)"""
+    
+    def __init__(self, name, func, every=None, at=None, grace=SCHEDULE_MISFIRE_GRACE):
+        self.name = name
+        self.func = func
+        self.every = every
+        self.at = at
+        self.grace = grace
+        self.running = False
+        self.stats = {'runs': 0, 'errors': 0, 'skipped': 0, 'last_run': None,
+                      'last_seconds': 0.0, 'last_lateness': 0.0, 'max_lateness': 0.0, 'next_run': None}
+    
+    def next_after(self, ts):
+        """Ближайшее время запуска строго после ts"""
+        if self.every:
+            return ts + self.every
+        hour, minute = map(int, self.at.split(':'))
+        moment = datetime.fromtimestamp(ts).replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if moment.timestamp() <= ts:
+            moment += timedelta(days=1)
+        return moment.timestamp()
+
+SCHEDULER_JOB_SECONDS = metrics_registry.histogram('scheduler_job_seconds', 'Длительность задач планировщика', ['job'])
+
+class Scheduler:
+    """Асинхронный планировщик на куче: спит до ближайшей задачи, задачи идут параллельно.
+    
+    Медленный скан трендов не задерживает публикацию: каждый запуск - отдельная
+    asyncio-задача, а повторный запуск ещё работающей задачи пропускается.
+    Синхронные функции уходят в BLOCKING_POOL.
+    """
+    
+    def __init__(self):
+        self.jobs = {}
+        self._heap = []
+        self._seq = 0
+        self._wake = asyncio.Event()
+        self._tasks = set()
+    
+    def _push(self, job, due):
+        job.stats['next_run'] = due
+        self._seq += 1
+        heapq.heappush(self._heap, (due, self._seq, job))
+        self._wake.set()
+    
+    def every(self, name, seconds, func, first=0):
+        """Интервальная задача; первый запуск через first секунд"""
+        job = self.jobs[name] = Job(name, func, every=seconds)
+        self._push(job, time.time() + first)
+        return job
+    
+    def daily(self, name, at, func, last_run=None):
+        """Ежедневная задача; если слот после last_run пропущен в пределах grace - запуск сразу"""
+        job = self.jobs[name] = Job(name, func, at=at)
+        now = time.time()
+        due = job.next_after(last_run) if last_run else job.next_after(now)
+        if due < now - job.grace:
+            job.stats['skipped'] += 1
+            due = job.next_after(now)
+        self._push(job, due)
+        return job
+    
+    async def _execute(self, job, due):
+        started = time.time()
+        lateness = max(0.0, started - due)
+        job.running = True
+        try:
+            if asyncio.iscoroutinefunction(job.func):
+                await job.func()
+            else:
+                await run_blocking(job.func)
+            if job.at:
+                await run_blocking(db.execute, "INSERT OR REPLACE INTO scheduler_jobs (name, last_run_ts) VALUES (?, ?)",
+                                   (job.name, int(due)))
+        except Exception as e:
+            job.stats['errors'] += 1
+            logger.error(f"💥 Ошибка задачи {job.name}: {e}", extra={'event': 'job_error', 'job': job.name})
+        finally:
+            job.running = False
+            stats = job.stats
+            stats['runs'] += 1
+            stats['last_run'] = started
+            stats['last_seconds'] = round(time.time() - started, 2)
+            stats['last_lateness'] = round(lateness, 2)
+            SCHEDULER_JOB_SECONDS.labels(job.name).observe(time.time() - started)
+            stats['max_lateness'] = max(stats['max_lateness'], stats['last_lateness'])
+    
+    def _reschedule(self, job, due, now):
+        # Пропущенные интервалы не копятся: следующий запуск - первый слот в будущем
+        following = job.next_after(due)
+        if following <= now:
+            following = job.next_after(now) if job.at else now + job.every - (now - due) % job.every
+        self._push(job, following)
+    
+    async def run(self):
+        """Главный цикл: ждём ближайшую задачу или добавление новой"""
         while True:
-            try:
-                current_time = datetime.now().strftime('%H:%M:%S')
-                print(f"\n🔄 {current_time} - Работаю...")
-                
-                # Trend Radar каждые 2 часа
-                if trend_counter % 120 == 0:  # 120 минут = 2 часа
-                    print("📡 Запуск Trend Radar...")
-                    trends = analyze_trends()
-                    trend_counter = 0
-                
-                # Генерация рубрик по расписанию
-                generate_daily_content()
-                
-                # Парсинг новостей каждые 10 циклов (~10 минут)
-                if news_counter % 10 == 0:
-                    print("🔍 Поиск новостей...")
-                    parse_news()
-                
-                # Публикация контента
-                print("📤 Проверка очереди публикации...")
-                next_content = get_next_content()
-                
-                if next_content:
-                    success = await send_to_channel(next_content)
-                    if not success:
-                        print("⚠️ Ошибка публикации")
-                else:
-                    print("📭 Нет контента для публикации")
-                
-                news_counter += 1
-                trend_counter += 1
-                print("⏳ Жду 60 секунд...")
-                await asyncio.sleep(60)
-                
-            except Exception as e:
-                print(f"💥 Ошибка: {e}")
-                await asyncio.sleep(30)
-    
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    loop.run_until_complete(auto_poster())
+            self._wake.clear()
+            now = time.time()
+            if not self._heap or self._heap[0][0] > now:
+                timeout = self._heap[0][0] - now if self._heap else None
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            
+            due, _, job = heapq.heappop(self._heap)
+            if job.running:
+                job.stats['skipped'] += 1
+                logger.warning(f"⏭️ {job.name} ещё выполняется, запуск пропущен", extra={'event': 'job_skipped', 'job': job.name})
+            elif now - due > job.grace:
+                job.stats['skipped'] += 1
+                logger.warning(f"⏭️ {job.name} опоздал на {now - due:.0f}с, запуск пропущен",
+                               extra={'event': 'job_skipped', 'job': job.name, 'lateness': round(now - due, 1)})
+            else:
+                task = asyncio.create_task(self._execute(job, due))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            self._reschedule(job, due, now)
+    
+    def summary(self):
+        """Строки для /stats: запуски, длительность и опоздание задач"""
+        lines = []
+        for job in sorted(self.jobs.values(), key=lambda j: j.stats['next_run'] or 0):
+            stats = job.stats
+            next_in = max(0, int((stats['next_run'] or 0) - time.time()))
+            lines.append(f"• {job.name}: {stats['runs']} запусков, {stats['last_seconds']}с, "
+                         f"опоздание {stats['last_lateness']}с (макс {stats['max_lateness']}с), "
+                         f"через {next_in // 60} мин")
+        return lines
+
+scheduler = Scheduler()
+
+async def publish_next():
+    """Следующий элемент очереди - в outbox всех каналов"""
+    next_content = await run_blocking(enqueue_next_content)
+    if next_content:
+        outbox.notify()
+
+def setup_schedule(scheduler):
+    """Задачи бота: ингестия, тренды, публикация и рубрики DAILY_SCHEDULE"""
+    # Ленты опрашиваются по своим интервалам, задача только проверяет, кому пора
+    scheduler.every('news', SOURCE_CHECK_SECONDS, parse_news)
+    scheduler.every('trends', TREND_INTERVAL_SECONDS, analyze_trends)
+    scheduler.every('publish', PUBLISH_INTERVAL_SECONDS, publish_next, first=5)
+    scheduler.every('retention', RETENTION_INTERVAL_SECONDS, run_retention, first=60)
+    scheduler.every('market', MARKET_SNAPSHOT_SECONDS, record_market_snapshot, first=10)
+    
+    last_runs = dict(db.fetchall("SELECT name, last_run_ts FROM scheduler_jobs"))
+    for slot, schedule in DAILY_SCHEDULE.items():
+        name = f"{schedule['type']} {slot}"
+        scheduler.daily(name, slot, lambda slot=slot: generate_daily_content(slot), last_runs.get(name))
+        # Подготовка текста заранее, без догона: пропущенную рубрику слот сгенерирует сам
+        scheduler.daily(f"prerender {slot}", prerender_slot(slot), lambda slot=slot: render_rubric(slot))
+
+# Фоновые задачи в event loop бота: планировщик и поток цен
+background_tasks = []
+
+async def start_background(application):
+    """post_init: общий Bot приложения и фоновые задачи в том же event loop"""
+    global telegram_bot
+    telegram_bot = application.bot
+    logger.info("🤖 Запускаю PREMIUM-постинг...")
+    
+    # Очередь публикации собирается из базы до первой задачи
+    await run_blocking(db.transaction, publish_queue.load)
+    setup_schedule(scheduler)
+    background_tasks.append(asyncio.create_task(scheduler.run()))
+    background_tasks.append(asyncio.create_task(outbox.run()))
+    if PRICE_STREAM_ENABLED:
+        background_tasks.append(asyncio.create_task(price_stream.run()))
+    if METRICS_PORT and metrics_registry.enabled:
+        background_tasks.append(asyncio.create_task(serve_metrics()))
+
+async def stop_background(application):
+    """post_stop: останавливаем фоновые задачи до закрытия Bot"""
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    # Фильтр ссылок на диск - следующий старт дочитает только новые строки
+    if link_filter.loaded:
+        await run_blocking(link_filter.save)
 
 # ==================== ADMIN COMMANDS ====================
 
@@ -698,37 +3849,45 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     await update.message.reply_text(menu_text)
 
-async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT COUNT(*) FROM news")
-    total_news = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT COUNT(*) FROM news WHERE posted = TRUE")
-    posted_news = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT COUNT(*) FROM trend_data WHERE date(detected_date) = date('now')")
-    today_trends = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT COUNT(*) FROM content_queue WHERE posted = FALSE")
-    queued_content = cursor.fetchone()[0]
-    
+def read_stats_counts():
+    """Счётчики для /stats - из таблицы counters (ведут триггеры) и индексов, без полных сканов"""
     today = datetime.now().strftime('%Y-%m-%d')
-    cursor.execute("SELECT posts_count, trends_detected FROM stats WHERE date = ?", (today,))
-    today_stats = cursor.fetchone()
+    counters = dict(db.fetchall("SELECT name, value FROM counters"))
+    return (
+        counters,
+        daily_aggregates.snapshot()[1],
+        db.fetchone("SELECT posts_count, trends_detected FROM stats WHERE date = ?", (today,)),
+        db.scalar("PRAGMA page_count") * db.scalar("PRAGMA page_size"),
+    )
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    counters, today_trends, today_stats, db_size = await run_blocking(read_stats_counts)
     
     if today_stats:
         today_posts, trends_detected = today_stats
     else:
         today_posts, trends_detected = 0, 0
     
+    cache = FEED_CACHE_STATS
+    ingest = INGEST_STATS
+    links = link_filter.stats
+    retention = RETENTION_STATS
+    market = market_data.stats
+    stream = price_stream.stats
+    outbox_counts, sent_hour = await run_blocking(outbox.summary)
+    # Список сегментов истории - чтение каталога, тоже не в event loop
+    history_days = await run_blocking(market_history.days)
+    sources = "\n".join(source_summary())
+    rubrics = "\n".join(rubric_summary())
+    latency = "\n".join(metrics_registry.latency_summary()) if metrics_registry.enabled else "• Метрики выключены (METRICS_ENABLED=0)"
+    
     stats_text = f"""📊 PREMIUM СТАТИСТИКА
 
 📈 Контент:
-• Всего новостей: {total_news}
-• Опубликовано: {posted_news}
-• В очереди: {queued_content}
+• Всего новостей: {counters.get('news', 0)} (в архиве {counters.get('news_archived', 0)})
+• Опубликовано: {counters.get('news_posted', 0)}
+• В очереди: {counters.get('queue_pending', 0)}
+• Очередь публикации: {len(publish_queue)} (рубрик {publish_queue.scheduled_count()}), выбрано {publish_queue.stats['pops']}, пропущено устаревших {publish_queue.stats['stale']}, сборка {publish_queue.stats['rebuild_ms']} мс
 
 🎯 Активность:
 • Постов сегодня: {today_posts}
@@ -738,27 +3897,63 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 ⚡ Система:
 • Trend Radar: Активен
 • Рубрики: 4/день
-• Перевод: Google API"""
+• Перевод: {translator.backend.name}, кэш {translator.hit_rate():.0%}
+
+📥 Ингестия:
+• Циклов: {ingest['cycles']}, последний: +{ingest['last_new']} новостей, {ingest['last_duplicates']} дубликатов за {ingest['last_seconds']}с
+• Всего: {ingest['total_new']} новостей, {ingest['total_duplicates']} дубликатов
+• Фильтр ссылок: {link_filter.count} ссылок, {link_filter.bits.nbytes // 1024} КБ, без запроса в базу {links['skipped']}/{links['checked']}, ложных {links['false_positives']}
+
+🛰 Источники ({len(NEWS_SOURCES)}):
+{sources}
+
+🌐 Кэш лент:
+• Попаданий: {cache['hits']} (+{cache['revalidated']} по 304)
+• Загрузок: {cache['misses']}, ошибок: {cache['errors']}
+• Скачано: {cache['bytes_downloaded'] // 1024} КБ, сэкономлено: {cache['bytes_saved'] // 1024} КБ
+
+💹 Binance:
+• Пар: {len(market_data.symbols)}, запросов: {market['requests']}, из кэша: {market['hits']}, ошибок: {market['errors']}
+• Поток цен: {stream['messages']} сообщений, подключений {stream['connects']}, алертов {stream['alerts']}
+• История: {len(history_days)} дней, {len(market_history.symbols)} пар, снимков {market_history.stats['snapshots']}
+
+📬 Доставка ({len(CHANNELS)} каналов, языков: {len(channel_languages())}):
+• Отправлено за час: {sent_hour}, ожидают: {outbox_counts.get('pending', 0)}, ошибок: {outbox_counts.get('failed', 0)}
+• Повторов: {outbox.stats['retries']}, флуд-контроль: {outbox.stats['retry_after']}
+• Рендер: {RENDER_STATS['renders']} текстов, из кэша {RENDER_STATS['hits']}
+
+🗞 Рубрики (готовятся за {RUBRIC_PRERENDER_SECONDS // 60} мин до слота):
+{rubrics}
+
+🧹 Хранение:
+• База: {db_size / 2**20:.1f} МБ, проходов {retention['runs']}, в архив {retention['archived']} новостей
+• Свёрнуто трендов: {retention['rolled_up']}, удалено строк: {retention['deleted']}, освобождено страниц: {retention['vacuumed_pages']}
+
+⏱ Задержки (p50/p99 с запуска):
+{latency or '• Пока нет замеров'}
+
+⏱ Планировщик:
+""" + "\n".join(scheduler.summary())
     
-    conn.close()
     await update.message.reply_text(stats_text)
 
 async def news_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("🔍 Запускаю поиск новостей...")
-    success = parse_news()
-    if success:
-        await update.message.reply_text("✅ Найдены новые новости! Будут опубликованы в течение 10 минут.")
+    found = await parse_news(due_only=False)
+    if found:
+        await update.message.reply_text(f"✅ Найдено новых новостей: {found}. Поставлены в очередь публикации.")
     else:
         await update.message.reply_text("📭 Новых новостей не найдено")
 
 async def trends_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("📡 Запускаю Trend Radar...")
-    trends = analyze_trends()
+    trends = await analyze_trends()
     
     if trends:
         response = "🎯 ОБНАРУЖЕННЫЕ ТРЕНДЫ:\n\n"
-        for topic, score in list(trends.items())[:5]:
-            response += f"• {topic.upper()}: {score} упоминаний\n"
+        top = sorted(trends.items(), key=lambda item: item[1]['zscore'], reverse=True)[:5]
+        for topic, metrics in top:
+            response += f"• {topic.upper()}: {metrics['velocity']:g} упоминаний/час, z={metrics['zscore']:.1f}\n"
         response += "\n📊 Будет опубликовано в канале"
     else:
         response = "📭 Значимых трендов не обнаружено"
@@ -766,8 +3961,15 @@ async def trends_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(response)
 
 async def generate_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # /generate 13:00 - конкретный слот, без аргумента - последний наступивший
+    now = datetime.now().strftime('%H:%M')
+    slot = context.args[0] if context.args else max((t for t in DAILY_SCHEDULE if t <= now), default=max(DAILY_SCHEDULE))
+    if slot not in DAILY_SCHEDULE:
+        await update.message.reply_text(f"❓ Нет такого слота. Доступны: {', '.join(DAILY_SCHEDULE)}")
+        return
+    
     await update.message.reply_text("🎨 Генерирую контент...")
-    generate_daily_content()
+    await run_blocking(generate_daily_content, slot)
     await update.message.reply_text("✅ Контент сгенерирован! Проверьте очередь публикации.")
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -792,20 +3994,24 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # ==================== LAUNCH ====================
 
 def main():
-    print("🎯 ЗАПУСК PREMIUM CRYPTO NEWS BOT В ОБЛАКЕ...")
-    print("🤖 Активирую премиум-фичи:")
-    print("   ✅ Профессиональный перевод (Google API)")
-    print("   ✅ Trend Radar система")
-    print("   ✅ 4 ежедневные рубрики") 
-    print("   ✅ Чистые и красивые посты")
-    print("   ✅ Контент-стратегия 1/10мин")
-    
-    # Запускаем авто-постер
-    poster_thread = threading.Thread(target=auto_poster_worker, daemon=True)
-    poster_thread.start()
-    
-    # Запускаем бота команд
-    application = Application.builder().token(BOT_TOKEN).build()
+    logger.info("🎯 ЗАПУСК PREMIUM CRYPTO NEWS BOT В ОБЛАКЕ...")
+    logger.info("🤖 Активирую премиум-фичи:")
+    logger.info("   ✅ Профессиональный перевод (Google API)")
+    logger.info("   ✅ Trend Radar система")
+    logger.info("   ✅ 4 ежедневные рубрики") 
+    logger.info("   ✅ Чистые и красивые посты")
+    logger.info("   ✅ Контент-стратегия 1/10мин")
+    
+    # Бот команд, планировщик и поток цен - в одном event loop
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .base_url(TELEGRAM_BASE_URL)
+        .connection_pool_size(8)
+        .post_init(start_background)
+        .post_stop(stop_background)
+        .build()
+    )
     
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("stats", stats_command))
@@ -814,8 +4020,8 @@ def main():
     application.add_handler(CommandHandler("generate", generate_command))
     application.add_handler(CommandHandler("help", help_command))
     
-    print("✅ PREMIUM BOT ЗАПУЩЕН В ОБЛАКЕ!")
-    print("🚀 Ожидайте контент в канале...")
+    logger.info("✅ PREMIUM BOT ЗАПУЩЕН В ОБЛАКЕ!")
+    logger.info("🚀 Ожидайте контент в канале...")
     
     application.run_polling()
 
@@ -0,0 +1,188 @@
+"""Поведение outbox доставки и миграций схемы на временной базе.
+
+Запуск: python -m pytest -q
+"""
+import asyncio
+import importlib
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+# Бот читает пути из окружения при импорте - база и файлы во временной папке
+TEST_DIR = tempfile.mkdtemp(prefix='cryptobot-test-')
+os.environ['DB_PATH'] = os.path.join(TEST_DIR, 'test.db')
+os.environ['LINK_FILTER_PATH'] = os.path.join(TEST_DIR, 'test.db.links.npz')
+os.environ['MARKET_HISTORY_DIR'] = os.path.join(TEST_DIR, 'market')
+os.environ['ARCHIVE_DIR'] = os.path.join(TEST_DIR, 'archive')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+bot = importlib.import_module('deepseek_python_20251121_342097')
+
+# ==================== OUTBOX ====================
+
+@pytest.fixture
+def outbox():
+    bot.db.execute("DELETE FROM outbox")
+    bot.db.execute("DELETE FROM stats")
+    # Без пауз лимитов: проверяем переходы статусов, а не темп
+    return bot.Outbox(chat_rate=1000, chat_burst=1000, global_rate=1000, max_attempts=2)
+
+def enqueue(*chat_ids, next_attempt_ts=0):
+    now = int(time.time())
+    bot.db.executemany('''
+        INSERT INTO outbox (chat_id, content_type, text, next_attempt_ts, created_ts)
+        VALUES (?, 'regular', ?, ?, ?)
+    ''', [(chat_id, f'message {i}', next_attempt_ts, now) for i, chat_id in enumerate(chat_ids)])
+
+def claim(limit=100):
+    return bot.db.transaction(lambda conn: bot.Outbox.claim(conn, int(time.time()), limit))
+
+def row(outbox_id):
+    return bot.db.fetchone("SELECT * FROM outbox WHERE id = ?", (outbox_id,))
+
+def deliver(outbox, claimed, send):
+    async def fake_send(_row):
+        return send()
+    outbox.send = fake_send
+    return asyncio.run(outbox.deliver(claimed))
+
+def raise_(error):
+    def send():
+        raise error
+    return send
+
+def test_claim_marks_rows_sending(outbox):
+    enqueue('-1', '-2')
+    rows = claim()
+    assert [r['chat_id'] for r in rows] == ['-1', '-2']
+    assert bot.db.count("SELECT COUNT(*) FROM outbox WHERE status = 'sending'") == 2
+    # Забранные строки второй раз не выдаются
+    assert claim() == []
+
+def test_sent(outbox):
+    enqueue('-1')
+    claimed, = claim()
+    assert deliver(outbox, claimed, lambda: SimpleNamespace(message_id=42)) == 'sent'
+    saved = row(claimed['id'])
+    assert (saved['status'], saved['message_id'], saved['attempts']) == ('sent', 42, 1)
+    assert saved['sent_ts'] is not None
+    assert bot.db.scalar("SELECT posts_count FROM stats") == 1
+
+def test_retry_after_returns_to_pending_without_attempt(outbox):
+    enqueue('-1')
+    claimed, = claim()
+    before = int(time.time())
+    assert deliver(outbox, claimed, raise_(RetryAfter(30))) == 'pending'
+    saved = row(claimed['id'])
+    assert (saved['status'], saved['attempts']) == ('pending', 0)
+    assert saved['next_attempt_ts'] >= before + 30
+    assert outbox.stats['retry_after'] == 1
+    # До срока строка не созревает
+    assert claim() == []
+
+def test_network_errors_fail_after_max_attempts(outbox):
+    enqueue('-1')
+    claimed, = claim()
+    assert deliver(outbox, claimed, raise_(NetworkError('timeout'))) == 'pending'
+    assert row(claimed['id'])['attempts'] == 1
+    bot.db.execute("UPDATE outbox SET next_attempt_ts = 0")
+    claimed, = claim()
+    assert deliver(outbox, claimed, raise_(NetworkError('timeout'))) == 'failed'
+    saved = row(claimed['id'])
+    assert (saved['status'], saved['attempts'], saved['last_error']) == ('failed', 2, 'timeout')
+
+def test_bad_request_fails_at_once(outbox):
+    enqueue('-1')
+    claimed, = claim()
+    assert deliver(outbox, claimed, raise_(BadRequest('chat not found'))) == 'failed'
+    assert row(claimed['id'])['status'] == 'failed'
+
+def test_retry_keeps_channel_order(outbox):
+    enqueue('-1', '-1', '-2')
+    # Первая строка канала -1 ждёт повтора: вторая созрела, но её очередь - после повтора
+    bot.db.execute("UPDATE outbox SET next_attempt_ts = ? WHERE id = (SELECT MIN(id) FROM outbox)", (int(time.time()) + 60,))
+    assert [r['chat_id'] for r in claim()] == ['-2']
+
+def test_recover_requeues_rows_stuck_in_sending(outbox):
+    enqueue('-1', '-1', '-2')
+    claimed = claim()
+    # Процесс упал между claim и ответом API
+    assert bot.db.transaction(bot.Outbox.recover) == 3
+    assert bot.db.count("SELECT COUNT(*) FROM outbox WHERE status = 'pending'") == 3
+    assert [r['id'] for r in claim()] == [r['id'] for r in claimed]
+
+# ==================== MIGRATIONS ====================
+
+@pytest.fixture
+def baseline_db():
+    """База в том виде, как её оставляла версия до миграций: исходные таблицы, user_version = 0"""
+    conn = sqlite3.connect(os.path.join(tempfile.mkdtemp(dir=TEST_DIR), 'baseline.db'))
+    bot.migrate_initial_schema(conn)
+    conn.executemany('''
+        INSERT INTO news (title, link, summary, source, posted, added_date, content_type)
+        VALUES (?, ?, '', 'cointelegraph', ?, '2025-11-20 10:00:00', ?)
+    ''', [('Bitcoin ETF inflows hit record', 'https://example.com/1', False, 'breaking'),
+          ('Solana staking update', 'https://example.com/2', None, 'regular'),
+          ('Old posted story', 'https://example.com/3', True, 'regular')])
+    conn.execute("INSERT INTO content_queue (content_type, content_text, scheduled_time) "
+                 "VALUES ('hot_topic', 'rubric', '2025-11-20 12:00:00')")
+    conn.execute("INSERT INTO trend_data (topic, score, velocity, detected_date) VALUES ('bitcoin', 5, 1, '2025-11-20 10:00:00')")
+    conn.commit()
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 0
+    yield conn
+    conn.close()
+
+def columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+def test_migrations_upgrade_baseline_database(baseline_db):
+    with baseline_db:
+        version = bot.apply_migrations(baseline_db)
+    assert version == bot.MIGRATIONS[-1][0]
+
+    assert {'priority', 'added_ts', 'tags', 'duplicate_of', 'title_original', 'link_hash', 'topics'} <= columns(baseline_db, 'news')
+    assert {'high_water_ts', 'poll_interval', 'backlog'} <= columns(baseline_db, 'sources')
+    tables = {row[0] for row in baseline_db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {'outbox', 'scheduler_jobs', 'story_signatures', 'counters', 'trend_daily', 'archived_links'} <= tables
+
+    # Старые строки переносятся: приоритет по типу, UTC-метки, posted без NULL, хэш ссылки
+    news = baseline_db.execute("SELECT link, priority, added_ts, posted, link_hash FROM news ORDER BY id").fetchall()
+    assert [n[1] for n in news] == [bot.CONTENT_PRIORITY['breaking'], bot.DEFAULT_PRIORITY, bot.DEFAULT_PRIORITY]
+    assert all(n[2] == 1763632800 for n in news)
+    assert [n[3] for n in news] == [0, 0, 1]
+    assert all(n[4] == bot.link_hash(n[0]) for n in news)
+    assert baseline_db.execute("SELECT scheduled_ts FROM content_queue").fetchone()[0] is not None
+    assert baseline_db.execute("SELECT detected_ts FROM trend_data").fetchone()[0] == 1763632800
+    assert dict(baseline_db.execute("SELECT name, value FROM counters WHERE name IN ('news', 'news_posted')")) == \
+        {'news': 3, 'news_posted': 1}
+
+def test_migrations_are_idempotent(baseline_db):
+    with baseline_db:
+        version = bot.apply_migrations(baseline_db)
+    with baseline_db:
+        assert bot.apply_migrations(baseline_db) == version
+    assert baseline_db.execute("SELECT COUNT(*) FROM news").fetchone()[0] == 3
+
+def test_migrations_stop_at_target(baseline_db):
+    with baseline_db:
+        assert bot.apply_migrations(baseline_db, target=4) == 4
+    assert 'tags' in columns(baseline_db, 'news')
+    assert 'duplicate_of' not in columns(baseline_db, 'news')
+
+def test_publish_queue_loads_migrated_database(baseline_db):
+    with baseline_db:
+        bot.apply_migrations(baseline_db)
+        queue = bot.PublishQueue()
+        queue.load(baseline_db)
+    # Непубликованные новости без тем получают их при первой сборке очереди
+    assert len(queue._news) == 2
+    assert dict(baseline_db.execute("SELECT link, topics FROM news WHERE posted = 0")) == {
+        'https://example.com/1': 'bitcoin,etf',
+        'https://example.com/2': 'solana,staking',
+    }